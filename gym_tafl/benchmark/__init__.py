@@ -0,0 +1,2 @@
+from gym_tafl.benchmark.perft import check_perft, load_perft_counts, perft, perft_divide
+from gym_tafl.benchmark.throughput import METRICS, compare_reports, load_report, run_benchmark, save_report
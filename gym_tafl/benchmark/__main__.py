@@ -0,0 +1,45 @@
+import argparse
+import sys
+
+from gym_tafl.benchmark.throughput import *
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m gym_tafl.benchmark',
+                                     description='Measure the perft counts and the throughput of the game engines')
+    parser.add_argument('--variant', nargs='+', default=['tablut', 'custom'], help='variants to measure')
+    parser.add_argument('--backend', nargs='+', default=list(ENGINE_BACKENDS), choices=list(ENGINE_BACKENDS),
+                        help='game engine backends to measure')
+    parser.add_argument('--depth', type=int, default=3, help='perft depth')
+    parser.add_argument('--games', type=int, default=20, help='random games replayed by the engine measures')
+    parser.add_argument('--steps', type=int, default=2000, help='random environment steps')
+    parser.add_argument('--repeats', type=int, default=3, help='repetitions of each measure, the best one is kept')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random games')
+    parser.add_argument('--save', metavar='FILE', help='save the report as a baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare the report with a baseline')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='tolerated slowdown against the baseline, as a fraction')
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(variants=args.variant, backends=args.backend, depth=args.depth, n_games=args.games,
+                           n_steps=args.steps, repeats=args.repeats, seed=args.seed)
+    for variant, backends in report['results'].items():
+        print(f"{variant} perft({args.depth}) = {next(iter(backends.values()))['perft'][str(args.depth)]}")
+        print(f"  {'backend':<12}" + ''.join(f'{metric:>26}' for metric in METRICS))
+        for backend, result in backends.items():
+            print(f'  {backend:<12}' + ''.join(f'{result[metric]:>26.0f}' for metric in METRICS))
+    failed = False
+    for mismatch in report['mismatches']:
+        print(f'MISMATCH {mismatch}')
+        failed = True
+    if args.compare:
+        for regression in compare_reports(report, load_report(args.compare), args.threshold):
+            print(f'REGRESSION {regression}')
+            failed = True
+    if args.save:
+        save_report(report, args.save)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+import json
+import os
+from typing import Dict, List
+
+import numpy as np
+
+from gym_tafl.envs._engines import ENGINE_BACKENDS, make_game_engine
+from gym_tafl.envs._game_engine import GameEngine
+from gym_tafl.envs.configs import *
+
+# reference node counts from the start positions, by variant and depth
+PERFT_COUNTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'perft_counts.json')
+
+
+def _perft(engine: GameEngine, board: np.array, player: int, depth: int) -> int:
+    actions = engine.legal_moves(board, player)
+    if depth == 1:
+        return len(actions)
+    opponent = ATK if player == DEF else DEF
+    nodes = 0
+    for action in actions:
+        undo, game_over = engine.make_move(board, engine.action_moves[action])
+        # the positions where the game is over are leaves
+        if not game_over:
+            nodes += _perft(engine, board, opponent, depth - 1)
+        engine.unmake_move(board, undo)
+    return nodes
+
+
+def perft(engine: GameEngine, depth: int, board: np.array = None, player: int = None) -> int:
+    """
+    Count the positions reached after `depth` moves, expanding every legal move except the ones ending the game by
+    king escape or capture. The draw rules never apply within the depths perft can reach.
+
+    :param engine: The game engine
+    :param depth: The number of moves
+    :param board: The starting board, the variant starting board if None
+    :param player: The player to move, the variant starting player if None
+    :return: The number of leaf positions
+    """
+    if board is None:
+        board = np.zeros((engine.n_rows, engine.n_cols))
+        engine.fill_board(board)
+    else:
+        board = board.copy()
+    player = engine.STARTING_PLAYER if player is None else player
+    engine.sync(board, player)
+    if depth == 0:
+        return 1
+    return _perft(engine, board, player, depth)
+
+
+def perft_divide(engine: GameEngine, depth: int, board: np.array = None, player: int = None) -> Dict[int, int]:
+    """
+    Split the perft count by first move, to find where two engines disagree
+
+    :param engine: The game engine
+    :param depth: The number of moves, at least 1
+    :param board: The starting board, the variant starting board if None
+    :param player: The player to move, the variant starting player if None
+    :return: The number of leaf positions after each first action
+    """
+    assert depth >= 1, f"[ERR: perft_divide] Invalid depth {depth}"
+    if board is None:
+        board = np.zeros((engine.n_rows, engine.n_cols))
+        engine.fill_board(board)
+    else:
+        board = board.copy()
+    player = engine.STARTING_PLAYER if player is None else player
+    engine.sync(board, player)
+    opponent = ATK if player == DEF else DEF
+    counts = {}
+    for action in engine.legal_moves(board, player):
+        undo, game_over = engine.make_move(board, engine.action_moves[action])
+        if depth == 1:
+            counts[action] = 1
+        else:
+            counts[action] = 0 if game_over else _perft(engine, board, opponent, depth - 1)
+        engine.unmake_move(board, undo)
+    return counts
+
+
+def load_perft_counts() -> Dict[str, Dict[str, int]]:
+    """
+    Load the reference perft counts
+
+    :return: The node count of each depth (as a string), by variant
+    """
+    with open(PERFT_COUNTS_FILE) as f:
+        return json.load(f)
+
+
+def check_perft(variant: str, max_depth: int, backends: List[str] = None) -> Dict[str, Dict[int, int]]:
+    """
+    Compute the perft counts of the variant with each backend and check them against each other and the reference counts
+
+    :param variant: The variant name
+    :param max_depth: The maximum depth
+    :param backends: The backends to check, all of them if None
+    :return: The counts of each depth, by backend
+    """
+    reference = load_perft_counts().get(variant, {})
+    results = {}
+    for backend in backends or list(ENGINE_BACKENDS):
+        engine = make_game_engine(variant, backend)
+        results[backend] = {d: perft(engine, d) for d in range(1, max_depth + 1)}
+        for d, nodes in results[backend].items():
+            expected = reference.get(str(d))
+            assert expected is None or nodes == expected, \
+                f"[ERR: check_perft] {variant} {backend} perft({d}) = {nodes}, expected {expected}"
+    first = next(iter(results.values()))
+    for backend, counts in results.items():
+        assert counts == first, f"[ERR: check_perft] {variant} backends disagree: {results}"
+    return results
@@ -0,0 +1,227 @@
+import json
+import platform
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from gym_tafl.benchmark.perft import load_perft_counts, perft
+from gym_tafl.envs._engines import ENGINE_BACKENDS, make_game_engine
+from gym_tafl.envs.configs import *
+from gym_tafl.envs.tafl_env import TaflEnv
+
+# bump when the measures change, the reports of different versions are not compared
+REPORT_VERSION = 2
+# throughput measures of a report, higher is better
+METRICS = ('perft_nodes_per_sec',
+           'legal_moves_per_sec',
+           'apply_move_per_sec',
+           'process_captures_per_sec',
+           'env_steps_per_sec')
+
+
+def record_games(variant: str, n_games: int, seed: int = 0) -> List[List[int]]:
+    """
+    Play random games, to be replayed by the engine measures. The games only depend on the variant and the seed.
+
+    :param variant: The variant name
+    :param n_games: The number of games
+    :param seed: The seed of the random actions
+    :return: The actions of each game
+    """
+    env = TaflEnv()
+    if variant != env.variant:
+        env.change_variant(variant)
+    env.seed(seed)
+    games = []
+    for _ in range(n_games):
+        env.reset()
+        actions = []
+        done = False
+        while not done:
+            action = env.random_action()
+            actions.append(action)
+            _, _, done, _ = env.step(action)
+        games.append(actions)
+    return games
+
+
+def measure_engine(variant: str, backend: str, games: List[List[int]], **engine_kwargs) -> Dict[str, float]:
+    """
+    Replay games on a new engine, timing each call to `legal_moves`, `apply_move` and `process_captures`. The captures
+    are timed on the position of every move before its captures are resolved (the moved piece on its destination and
+    the captured pieces still on the board), tracked by a separate game state synced outside of the timing.
+
+    :param variant: The variant name
+    :param backend: The game engine backend
+    :param games: The actions of each game
+    :param engine_kwargs: Additional game engine backend options
+    :return: The calls per second of each function
+    """
+    engine = make_game_engine(variant, backend, **engine_kwargs)
+    legal_time, apply_time, captures_time, n_calls = 0., 0., 0., 0
+    for actions in games:
+        board = np.zeros((engine.n_rows, engine.n_cols))
+        engine.fill_board(board)
+        player = engine.STARTING_PLAYER
+        engine.sync(board, player)
+        for action in actions:
+            move = engine.action_moves[action]
+            before = board.copy()
+            t0 = time.perf_counter()
+            engine.legal_moves(board, player)
+            t1 = time.perf_counter()
+            engine.apply_move(board, move)
+            t2 = time.perf_counter()
+            # put the captured pieces back, the squares changed by the move other than its origin and destination
+            position = board.copy()
+            captured = before != board
+            captured[move[0], move[1]] = captured[move[2], move[3]] = False
+            position[captured] = before[captured]
+            state = engine.new_state(position)
+            t3 = time.perf_counter()
+            engine.process_captures(position, (move[2], move[3]), state=state)
+            t4 = time.perf_counter()
+            legal_time += t1 - t0
+            apply_time += t2 - t1
+            captures_time += t4 - t3
+            n_calls += 1
+            player = ATK if player == DEF else DEF
+    return {
+        'legal_moves_per_sec': n_calls / legal_time,
+        'apply_move_per_sec': n_calls / apply_time,
+        'process_captures_per_sec': n_calls / captures_time
+    }
+
+
+def measure_env(variant: str, backend: str, n_steps: int, seed: int = 0, **engine_kwargs) -> float:
+    """
+    Play random games with `TaflEnv.step`, resetting the finished ones
+
+    :param variant: The variant name
+    :param backend: The game engine backend
+    :param n_steps: The number of steps
+    :param seed: The seed of the random actions
+    :param engine_kwargs: Additional game engine backend options
+    :return: The steps per second, resets included
+    """
+    env = TaflEnv(backend=backend, **engine_kwargs)
+    if variant != env.variant:
+        env.change_variant(variant)
+    env.seed(seed)
+    env.reset()
+    start = time.perf_counter()
+    for _ in range(n_steps):
+        _, _, done, _ = env.step(env.random_action())
+        if done:
+            env.reset()
+    return n_steps / (time.perf_counter() - start)
+
+
+def run_benchmark(variants: List[str] = ('tablut', 'custom'),
+                  backends: List[str] = None,
+                  depth: int = 3,
+                  n_games: int = 20,
+                  n_steps: int = 2000,
+                  repeats: int = 3,
+                  seed: int = 0) -> dict:
+    """
+    Measure the perft counts and the throughput of each backend on each variant. Every measure is repeated and the
+    best one is kept, the perft counts are checked against the reference ones and between the backends.
+
+    :param variants: The variants
+    :param backends: The game engine backends, all of them if None
+    :param depth: The perft depth
+    :param n_games: The number of random games replayed by the engine measures
+    :param n_steps: The number of environment steps
+    :param repeats: The number of repetitions of each measure
+    :param seed: The seed of the random games
+    :return: The report, with the results by variant and backend and the list of the perft mismatches
+    """
+    assert depth >= 1, f"[ERR: run_benchmark] Invalid perft depth {depth}"
+    reference = load_perft_counts()
+    report = {
+        'version': REPORT_VERSION,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'depth': depth,
+        'results': {},
+        'mismatches': []
+    }
+    for variant in variants:
+        games = record_games(variant, n_games, seed)
+        report['results'][variant] = {}
+        for backend in backends or list(ENGINE_BACKENDS):
+            engine = make_game_engine(variant, backend)
+            counts, elapsed = {}, 0.
+            for d in range(1, depth + 1):
+                start = time.perf_counter()
+                counts[str(d)] = perft(engine, d)
+                elapsed = time.perf_counter() - start
+            result = {'perft': counts, 'perft_nodes_per_sec': counts[str(depth)] / elapsed}
+            for _ in range(repeats):
+                for metric, rate in measure_engine(variant, backend, games).items():
+                    result[metric] = max(result.get(metric, 0.), rate)
+                result['env_steps_per_sec'] = max(result.get('env_steps_per_sec', 0.),
+                                                  measure_env(variant, backend, n_steps, seed))
+            for d, nodes in counts.items():
+                expected = reference.get(variant, {}).get(d)
+                if expected is not None and nodes != expected:
+                    report['mismatches'].append(f'{variant} {backend} perft({d}) = {nodes}, expected {expected}')
+            report['results'][variant][backend] = result
+        results = report['results'][variant]
+        first = next(iter(results))
+        for backend, result in results.items():
+            if result['perft'] != results[first]['perft']:
+                report['mismatches'].append(f"{variant} {backend} perft {result['perft']} differs from {first} "
+                                            f"perft {results[first]['perft']}")
+    return report
+
+
+def compare_reports(report: dict, baseline: dict, threshold: float = 0.1) -> List[str]:
+    """
+    Compare a report with a baseline, measured on the same machine
+
+    :param report: The new report
+    :param baseline: The baseline report
+    :param threshold: The tolerated slowdown, as a fraction of the baseline throughput
+    :return: The regressions: throughputs below the tolerance and different perft counts
+    """
+    assert report['version'] == baseline['version'], \
+        f"[ERR: compare_reports] Report version {report['version']} differs from baseline version {baseline['version']}"
+    regressions = []
+    for variant, backends in report['results'].items():
+        for backend, result in backends.items():
+            base = baseline['results'].get(variant, {}).get(backend)
+            if base is None:
+                continue
+            for d, nodes in result['perft'].items():
+                if d in base['perft'] and nodes != base['perft'][d]:
+                    regressions.append(f"{variant} {backend} perft({d}) = {nodes}, baseline {base['perft'][d]}")
+            for metric in METRICS:
+                if metric in base and result[metric] < base[metric] * (1 - threshold):
+                    regressions.append(f'{variant} {backend} {metric} = {result[metric]:.0f}, '
+                                       f'baseline {base[metric]:.0f} ({result[metric] / base[metric] - 1:+.1%})')
+    return regressions
+
+
+def save_report(report: dict, path: str):
+    """
+    Save a report, to be used as a baseline
+
+    :param report: The report
+    :param path: The JSON file path
+    """
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def load_report(path: str) -> dict:
+    """
+    Load a report saved with `save_report`
+
+    :param path: The JSON file path
+    :return: The report
+    """
+    with open(path) as f:
+        return json.load(f)
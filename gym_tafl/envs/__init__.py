@@ -1 +1,9 @@
 from gym_tafl.envs.tafl_env import TaflEnv
+from gym_tafl.envs.tafl_vec_env import TaflVecEnv
+from gym_tafl.envs.tafl_subproc_vec_env import TaflSubprocVecEnv
+from gym_tafl.envs._symmetry import BoardSymmetries, make_symmetries
+from gym_tafl.envs._utils import ActionCodec, make_action_codec
+from gym_tafl.envs._renderer import BoardRenderer, make_renderer, save_video, write_png
+from gym_tafl.envs._instrumentation import PerfStats
+from gym_tafl.envs._features import FeaturePlanes, make_static_planes
+from gym_tafl.envs._state import CompactGameState, GameState, pack_states, unpack_states
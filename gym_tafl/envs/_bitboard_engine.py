@@ -0,0 +1,399 @@
+from types import SimpleNamespace
+
+from gym_tafl.envs._game_engine import *
+
+
+def popcount(bb: int) -> int:
+    """
+    Count the number of set bits of a bitboard
+
+    :param bb: The bitboard
+    :return: The number of set bits
+    """
+    return bin(bb).count('1')
+
+
+def iter_bits(bb: int):
+    """
+    Iterate over the indexes of the set bits of a bitboard, from the lowest to the highest
+
+    :param bb: The bitboard
+    :return: A generator of bit indexes
+    """
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+class LineMoves(dict):
+    """
+    Moves of a piece on a square along one line of the board (its column or its row), by content of the line: the keys
+    are the occupied squares of the line as a bitboard, with the throne and corner tiles of the line shifted above the
+    squares of the board, the values the actions towards the two directions of the line. The moves of a line content
+    are computed the first time it is seen, so only the contents reached by the games are ever stored.
+    """
+
+    def __init__(self, rays: tuple, rule: int, is_king: bool, n_squares: int):
+        """
+        :param rays: The two rays of the line, as `(square, action, on_throne, on_corner)` targets limited by the
+            movement rules of the piece
+        :param rule: How the throne behaves for the piece, one of THRONE_LAND, THRONE_PASS or THRONE_BLOCK
+        :param is_king: Whether the piece is the king, the only one landing on the corners
+        :param n_squares: The number of squares of the board, the shift of the throne and corner tiles in the keys
+        """
+        super().__init__()
+        self.rays = rays
+        self.rule = rule
+        self.is_king = is_king
+        self.n_squares = n_squares
+
+    def __missing__(self, content: int) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+        moves = []
+        for ray in self.rays:
+            ray_moves = []
+            for t, action, on_throne, on_corner in ray:
+                if content >> t & 1:
+                    break
+                if content >> (t + self.n_squares) & 1:
+                    # throne or corner tile
+                    if on_throne and self.rule == THRONE_PASS:
+                        continue
+                    if not ((on_throne and self.rule == THRONE_LAND) or (on_corner and self.is_king)):
+                        break
+                ray_moves.append(action)
+            moves.append(tuple(ray_moves))
+        self[content] = moves = tuple(moves)
+        return moves
+
+
+@lru_cache(maxsize=None)
+def make_bitboard_tables(variant: str) -> dict:
+    """
+    Compute the static tables of the bitboard engine for a variant, once per process
+
+    :param variant: The variant name, or the path of a variant file
+    :return: The tables, by engine attribute name
+    """
+    rules = load_rules(variant)
+    tables = SimpleNamespace()
+    rows, cols = rules.n_rows, rules.n_cols
+    tables.n_squares = n_squares = rows * cols
+    tables.full_mask = (1 << n_squares) - 1
+
+    # static masks
+    tables.edge_mask = 0
+    tables.corner_mask = 0
+    for i in range(rows):
+        for j in range(cols):
+            if i == 0 or j == 0 or i == rows - 1 or j == cols - 1:
+                tables.edge_mask |= 1 << (i * cols + j)
+    for (i, j) in [(0, 0), (0, rows - 1), (cols - 1, rows - 1), (cols - 1, 0)]:
+        tables.corner_mask |= 1 << (i * cols + j)
+    tables.throne_sq = (rows // 2) * cols + cols // 2
+    tables.throne_mask = 1 << tables.throne_sq
+    tables.throne_zone_mask = tables.throne_mask
+
+    # for each square, the (bit, position) of its neighbours and the bit of the square behind them (0 if outside the
+    # board), and the mask of its neighbours
+    tables.capture_steps = [()] * n_squares
+    tables.nb_mask = [0] * n_squares
+    for i in range(rows):
+        for j in range(cols):
+            steps = []
+            for inc_i, inc_j in DIRECTIONS:
+                if 0 <= i + inc_i < rows and 0 <= j + inc_j < cols:
+                    bit2 = 1 << (i + 2 * inc_i) * cols + j + 2 * inc_j \
+                        if 0 <= i + 2 * inc_i < rows and 0 <= j + 2 * inc_j < cols else 0
+                    steps.append((1 << (i + inc_i) * cols + j + inc_j, bit2, (i + inc_i, j + inc_j)))
+            tables.capture_steps[i * cols + j] = tuple(steps)
+            tables.nb_mask[i * cols + j] = sum(bit1 for bit1, _, _ in steps)
+    tables.throne_zone_mask |= tables.nb_mask[tables.throne_sq]
+
+    # for each piece and square, the squares of its column (up and down) and row (right and left) rays, limited by the
+    # movement rules, with the moves along them by content of the line: the moves of a piece are then two lookups
+    tables.throne_rule = {p: throne_rule(rules, p) for p in PIECES}
+    up, right, down, left = range(len(DIRECTIONS))
+    tables.lines = {}
+    for p in PIECES:
+        limit = None if rules.unrestricted_movement else rules.m_counter[p]
+        lines = []
+        for square_rays in rules.rays:
+            rays = [ray[:limit] for ray in square_rays]
+            # the squares of the rays, and their throne and corner tiles
+            masks = [sum((1 | 1 << n_squares) << t for t, _, _, _ in ray) for ray in rays]
+            lines.append((masks[up] | masks[down],
+                          LineMoves((rays[up], rays[down]), tables.throne_rule[p], p == KING, n_squares),
+                          masks[right] | masks[left],
+                          LineMoves((rays[right], rays[left]), tables.throne_rule[p], p == KING, n_squares)))
+        tables.lines[p] = tuple(lines)
+    return vars(tables)
+
+
+class BitboardGameState(GameState):
+    """
+    Game state of the bitboard engine, with the occupancy bitboards of the tracked board by tile value
+    """
+    __slots__ = ('bb',)
+
+    def __init__(self, player: int = None):
+        super().__init__(player)
+        self.bb: Dict[int, int] = {KING: 0, DEFENDER: 0, ATTACKER: 0, THRONE: 0, CORNER: 0}
+
+    def copy(self) -> 'BitboardGameState':
+        state = super().copy()
+        state.bb = dict(self.bb)
+        return state
+
+
+class BitboardGameEngine(GameEngine):
+    """
+    Game engine backend that keeps the per-piece-type occupancy as integer bitboards, where the square `(i, j)` is the
+    bit `i * n_cols + j`.
+
+    The bitboards are kept in the game state, in sync with its tracked board; the board array is still updated in
+    place, so the engine is a drop-in replacement for `GameEngine`. If a board is modified outside the engine, call
+    `sync` before querying the engine again.
+    """
+    state_class = BitboardGameState
+
+    def __init__(self, variant: str):
+        super().__init__(variant)
+        self.__dict__.update(make_bitboard_tables(variant))
+
+    def sync(self, board: np.array, player: int = None, state: BitboardGameState = None):
+        if state is None:
+            state = self.state
+        super().sync(board, player, state=state)
+        flat = board.ravel()
+        for t in state.bb.keys():
+            bb = 0
+            for sq in np.flatnonzero(flat == t).tolist():
+                bb |= 1 << sq
+            state.bb[t] = bb
+
+    def snapshot(self, state: BitboardGameState = None) -> tuple:
+        if state is None:
+            state = self.state
+        return super().snapshot(state), dict(state.bb)
+
+    def restore(self, saved: tuple, state: BitboardGameState = None):
+        if state is None:
+            state = self.state
+        super().restore(saved[0], state)
+        state.bb = dict(saved[1])
+
+    def legal_moves(self, board: np.array, player: int, state: BitboardGameState = None):
+        assert player in [ATK, DEF], f"[ERR: legal_moves] Unrecognized player type: {player}"
+        bbs = self._track(board, state).bb
+        content = self._content(bbs)
+        if player == ATK:
+            pieces, king = bbs[ATTACKER], 0
+            lines = self.lines[ATTACKER]
+        else:
+            pieces, king = bbs[DEFENDER] | bbs[KING], bbs[KING]
+            lines = self.lines[DEFENDER]
+        moves = []
+        # the pieces in square order, and the moves of each piece in direction and distance order, are sorted
+        while pieces:
+            low = pieces & -pieces
+            pieces ^= low
+            sq = low.bit_length() - 1
+            col_mask, col_moves, row_mask, row_moves = self.lines[KING][sq] if low & king else lines[sq]
+            up, down = col_moves[content & col_mask]
+            right, left = row_moves[content & row_mask]
+            moves += up
+            moves += right
+            moves += down
+            moves += left
+        return moves
+
+    def has_legal_moves(self, board: np.array, player: int, state: BitboardGameState = None) -> bool:
+        """
+        Check if the player has at least one legal move, without generating them all
+
+        :param board: The current board
+        :param player: The player
+        :param state: The game state, the engine default one if None
+        :return: True if there is at least one legal move, False otherwise
+        """
+        assert player in [ATK, DEF], f"[ERR: has_legal_moves] Unrecognized player type: {player}"
+        bbs = self._track(board, state).bb
+        content = self._content(bbs)
+        for p in ((ATTACKER,) if player == ATK else (DEFENDER, KING)):
+            for sq in iter_bits(bbs[p]):
+                if any(self._piece_moves(content, p, sq)):
+                    return True
+        return False
+
+    def _legal_moves(self,
+                     board: np.array,
+                     piece: int,
+                     position: Tuple[int, int],
+                     state: BitboardGameState = None) -> List[int]:
+        bbs = self._track(board, state).bb
+        return [action for moves in self._piece_moves(self._content(bbs), piece, position[0] * self.n_cols + position[1])
+                for action in moves]
+
+    def _content(self, bbs: Dict[int, int]) -> int:
+        """
+        Compute the content of the board read by the moves tables: the occupied squares, and the throne and corner
+        tiles shifted above them
+
+        :param bbs: The bitboards of the board
+        :return: The content bitboard
+        """
+        return bbs[KING] | bbs[DEFENDER] | bbs[ATTACKER] | (bbs[THRONE] | bbs[CORNER]) << self.n_squares
+
+    def _piece_moves(self, content: int, piece: int, sq: int) -> Tuple[Tuple[int, ...], ...]:
+        """
+        Look up the moves of a piece in the moves tables of its column and row
+
+        :param content: The content of the board, see `_content`
+        :param piece: The piece
+        :param sq: The square of the piece
+        :return: The actions of the piece upwards, rightwards, downwards and leftwards
+        """
+        col_mask, col_moves, row_mask, row_moves = self.lines[piece][sq]
+        up, down = col_moves[content & col_mask]
+        right, left = row_moves[content & row_mask]
+        return up, right, down, left
+
+    def board_value(self, board: np.array, state: BitboardGameState = None) -> int:
+        bbs = self._track(board, state).bb
+        return sum(popcount(bbs[p]) * self.piece_reward[p] for p in PIECES)
+
+    def make_move(self, board: np.array, move: Tuple[int, int, int, int],
+                  state: BitboardGameState = None) -> Tuple[tuple, bool]:
+        state = self._track(board, state)
+        bbs = state.bb
+        fi, fj, ti, tj = move
+        cols = self.n_cols
+        f_sq, t_sq = fi * cols + fj, ti * cols + tj
+        f_bit, t_bit = 1 << f_sq, 1 << t_sq
+        # the tracked board is in sync with the bitboards, and faster to read a square from
+        piece, t_tile = int(board[fi, fj]), int(board[ti, tj])
+        if self.validate:
+            assert piece in PIECES, \
+                f"[ERR: make_move] Selected invalid piece: {position_as_str(position=(fi, fj), rows=board.shape[0])}"
+            assert t_tile not in PIECES, \
+                f"[ERR: make_move] Invalid destination: {position_as_str(position=(ti, tj), rows=board.shape[0])}"
+        counter, h = state.no_capture_turns_counter, state.hash
+        game_over = False
+        # update bitboards, board, piece and hash
+        keys = self.zobrist_keys
+        state.hash ^= keys[piece][f_sq] ^ keys[piece][t_sq]
+        if t_tile != EMPTY:
+            bbs[t_tile] &= ~t_bit
+            state.hash ^= keys[t_tile][t_sq]
+        bbs[piece] = (bbs[piece] & ~f_bit) | t_bit
+        board[ti, tj] = piece
+        if not self.no_throne and f_sq == self.throne_sq:
+            bbs[THRONE] |= f_bit
+            state.hash ^= keys[THRONE][f_sq]
+            board[fi, fj] = THRONE
+        else:
+            board[fi, fj] = EMPTY
+        # check if king has escaped
+        if piece == KING and self.edge_escape and t_bit & self.edge_mask:
+            game_over = True
+        elif piece == KING and (not self.edge_escape) and t_bit & self.corner_mask:
+            game_over = True
+        # process captures
+        to_remove = self.process_captures(board, (ti, tj), state)
+        if len(to_remove) == 0:
+            state.no_capture_turns_counter += 1
+        else:
+            state.no_capture_turns_counter = 0
+        captured = []
+        for (i, j) in to_remove:
+            sq = i * cols + j
+            p = int(board[i, j])
+            if p == KING:
+                game_over = True
+            captured.append((i, j, p))
+            state.piece_counts[p] -= 1
+            state.material -= self.piece_reward[p]
+            bbs[p] &= ~(1 << sq)
+            state.hash ^= keys[p][sq]
+            if sq == self.throne_sq:
+                bbs[THRONE] |= 1 << sq
+                state.hash ^= keys[THRONE][sq]
+                board[i, j] = THRONE
+            else:
+                board[i, j] = EMPTY
+        self._end_turn(state)
+        return (fi, fj, ti, tj, piece, t_tile, tuple(captured), counter, h), game_over
+
+    def unmake_move(self, board: np.array, undo: tuple, state: BitboardGameState = None):
+        if state is None:
+            state = self.state
+        bbs = state.bb
+        fi, fj, ti, tj, piece, t_tile, captured, _, _ = undo
+        cols = self.n_cols
+        f_sq, t_sq = fi * cols + fj, ti * cols + tj
+        for i, j, p in captured:
+            sq = i * cols + j
+            bbs[p] |= 1 << sq
+            if sq == self.throne_sq:
+                bbs[THRONE] &= ~(1 << sq)
+        if not self.no_throne and f_sq == self.throne_sq:
+            bbs[THRONE] &= ~(1 << f_sq)
+        bbs[piece] = (bbs[piece] & ~(1 << t_sq)) | (1 << f_sq)
+        if t_tile != EMPTY:
+            bbs[t_tile] |= 1 << t_sq
+        super().unmake_move(board, undo, state)
+
+    def process_captures(self, board: np.array, position: Tuple[int, int],
+                         state: BitboardGameState = None) -> List[Tuple[int, int]]:
+        bbs = self._track(board, state).bb
+        sq = position[0] * self.n_cols + position[1]
+        piece = int(board[position])
+        king, defenders, attackers, throne = bbs[KING], bbs[DEFENDER], bbs[ATTACKER], bbs[THRONE]
+        pieces = king | defenders | attackers
+        # the pieces that can be captured by the moving piece, and the pieces acting as the other side of the capture
+        if piece == ATTACKER:
+            victims, anvils = defenders, attackers
+        elif piece == DEFENDER:
+            victims = attackers
+            anvils = defenders | (king if self.armed_king or self.anvil_king else 0)
+        elif piece == KING and self.armed_king:
+            victims, anvils = attackers, defenders
+        else:
+            victims, anvils = 0, 0
+        zone_capture = self.king_captured_with_four_pieces or self.king_captured_with_two_pieces_except_near_or_on_throne
+        # the neighbours that can be captured, most moves capture nothing
+        candidates = victims | (king if piece == ATTACKER else 0) | \
+            (pieces & self.throne_zone_mask if zone_capture else 0)
+        if not self.nb_mask[sq] & candidates:
+            return []
+        captures = []
+        for bit1, bit2, position1 in self.capture_steps[sq]:
+            if not candidates & bit1:
+                continue
+            if victims & bit1:
+                # normal capture, or capture next to throne
+                if anvils & bit2 or (piece == ATTACKER and throne & bit2):
+                    captures.append(position1)
+            # capture king
+            elif piece == ATTACKER and king & bit1:
+                if self.king_captured_with_two_pieces or \
+                        (not self.throne_zone_mask & bit1 and self.king_captured_with_two_pieces_except_near_or_on_throne):
+                    if (attackers | throne) & bit2:
+                        captures.append(position1)
+            elif zone_capture:
+                # case 1: king is on the throne, need 4 pieces
+                # case 2: king is next to the throne, need 3 pieces
+                if self.throne_zone_mask & bit1 and self._count_threats(bbs, bit1.bit_length() - 1) == 4:
+                    captures.append(position1)
+        return captures
+
+    def _count_threats(self, bbs: Dict[int, int], sq: int) -> int:
+        threats = popcount(self.nb_mask[sq] & bbs[ATTACKER])
+        if self.king_captured_with_two_pieces_except_near_or_on_throne:
+            threats += popcount(self.nb_mask[sq] & bbs[THRONE])
+        return threats
+
+    def _check_king(self, board: np.array, position: Tuple[int, int], state: BitboardGameState = None) -> int:
+        bbs = self._track(board, state).bb
+        return self._count_threats(bbs, position[0] * self.n_cols + position[1])
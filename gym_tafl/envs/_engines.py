@@ -0,0 +1,22 @@
+from gym_tafl.envs._bitboard_engine import BitboardGameEngine
+from gym_tafl.envs._game_engine import GameEngine
+from gym_tafl.envs._incremental_engine import IncrementalGameEngine
+
+ENGINE_BACKENDS = {
+    'numpy': GameEngine,
+    'bitboard': BitboardGameEngine,
+    'incremental': IncrementalGameEngine
+}
+
+
+def make_game_engine(variant: str, backend: str = 'numpy', **kwargs) -> GameEngine:
+    """
+    Create the game engine for the variant using the selected backend
+
+    :param variant: The variant name
+    :param backend: The engine backend, one of `ENGINE_BACKENDS`
+    :param kwargs: Additional backend options
+    :return: The game engine
+    """
+    assert backend in ENGINE_BACKENDS, f"[ERR make_game_engine] Unknown engine backend {backend}"
+    return ENGINE_BACKENDS[backend](variant, **kwargs)
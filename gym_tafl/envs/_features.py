@@ -0,0 +1,182 @@
+from functools import lru_cache
+
+from gym_tafl.envs._rules import *
+
+# piece planes of a position, in order
+PIECE_PLANES = (KING, DEFENDER, ATTACKER)
+# normalization of the no capture turns counter, ending the game at 100 plies
+NO_CAPTURE_PLIES = 100
+
+
+@lru_cache(maxsize=None)
+def make_static_planes(variant: str) -> np.ndarray:
+    """
+    Get the planes of a variant that never change, computed once per process
+
+    :param variant: The variant name, or the path of a variant file
+    :return: The `(2, rows, cols)` float32 throne and escape squares (edges or corners) masks
+    """
+    rules = load_rules(variant)
+    rows, cols = rules.n_rows, rules.n_cols
+    planes = np.zeros((2, rows, cols), dtype=np.float32)
+    if not rules.no_throne:
+        planes[0, rows // 2, cols // 2] = 1
+    if rules.edge_escape:
+        planes[1] = 1
+        planes[1, 1:-1, 1:-1] = 0
+    else:
+        planes[1, [0, 0, -1, -1], [0, -1, 0, -1]] = 1
+    planes.setflags(write=False)
+    return planes
+
+
+class FeaturePlanes:
+    """
+    Stacked feature planes of a batch of games, for networks: the king, defenders and attackers one-hot planes of the
+    last `history_length` positions (the current one first, zeros before the start of the game), the throne and escape
+    squares masks, and constant planes for the player to move (1 for the attackers), the moves counter over the moves
+    limit and the no capture turns counter over 100 plies.
+
+    The piece planes are kept in a preallocated uint8 ring buffer per game, written twice so that the history of a game
+    is always a contiguous window of its ring: a new position only writes one slot, and `apply_move` updates just the
+    squares touched by the move and its captures.
+    """
+
+    def __init__(self, variant: str, num_games: int = 1, history_length: int = 8, dtype=np.float32):
+        """
+        :param variant: The variant name, or the path of a variant file
+        :param num_games: The number of games
+        :param history_length: The number of positions in the planes, the current one included
+        :param dtype: The dtype of the planes
+        """
+        assert history_length >= 1, f"[ERR: FeaturePlanes] Invalid history length {history_length}"
+        rules = load_rules(variant)
+        self.variant = variant
+        self.num_games = num_games
+        self.history_length = history_length
+        self.n_rows, self.n_cols = rules.n_rows, rules.n_cols
+        self.max_moves = rules.MAX_MOVES
+        self.dtype = dtype
+        self.n_planes = len(PIECE_PLANES) * history_length + 5
+        self.shape = (self.n_planes, self.n_rows, self.n_cols)
+        self.static_planes = make_static_planes(variant)
+        # plane of each tile value, -1 for the tiles without plane
+        self.tile_planes = np.full(max(KING, DEFENDER, ATTACKER, THRONE, CORNER, EMPTY) + 1, -1, dtype=np.int64)
+        for plane, tile in enumerate(PIECE_PLANES):
+            self.tile_planes[tile] = plane
+
+        k = history_length
+        self.ring = np.zeros((num_games, 2 * k, len(PIECE_PLANES), self.n_rows, self.n_cols), dtype=np.uint8)
+        # slot of the current position of each game in its ring, the history is `ring[g, head:head + k]`
+        self.heads = np.zeros(num_games, dtype=np.int64)
+        self.players = np.zeros(num_games, dtype=np.int8)
+        self.n_moves = np.zeros(num_games, dtype=np.int64)
+        self.no_capture_turns = np.zeros(num_games, dtype=np.int64)
+
+    def _one_hot(self, boards: np.ndarray) -> np.ndarray:
+        boards = boards.reshape(-1, 1, self.n_rows, self.n_cols)
+        return (boards == np.array(PIECE_PLANES).reshape(1, -1, 1, 1)).astype(np.uint8)
+
+    def reset(self, games: np.ndarray, boards: np.ndarray, players: np.ndarray):
+        """
+        Start new games, with no history
+
+        :param games: The `(m,)` indices of the games
+        :param boards: The `(m, rows, cols)` boards
+        :param players: The `(m,)` players to move
+        """
+        games = np.asarray(games, dtype=np.int64)
+        self.ring[games] = 0
+        self.heads[games] = 0
+        one_hot = self._one_hot(boards)
+        self.ring[games, 0] = one_hot
+        self.ring[games, self.history_length] = one_hot
+        self.set_counters(games, players, 0, 0)
+
+    def push(self, games: np.ndarray, boards: np.ndarray):
+        """
+        Add the new position of games, computing its planes from the boards
+
+        :param games: The `(m,)` indices of the games
+        :param boards: The `(m, rows, cols)` boards
+        """
+        games = np.asarray(games, dtype=np.int64)
+        heads = (self.heads[games] - 1) % self.history_length
+        one_hot = self._one_hot(boards)
+        self.ring[games, heads] = one_hot
+        self.ring[games, heads + self.history_length] = one_hot
+        self.heads[games] = heads
+
+    def apply_move(self, game: int, undo: tuple):
+        """
+        Add the new position of a game after a move, updating the planes of the previous position with the squares
+        touched by the move
+
+        :param game: The index of the game
+        :param undo: The undo record returned by the game engine `make_move`
+        """
+        fi, fj, ti, tj, piece, _, captured, _, _ = undo
+        k = self.history_length
+        ring = self.ring[game]
+        head = (self.heads[game] - 1) % k
+        current = ring[head]
+        current[:] = ring[head + 1]
+        plane = self.tile_planes[int(piece)]
+        current[plane, fi, fj] = 0
+        current[plane, ti, tj] = 1
+        for i, j, p in captured:
+            current[self.tile_planes[int(p)], i, j] = 0
+        ring[head + k] = current
+        self.heads[game] = head
+
+    def set_counters(self, games: np.ndarray, players: np.ndarray, n_moves: np.ndarray, no_capture_turns: np.ndarray):
+        """
+        Set the player to move and the counters of games
+
+        :param games: The `(m,)` indices of the games
+        :param players: The `(m,)` players to move
+        :param n_moves: The `(m,)` moves played
+        :param no_capture_turns: The `(m,)` plies played since the last capture
+        """
+        self.players[games] = players
+        self.n_moves[games] = n_moves
+        self.no_capture_turns[games] = no_capture_turns
+
+    def planes(self, games: np.ndarray = None, out: np.ndarray = None) -> np.ndarray:
+        """
+        Build the planes of games
+
+        :param games: The `(m,)` indices of the games, all of them if None
+        :param out: The `(m, n_planes, rows, cols)` array to write the planes in, a new one if None
+        :return: The `(m, n_planes, rows, cols)` planes
+        """
+        games = np.arange(self.num_games) if games is None else np.asarray(games, dtype=np.int64)
+        m, k, n = len(games), self.history_length, len(PIECE_PLANES)
+        if out is None:
+            out = np.empty((m,) + self.shape, dtype=self.dtype)
+        history = self.ring[games[:, None], self.heads[games][:, None] + np.arange(k)]
+        out[:, :n * k] = history.reshape(m, n * k, self.n_rows, self.n_cols)
+        out[:, n * k:n * k + 2] = self.static_planes
+        out[:, n * k + 2] = (self.players[games] == ATK)[:, None, None]
+        out[:, n * k + 3] = (self.n_moves[games] / self.max_moves)[:, None, None]
+        out[:, n * k + 4] = (self.no_capture_turns[games] / NO_CAPTURE_PLIES)[:, None, None]
+        return out
+
+    def game_planes(self, game: int = 0, out: np.ndarray = None) -> np.ndarray:
+        """
+        Build the planes of a single game, reading its history as a window of its ring
+
+        :param game: The index of the game
+        :param out: The `(n_planes, rows, cols)` array to write the planes in, a new one if None
+        :return: The `(n_planes, rows, cols)` planes
+        """
+        k, n = self.history_length, len(PIECE_PLANES)
+        if out is None:
+            out = np.empty(self.shape, dtype=self.dtype)
+        head = self.heads[game]
+        out[:n * k] = self.ring[game, head:head + k].reshape(n * k, self.n_rows, self.n_cols)
+        out[n * k:n * k + 2] = self.static_planes
+        out[n * k + 2] = self.players[game] == ATK
+        out[n * k + 3] = self.n_moves[game] / self.max_moves
+        out[n * k + 4] = self.no_capture_turns[game] / NO_CAPTURE_PLIES
+        return out
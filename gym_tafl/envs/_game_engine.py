@@ -1,87 +1,145 @@
+from gym_tafl.envs._instrumentation import *
+from gym_tafl.envs._kernels import *
+from gym_tafl.envs._rules import *
+from gym_tafl.envs._state import GameState
 from gym_tafl.envs._utils import *
+from gym_tafl.envs._zobrist import *
 from gym_tafl.envs.configs import *
 
 
 class GameEngine:
+    """
+    Game engine of a variant: the rules, their precomputed tables and the moves, captures and endgame logic.
+
+    The engine holds no per-game state, which is kept in a `GameState` (see `new_state`) passed as the `state` argument
+    of the methods, so one engine can play any number of games, from any number of threads. The methods called without
+    a state play on the engine default state `state`, for the engines owned by a single game like the environment one.
+    The state tracks one board: passing another board to the methods resyncs the state with it, see `sync`.
+    """
+    # per-game state of the backend
+    state_class = GameState
+
     def __init__(self, variant: str):
-        self.variant = variant
+        """
+        :param variant: The variant name, or the path of a variant file
+        """
+        # the compiled rules are shared by all the engines of the variant, and read as engine attributes
+        self.rules = load_rules(variant)
+        self.__dict__.update(self.rules._asdict())
+        # move generation and capture functions generated for the variant rules
+        self.kernels = make_kernels(variant)
+        # action encoding of the board geometry
+        self.codec = make_action_codec(self.n_rows, self.n_cols)
+        self.piece_rays = self.kernels.piece_rays
+        self.vector_mask = vector_mask
+        # check the players and moves given to the engine, disabled by the environment training mode
+        self.validate = True
+        # profiling statistics, None unless enabled with `enable_stats`
+        self.stats: Optional[PerfStats] = None
+        # state of the game played by the methods called without a state
+        self.state = self.new_state()
 
-        variants_dir = os.path.join(os.getcwd(), 'variants')
-        variant_file = os.path.join(variants_dir, f'{variant}.ini')
-        assert os.path.isfile(variant_file), f"[ERR GameEngine.__init__] Unknown variant {self.variant}"
+    def new_state(self, board: np.array = None, player: int = None) -> GameState:
+        """
+        Create the state of a new game played on the engine
 
-        variant_config = configparser.ConfigParser()
-        variant_config.read(variant_file)
+        :param board: The board tracked by the state, if None the state tracks no board until the first call
+        :param player: The player to move, the starting player if not given
+        :return: The state
+        """
+        state = self.state_class(self.STARTING_PLAYER if player is None else player)
+        if board is not None:
+            self.sync(board, player, state=state)
+        return state
 
-        # tile values
-        self.board = variant_config['VARIANT'].get('board').split(',')
-        self.GAME_OVER_REWARD = 100
-        self.MAX_REWARD = self.GAME_OVER_REWARD
-        self.MAX_MOVES = variant_config['VARIANT'].getint('max_moves') - 1
+    # the state of the game played by the methods called without a state, read as engine attributes
+    player = property(lambda self: self.state.player, lambda self, value: setattr(self.state, 'player', value))
+    hash = property(lambda self: self.state.hash, lambda self, value: setattr(self.state, 'hash', value))
+    history = property(lambda self: self.state.history, lambda self, value: setattr(self.state, 'history', value))
+    material = property(lambda self: self.state.material, lambda self, value: setattr(self.state, 'material', value))
+    piece_counts = property(lambda self: self.state.piece_counts,
+                            lambda self, value: setattr(self.state, 'piece_counts', value))
+    no_capture_turns_counter = property(lambda self: self.state.no_capture_turns_counter,
+                                        lambda self, value: setattr(self.state, 'no_capture_turns_counter', value))
 
-        players = {
-            'ATK': ATK,
-            'DEF': DEF
-        }
-        self.piece_reward = {
-            KING: 16,
-            DEFENDER: 2,
-            ATTACKER: -1
-        }
+    def sync(self, board: np.array, player: int = None, state: GameState = None):
+        """
+        Recompute a game state from the given board, which becomes the tracked board and the only position in the
+        history. The state is then updated incrementally by `make_move`, so call this if the board is modified outside
+        the engine.
 
-        self.info = {}
-        self.STARTING_PLAYER = players[variant_config['VARIANT'].get('starting_player')]
-        self.n_rows = variant_config['VARIANT'].getint('n_rows')
-        self.n_cols = variant_config['VARIANT'].getint('n_cols')
-        self.vector_mask = vector_mask
+        :param board: The board
+        :param player: The player to move, the starting player if not given
+        :param state: The game state, the engine default one if None
+        """
+        if state is None:
+            state = self.state
+        state.board = board
+        flat = board.ravel()
+        state.piece_counts = {p: int(np.count_nonzero(flat == p)) for p in (KING, DEFENDER, ATTACKER)}
+        state.material = sum(self.piece_reward[p] * n for p, n in state.piece_counts.items())
+        state.player = self.STARTING_PLAYER if player is None else player
+        state.hash = zobrist_hash(board, state.player, self.zobrist_keys, self.zobrist_side_key)
+        state.history.clear()
+        state.history.push(state.hash)
 
-        # rules
-        self.draw_after_50_turns_without_capture = variant_config['DRAW CONDITION'] \
-            .getboolean('draw_after_50_turns_without_capture')
-        self.no_capture_turns_counter = 0
-        self.threefold_repetition_as_draw = variant_config['DRAW CONDITION']\
-            .getboolean('threefold_repetition_as_draw')
-
-        self.edge_escape = variant_config['OBJECTIVE'].getboolean('edge_escape')
-
-        self.no_throne = variant_config['THRONE'].getboolean('no_throne')
-
-        self.unrestricted_movement = variant_config['MOVEMENT'].getboolean('unrestricted_movement')
-
-        if not self.unrestricted_movement:
-            self.m_counter = {
-                KING: 1 if (variant_config['MOVEMENT'].getboolean('king_only_moves_1_tile') or
-                            variant_config['MOVEMENT'].getboolean('all_move_only_1_tile')) else max(self.n_rows,
-                                                                                                    self.n_cols),
-                ATTACKER: 1 if variant_config['MOVEMENT'].getboolean('all_move_only_1_tile') else max(self.n_rows,
-                                                                                                      self.n_cols),
-                DEFENDER: 1 if variant_config['MOVEMENT'].getboolean('all_move_only_1_tile') else max(self.n_rows,
-                                                                                                      self.n_cols)
-            }
-
-        self.only_king_can_land_on_throne = variant_config['THRONE MOVEMENT'].getboolean('only_king_can_land_on_throne')
-        self.no_one_can_land_on_throne = variant_config['THRONE MOVEMENT'].getboolean('no_one_can_land_on_throne')
-
-        self.throne_blocks_all_except_king = variant_config['THRONE MOVEMENT'].getboolean('throne_blocks_all_except_king')
-        self.throne_blocks_all = variant_config['THRONE MOVEMENT'].getboolean('throne_blocks_all')
-
-        # king power
-        self.armed_king = variant_config['KING POWER'].getboolean('armed_king')
-        self.anvil_king = variant_config['KING POWER'].getboolean('anvil_king')
-        self.unarmed_king = variant_config['KING POWER'].getboolean('unarmed_king')
-
-        # king capture
-        self.king_captured_with_two_pieces = variant_config['KING CAPTURE'].getboolean('king_captured_with_two_pieces')
-        self.king_captured_with_two_pieces_except_near_or_on_throne = variant_config['KING CAPTURE'].getboolean('king_captured_with_two_pieces_except_near_or_on_throne')
-        self.king_captured_with_four_pieces = variant_config['KING CAPTURE'].getboolean('king_captured_with_four_pieces')
-
-    def fill_board(self, board: np.array):
-        char_to_tile = {
-            'a': ATTACKER,
-            'k': KING,
-            'd': DEFENDER
-        }
+    def enable_stats(self, stats: PerfStats = None) -> PerfStats:
+        """
+        Start collecting the calls and time of the engine phases, the legal moves per call to `legal_moves` and the
+        captures per move. The engine runs its plain methods again once disabled.
 
+        :param stats: The statistics to update, possibly shared with other engines, if None new ones are created
+        :return: The statistics
+        """
+        self.disable_stats()
+        self.stats = PerfStats() if stats is None else stats
+        hooks = dict.fromkeys(ENGINE_PHASES)
+        hooks.update(legal_moves=self.stats.count_legal_moves, make_move=self.stats.count_ply)
+        instrument(self, self.stats, hooks)
+        return self.stats
+
+    def disable_stats(self):
+        """
+        Stop collecting the statistics
+        """
+        uninstrument(self, ENGINE_PHASES)
+        self.stats = None
+
+    def _track(self, board: np.array, state: Optional[GameState]) -> GameState:
+        if state is None:
+            state = self.state
+        if board is not state.board:
+            self.sync(board, state=state)
+        return state
+
+    def snapshot(self, state: GameState = None) -> tuple:
+        """
+        Save a game state, to be restored later with `restore`
+
+        :param state: The game state, the engine default one if None
+        :return: The saved state
+        """
+        if state is None:
+            state = self.state
+        return (state.board.copy(), state.player, state.hash, len(state.history), state.material,
+                dict(state.piece_counts), state.no_capture_turns_counter)
+
+    def restore(self, saved: tuple, state: GameState = None):
+        """
+        Restore a game state saved with `snapshot`, removing the positions played after it from the history
+
+        :param saved: The saved state
+        :param state: The game state, the engine default one if None
+        """
+        if state is None:
+            state = self.state
+        board, state.player, state.hash, n_history, state.material, piece_counts, state.no_capture_turns_counter = saved
+        np.copyto(state.board, board)
+        state.piece_counts = dict(piece_counts)
+        while len(state.history) > n_history:
+            state.history.pop()
+
+    def fill_board(self, board: np.array, state: GameState = None):
         assert len(self.board) == board.shape[
             0], f"[ERR GameEngine.fill_board] Unexpected board length: {len(self.board)}"
         for j, row in enumerate(self.board):
@@ -91,21 +149,18 @@ class GameEngine:
                 if c.isdigit():
                     i += int(c)
                 else:
-                    t = char_to_tile[c.lower()]
-                    board[j, i] = t
-                    self.MAX_REWARD += abs(self.piece_reward.get(t))
+                    board[j, i] = CHAR_TO_TILE[c.lower()]
                     i += 1
+        self.sync(board, state=state)
 
-    def legal_moves(self, board: np.array, player: int):
+    def legal_moves(self, board: np.array, player: int, state: GameState = None):
         assert player in [ATK, DEF], f"[ERR: legal_moves] Unrecognized player type: {player}"
         moves = []
-        for i in range(board.shape[0]):
-            for j in range(board.shape[1]):
-                p = board[i, j]
-                if p in [KING, ATTACKER, DEFENDER]:
-                    if (p == ATTACKER and player == ATK) or \
-                            (p != ATTACKER and player == DEF):
-                        moves.extend(self._legal_moves(board, p, (i, j)))
+        pieces = (ATTACKER,) if player == ATK else (KING, DEFENDER)
+        cells = board.ravel().tolist()
+        for sq, p in enumerate(cells):
+            if p in pieces:
+                moves.extend(self._piece_moves(cells, p, sq))
         return moves
 
     def _legal_moves(self,
@@ -120,45 +175,20 @@ class GameEngine:
         :param position: The selected piece position
         :return: A list of valid moves for the piece in the given board
         """
-        moves = []
-        for inc_i, inc_j in DIRECTIONS:
-            i, j = position
-            c = 0
-            while self.unrestricted_movement or c < self.m_counter[piece]:
-                i += inc_i
-                j += inc_j
-                c += 1
-                if i < 0 or i > board.shape[0] - 1 or j < 0 or j > board.shape[1] - 1:
-                    break
-                t_tile = board[i, j]
-                if t_tile == EMPTY:
-                    moves.append(space_to_decimal(values=(position[0], position[1], i, j),
-                                                  rows=board.shape[0],
-                                                  cols=board.shape[1]))
-                elif t_tile == THRONE:
-                    if piece == KING and self.only_king_can_land_on_throne:
-                        moves.append(space_to_decimal(values=(position[0], position[1], i, j),
-                                                      rows=board.shape[0],
-                                                      cols=board.shape[1]))
-                    elif piece != KING and not self.no_one_can_land_on_throne:  # TODO: Test
-                        moves.append(space_to_decimal(values=(position[0], position[1], i, j),
-                                                      rows=board.shape[0],
-                                                      cols=board.shape[1]))
-                    else:
-                        if (piece == KING and self.throne_blocks_all_except_king) or (not self.throne_blocks_all):
-                            continue
-                        else:
-                            break
-                elif t_tile == CORNER:
-                    if piece == KING:
-                        moves.append(space_to_decimal(values=(position[0], position[1], i, j),
-                                                      rows=board.shape[0],
-                                                      cols=board.shape[1]))
-                else:
-                    break
-        return moves
+        return self._piece_moves(board.ravel().tolist(), piece, position[0] * board.shape[1] + position[1])
+
+    def _piece_moves(self, cells: List[int], piece: int, square: int) -> List[int]:
+        """
+        Compute the legal moves for the selected piece, walking its rays until the first blocker
 
-    def board_value(self, board: np.array) -> int:
+        :param cells: The flattened board
+        :param piece: The selected piece
+        :param square: The selected piece square
+        :return: A list of valid moves for the piece
+        """
+        return self.kernels.piece_moves[piece](cells, self.piece_rays[piece][square])
+
+    def board_value(self, board: np.array, state: GameState = None) -> int:
         value = 0
         for i in range(board.shape[0]):
             for j in range(board.shape[1]):
@@ -175,98 +205,130 @@ class GameEngine:
         return value
 
     def alt_apply_move(self, board: np.ndarray, action: int) -> dict:
-        move = decimal_to_space(action, board.shape[0], board.shape[1])
+        move = self.codec.decode(action)
         return self.apply_move(board=board,
                                move=move)
 
-    def apply_move(self, board: np.array, move: Tuple[int, int, int, int]) -> dict:
-        fi, fj, ti, tj = move
-        assert board[fi, fj] in [KING, ATTACKER, DEFENDER], \
-            f"[ERR: apply_move] Selected invalid piece: {position_as_str(position=(fi, fj), rows=board.shape[0])}"
-        assert board[ti, tj] not in [KING, ATTACKER, DEFENDER], \
-            f"[ERR: apply_move] Invalid destination: {position_as_str(position=(ti, tj), rows=board.shape[0])}"
-        info = {
-            'game_over': False,
-            'move': position_as_str((fi, fj), board.shape[0]).upper() + '-' + position_as_str((ti, tj),
-                                                                                              board.shape[0]).upper(),
-            'reward': 0
+    def apply_move(self, board: np.array, move: Tuple[int, int, int, int], state: GameState = None) -> dict:
+        undo, game_over = self.make_move(board, move, state=state)
+        return {
+            'game_over': game_over,
+            'move': move_as_str(move, [(i, j) for i, j, _ in undo[6]], board.shape[0]),
+            'reward': self.move_reward(undo, game_over, state=state)
         }
-        # update board and piece
-        board[ti, tj] = board[fi, fj]
+
+    def move_reward(self, undo: tuple, game_over: bool, state: GameState = None) -> float:
+        """
+        Compute the reward of the move just made, as returned by `apply_move`
+
+        :param undo: The undo record returned by `make_move`
+        :param game_over: Whether the move ended the game
+        :param state: The game state, the engine default one if None
+        :return: The normalized reward
+        """
+        reward = 0
+        if any(p == KING for _, _, p in undo[6]):
+            reward += 100
+        elif game_over:
+            # the king has escaped
+            reward += self.GAME_OVER_REWARD
+        reward += (self.state if state is None else state).material
+        # normalize rewards in [-1, 1]
+        return reward / self.MAX_REWARD
+
+    def make_move(self, board: np.array, move: Tuple[int, int, int, int],
+                  state: GameState = None) -> Tuple[tuple, bool]:
+        """
+        Apply a move to the board like `apply_move`, without building the move info. The returned undo record takes
+        the move back with `unmake_move`.
+
+        :param board: The board
+        :param move: The move
+        :param state: The game state, the engine default one if None
+        :return: The undo record (origin row and col, destination row and col, moved piece, destination tile, captured
+            (row, col, piece), previous no capture turns counter and previous hash) and whether the game is over
+        """
+        state = self._track(board, state)
+        fi, fj, ti, tj = move
+        if self.validate:
+            assert board[fi, fj] in [KING, ATTACKER, DEFENDER], \
+                f"[ERR: make_move] Selected invalid piece: {position_as_str(position=(fi, fj), rows=board.shape[0])}"
+            assert board[ti, tj] not in [KING, ATTACKER, DEFENDER], \
+                f"[ERR: make_move] Invalid destination: {position_as_str(position=(ti, tj), rows=board.shape[0])}"
+        counter, h = state.no_capture_turns_counter, state.hash
+        game_over = False
+        # update board, piece and hash
+        keys = self.zobrist_keys
+        cols = board.shape[1]
+        piece, t_tile = board[fi, fj], board[ti, tj]
+        state.hash ^= keys[piece][fi * cols + fj] ^ keys[piece][ti * cols + tj]
+        if t_tile != EMPTY:
+            state.hash ^= keys[t_tile][ti * cols + tj]
+        board[ti, tj] = piece
         board[fi, fj] = THRONE if not self.no_throne and on_throne_arr(board, (fi, fj)) else EMPTY
+        if board[fi, fj] == THRONE:
+            state.hash ^= keys[THRONE][fi * cols + fj]
         # check if king has escaped
         if board[ti, tj] == KING and self.edge_escape and on_edge_arr(board, (ti, tj)):
-            info['game_over'] = True
-            info['reward'] += self.GAME_OVER_REWARD
+            game_over = True
         elif board[ti, tj] == KING and (not self.edge_escape) and on_corner_arr(board, (ti, tj)):
-            info['game_over'] = True
-            info['reward'] += self.GAME_OVER_REWARD
+            game_over = True
         # process captures
         to_remove = self.process_captures(board, (ti, tj))
         if len(to_remove) == 0:
-            self.no_capture_turns_counter += 1
+            state.no_capture_turns_counter += 1
         else:
-            self.no_capture_turns_counter = 0
+            state.no_capture_turns_counter = 0
+        captured = []
         for (i, j) in to_remove:
-            if board[i, j] == KING:
-                info['game_over'] = True
-                info['reward'] += 100
+            p = board[i, j]
+            if p == KING:
+                game_over = True
+            captured.append((i, j, p))
+            state.piece_counts[p] -= 1
+            state.material -= self.piece_reward[p]
+            state.hash ^= keys[p][i * cols + j]
             board[i, j] = THRONE if on_throne_arr(board, (i, j)) else EMPTY
-            info['move'] += 'x' + position_as_str((i, j), board.shape[0]).upper()
-        info['reward'] += self.board_value(board)
-        # normalize rewards in [-1, 1]
-        info['reward'] /= self.MAX_REWARD
-        return info
+            if board[i, j] == THRONE:
+                state.hash ^= keys[THRONE][i * cols + j]
+        self._end_turn(state)
+        return (fi, fj, ti, tj, piece, t_tile, tuple(captured), counter, h), game_over
 
-    def process_captures(self, board: np.array, position: Tuple[int, int]) -> List[Tuple[int, int]]:
-        captures = []
-        piece = board[position]
-        for inc_i, inc_j in DIRECTIONS:
-            i, j = position
-            i += inc_i
-            j += inc_j
+    def unmake_move(self, board: np.array, undo: tuple, state: GameState = None):
+        """
+        Take back the last move made on the tracked board, restoring the exact previous state
+
+        :param board: The board
+        :param undo: The undo record returned by `make_move`
+        :param state: The game state, the engine default one if None
+        """
+        if state is None:
+            state = self.state
+        fi, fj, ti, tj, piece, t_tile, captured, counter, h = undo
+        for i, j, p in captured:
+            board[i, j] = p
+            state.piece_counts[p] += 1
+            state.material += self.piece_reward[p]
+        board[fi, fj] = piece
+        board[ti, tj] = t_tile
+        state.no_capture_turns_counter = counter
+        state.history.pop()
+        state.hash = h
+        state.player = ATK if state.player == DEF else DEF
+
+    def _end_turn(self, state: GameState):
+        """
+        Pass the turn to the other player, and add the new position to the history
+        """
+        state.player = ATK if state.player == DEF else DEF
+        state.hash ^= self.zobrist_side_key
+        state.history.push(state.hash)
+
+    def process_captures(self, board: np.array, position: Tuple[int, int],
+                         state: GameState = None) -> List[Tuple[int, int]]:
+        return self.kernels.process_captures(board.ravel(), position[0] * self.n_cols + position[1])
 
-            if not (out_of_board_arr(board, (i, j))):
-                middle_piece = board[i, j]
-                if middle_piece in [KING, ATTACKER, DEFENDER]:
-                    if (piece == DEFENDER and middle_piece == ATTACKER) or \
-                            (piece == KING and self.armed_king and middle_piece == ATTACKER) or \
-                            (piece == ATTACKER and middle_piece == DEFENDER):
-                        i += inc_i
-                        j += inc_j
-                        if not (out_of_board_arr(board, (i, j))):
-                            outer_piece = board[i, j]
-                            # normal capture
-                            if outer_piece in [KING, ATTACKER, DEFENDER] and \
-                                    (piece == outer_piece or (piece == DEFENDER and outer_piece == KING and (self.armed_king or self.anvil_king))
-                                     or (piece == KING and self.armed_king and outer_piece == DEFENDER)):
-                                captures.append((i - inc_i, j - inc_j))
-                            # capture next to throne
-                            elif outer_piece == THRONE and (
-                                    (piece == ATTACKER and middle_piece == DEFENDER) or
-                                    ((piece == DEFENDER or piece == KING and self.armed_king) and piece == ATTACKER)):
-                                captures.append((i - inc_i, j - inc_j))
-                    # capture king
-                    elif piece == ATTACKER and middle_piece == KING:
-                        if self.king_captured_with_two_pieces or \
-                                ((not on_throne_arr(board, (i, j)) and not next_to_throne_arr(board, (i, j)))
-                                 and self.king_captured_with_two_pieces_except_near_or_on_throne):
-                            i += inc_i
-                            j += inc_j
-                            if not (out_of_board_arr(board, (i, j))):
-                                outer_piece = board[i, j]
-                                if outer_piece in [ATTACKER, THRONE]:
-                                    captures.append((i - inc_i, j - inc_j))
-                    elif self.king_captured_with_four_pieces or \
-                            self.king_captured_with_two_pieces_except_near_or_on_throne:
-                        # case 1: king is on the throne, need 4 pieces
-                        # case 2: king is next to the throne, need 3 pieces
-                        if on_throne_arr(board, (i, j)) or next_to_throne_arr(board, (i, j)):
-                            if self._check_king(board, (i, j)) == 4:
-                                captures.append((i, j))
-        return captures
-
-    def _check_king(self, board: np.array, position: Tuple[int, int]) -> int:
+    def _check_king(self, board: np.array, position: Tuple[int, int], state: GameState = None) -> int:
         threats = 0
         for inc_i, inc_j in DIRECTIONS:
             i, j = position
@@ -284,7 +346,10 @@ class GameEngine:
                       last_moves: List[Tuple[int, int, int, int]],
                       last_move: Tuple[int, int, int, int],
                       player: int,
-                      n_moves: int) -> dict:
+                      n_moves: int,
+                      state: GameState = None) -> dict:
+        if state is None:
+            state = self.state
         info = {
             'game_over': False,
             'reason': '',
@@ -296,16 +361,17 @@ class GameEngine:
             info['game_over'] = True
             info['reason'] = 'Moves limit reached'
             info['winner'] = DRAW
-        # check threefold repetition
-        elif check_threefold_repetition(last_moves=last_moves,
-                                        last_move=last_move):
+        # check threefold repetition, of the same moves or of the same position
+        elif (self.threefold_repetition_by_position and state.history.count(state.hash) >= 3) or \
+                (not self.threefold_repetition_by_position and check_threefold_repetition(last_moves=last_moves,
+                                                                                          last_move=last_move)):
             info['game_over'] = True
             info['reason'] = 'Threefold repetition'
             if self.threefold_repetition_as_draw:
                 info['winner'] = DRAW
             else:
                 info['winner'] = ATK if player == DEF else DEF
-        elif self.draw_after_50_turns_without_capture and self.no_capture_turns_counter == 100:  # 2 moves = 1 turn
+        elif self.draw_after_50_turns_without_capture and state.no_capture_turns_counter == 100:  # 2 moves = 1 turn
             info['game_over'] = True
             info['reason'] = '50 turns with no capture'
             info['winner'] = DRAW
@@ -0,0 +1,138 @@
+from typing import Set
+
+from gym_tafl.envs._game_engine import *
+
+PIECES = {KING, DEFENDER, ATTACKER}
+
+
+class IncrementalGameState(GameState):
+    """
+    Game state of the incremental engine, with the cells of the tracked board, the legal moves of each piece by side
+    and square, and the pieces whose moves have to be recomputed
+    """
+    __slots__ = ('cells', 'moves', 'dirty')
+
+    def __init__(self, player: int = None):
+        super().__init__(player)
+        self.cells: List[int] = []
+        self.moves: Dict[int, Dict[int, List[int]]] = {ATK: {}, DEF: {}}
+        self.dirty: Dict[int, Set[int]] = {ATK: set(), DEF: set()}
+
+    def copy(self) -> 'IncrementalGameState':
+        state = super().copy()
+        state.cells = list(self.cells)
+        state.moves = {side: dict(moves) for side, moves in self.moves.items()}
+        state.dirty = {side: set(dirty) for side, dirty in self.dirty.items()}
+        return state
+
+
+class IncrementalGameEngine(GameEngine):
+    """
+    Game engine backend that keeps the legal moves of every piece of both sides, and after each move only recomputes
+    the moves of the pieces whose rays cross the vacated, occupied or captured squares. The recomputation is deferred
+    until the legal moves of the piece side are requested.
+
+    The moves are kept in the game state for its tracked board, see `GameEngine.sync`.
+    """
+    state_class = IncrementalGameState
+
+    def __init__(self, variant: str, debug: bool = False):
+        """
+        :param variant: The variant name
+        :param debug: If True, check the incremental legal moves against a full board scan on every call
+        """
+        super().__init__(variant)
+        self.debug = debug
+        # ray target squares only, for the walks looking for the closest pieces
+        self.ray_squares = [tuple(tuple(t for t, _, _, _ in ray) for ray in square_rays) for square_rays in self.rays]
+
+    def sync(self, board: np.array, player: int = None, state: IncrementalGameState = None):
+        if state is None:
+            state = self.state
+        super().sync(board, player, state=state)
+        state.cells = board.ravel().tolist()
+        state.moves = {ATK: {}, DEF: {}}
+        state.dirty = {ATK: set(), DEF: set()}
+        for sq, p in enumerate(state.cells):
+            if p in PIECES:
+                state.moves[ATK if p == ATTACKER else DEF][sq] = self._piece_moves(state.cells, p, sq)
+
+    def snapshot(self, state: IncrementalGameState = None) -> tuple:
+        if state is None:
+            state = self.state
+        return (super().snapshot(state), list(state.cells),
+                {side: dict(moves) for side, moves in state.moves.items()},
+                {side: set(dirty) for side, dirty in state.dirty.items()})
+
+    def restore(self, saved: tuple, state: IncrementalGameState = None):
+        if state is None:
+            state = self.state
+        engine_state, cells, moves, dirty = saved
+        super().restore(engine_state, state)
+        state.cells = list(cells)
+        state.moves = {side: dict(side_moves) for side, side_moves in moves.items()}
+        state.dirty = {side: set(side_dirty) for side, side_dirty in dirty.items()}
+
+    def legal_moves(self, board: np.array, player: int, state: IncrementalGameState = None):
+        assert player in [ATK, DEF], f"[ERR: legal_moves] Unrecognized player type: {player}"
+        state = self._track(board, state)
+        side_moves = state.moves[player]
+        cells = state.cells
+        for sq in state.dirty[player]:
+            side_moves[sq] = self._piece_moves(cells, cells[sq], sq)
+        state.dirty[player].clear()
+        moves = []
+        for sq in sorted(side_moves):
+            moves.extend(side_moves[sq])
+        if self.debug:
+            full_moves = super().legal_moves(board, player)
+            assert moves == full_moves, \
+                f"[ERR: legal_moves] Incremental moves differ from full scan: {sorted(set(moves) ^ set(full_moves))}"
+        return moves
+
+    def make_move(self, board: np.array, move: Tuple[int, int, int, int],
+                  state: IncrementalGameState = None) -> Tuple[tuple, bool]:
+        state = self._track(board, state)
+        undo, game_over = super().make_move(board, move, state)
+        fi, fj, ti, tj, _, _, captured, _, _ = undo
+        cols = board.shape[1]
+        self._update(state, board.ravel(), [fi * cols + fj, ti * cols + tj] + [i * cols + j for i, j, _ in captured])
+        return undo, game_over
+
+    def unmake_move(self, board: np.array, undo: tuple, state: IncrementalGameState = None):
+        if state is None:
+            state = self.state
+        super().unmake_move(board, undo, state)
+        fi, fj, ti, tj, _, _, captured, _, _ = undo
+        cols = board.shape[1]
+        self._update(state, board.ravel(), [fi * cols + fj, ti * cols + tj] + [i * cols + j for i, j, _ in captured])
+
+    def _update(self, state: IncrementalGameState, flat: np.array, changed: List[int]):
+        """
+        Mark the pieces whose legal moves may have changed after some squares of the tracked board changed
+
+        :param state: The game state
+        :param flat: The flattened tracked board
+        :param changed: The changed squares
+        """
+        cells = state.cells
+        moves, dirty = state.moves, state.dirty
+        for sq in changed:
+            cells[sq] = flat[sq].item()
+            for side in (ATK, DEF):
+                moves[side].pop(sq, None)
+                dirty[side].discard(sq)
+        affected = set()
+        for sq in changed:
+            if cells[sq] in PIECES:
+                affected.add(sq)
+            # the closest piece in each direction may have its ray crossing the square
+            for ray in self.ray_squares[sq]:
+                for t in ray:
+                    if cells[t] in PIECES:
+                        affected.add(t)
+                        break
+        for sq in affected:
+            side = ATK if cells[sq] == ATTACKER else DEF
+            moves[side][sq] = None
+            dirty[side].add(sq)
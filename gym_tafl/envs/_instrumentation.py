@@ -0,0 +1,185 @@
+import json
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+# engine functions timed when the statistics are enabled; make_move includes the time of process_captures
+ENGINE_PHASES = ('legal_moves', 'make_move', 'unmake_move', 'process_captures', 'check_endgame', 'board_value')
+# environment functions timed when the statistics are enabled; step includes the time of the engine phases
+ENV_PHASES = ('step', 'reset')
+
+
+class PerfStats:
+    """
+    Profiling counters of game engines and environments: the calls and cumulative time of each phase, the legal moves
+    and captures per ply, and the length and end reason of the episodes.
+
+    The counters are only updated by the engines and environments they are enabled on, with `enable_stats`: the timed
+    functions are then wrapped on the instance, so a disabled engine or environment runs the plain methods at no cost.
+    The times of the phases are inclusive, e.g. `step` includes the engine calls it makes.
+    """
+
+    def __init__(self,
+                 export_path: str = None,
+                 export_callback: Callable[[dict], None] = None,
+                 export_interval: float = 60.):
+        """
+        :param export_path: A JSON lines file the summary is appended to periodically, none if None
+        :param export_callback: A function the summary is passed to periodically, none if None
+        :param export_interval: The time in seconds between two exports, checked at the end of each episode
+        """
+        self.export_path = export_path
+        self.export_callback = export_callback
+        self.export_interval = export_interval
+        self.labels = {}
+        # the phase counters are shared with the installed wrappers, so they are only ever cleared in place
+        self.calls: Dict[str, int] = {}
+        self.times: Dict[str, float] = {}
+        self.reset()
+
+    def reset(self):
+        """
+        Clear the counters, the wrappers already installed keep counting in the cleared ones
+        """
+        for phase in self.calls:
+            self.calls[phase] = 0
+            self.times[phase] = 0.
+        self.n_legal_moves_calls = 0
+        self.n_legal_moves = 0
+        self.n_plies = 0
+        self.n_captures = 0
+        self.episode_lengths: Dict[int, int] = {}
+        self.reasons: Dict[str, int] = {}
+        self.start = time.time()
+        self._last_export = time.perf_counter()
+
+    def timed(self, phase: str, function: Callable, on_result: Callable = None) -> Callable:
+        """
+        Wrap a function, counting its calls and time under a phase
+
+        :param phase: The phase name
+        :param function: The function
+        :param on_result: A function called with the result of each call, to update other counters
+        :return: The wrapped function
+        """
+        calls, times = self.calls, self.times
+        calls.setdefault(phase, 0)
+        times.setdefault(phase, 0.)
+        perf_counter = time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            result = function(*args, **kwargs)
+            times[phase] += perf_counter() - start
+            calls[phase] += 1
+            if on_result is not None:
+                on_result(result)
+            return result
+
+        wrapper.__wrapped__ = function
+        return wrapper
+
+    def count_legal_moves(self, moves: List[int]):
+        self.n_legal_moves_calls += 1
+        self.n_legal_moves += len(moves)
+
+    def count_ply(self, result: tuple):
+        undo, _ = result
+        self.n_plies += 1
+        self.n_captures += len(undo[6])
+
+    def end_episode(self, length: int, reason: str):
+        """
+        Record the end of an episode, and export the summary if the export interval has passed
+
+        :param length: The number of plies of the episode
+        :param reason: The end reason
+        """
+        self.episode_lengths[length] = self.episode_lengths.get(length, 0) + 1
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        if (self.export_path is not None or self.export_callback is not None) and \
+                time.perf_counter() - self._last_export >= self.export_interval:
+            self.export()
+
+    def _phases(self) -> dict:
+        return {phase: {'calls': n,
+                        'total_time': self.times[phase],
+                        'mean_time': self.times[phase] / n if n > 0 else 0.}
+                for phase, n in self.calls.items()}
+
+    def _episodes(self) -> dict:
+        if not self.episode_lengths:
+            return {'count': 0}
+        lengths = np.array(list(self.episode_lengths.keys()))
+        counts = np.array(list(self.episode_lengths.values()))
+        order = np.argsort(lengths)
+        lengths, counts = lengths[order], counts[order]
+        cumulative = np.cumsum(counts) / counts.sum()
+        return {
+            'count': int(counts.sum()),
+            'mean_length': float((lengths * counts).sum() / counts.sum()),
+            'min_length': int(lengths[0]),
+            'max_length': int(lengths[-1]),
+            'percentiles': {str(q): int(lengths[np.searchsorted(cumulative, q / 100)]) for q in (50, 90, 99)},
+            'reasons': dict(self.reasons)
+        }
+
+    def summary(self) -> dict:
+        """
+        Summarize the counters
+
+        :return: The labels, the calls and time of each phase, the mean legal moves per call to `legal_moves`, the mean
+            captures per ply and the episodes statistics
+        """
+        return {
+            **self.labels,
+            'timestamp': time.time(),
+            'elapsed': time.time() - self.start,
+            'phases': self._phases(),
+            'mean_legal_moves': self.n_legal_moves / self.n_legal_moves_calls if self.n_legal_moves_calls else 0.,
+            'plies': self.n_plies,
+            'mean_captures': self.n_captures / self.n_plies if self.n_plies else 0.,
+            'episodes': self._episodes()
+        }
+
+    def export(self):
+        """
+        Export the summary to the file and the callback
+        """
+        summary = self.summary()
+        if self.export_path is not None:
+            with open(self.export_path, 'a') as f:
+                f.write(json.dumps(summary) + '\n')
+        if self.export_callback is not None:
+            self.export_callback(summary)
+        self._last_export = time.perf_counter()
+
+    def __repr__(self) -> str:
+        phases = ', '.join(f'{phase}={n} calls/{self.times[phase]:.3f}s' for phase, n in self.calls.items())
+        return f'PerfStats({phases}, plies={self.n_plies}, episodes={sum(self.episode_lengths.values())})'
+
+
+def instrument(obj, stats: PerfStats, hooks: Dict[str, Optional[Callable]]):
+    """
+    Wrap methods of an object with timed functions on the instance, shadowing the class methods
+
+    :param obj: The engine or environment
+    :param stats: The statistics to update
+    :param hooks: The names of the methods to wrap, with the function called with each result (or None)
+    """
+    for name, on_result in hooks.items():
+        method = getattr(obj, name, None)
+        if method is not None:
+            setattr(obj, name, stats.timed(name, getattr(method, '__wrapped__', method), on_result))
+
+
+def uninstrument(obj, names: List[str]):
+    """
+    Remove the wrappers set by `instrument`, restoring the class methods
+
+    :param obj: The engine or environment
+    :param names: The names of the wrapped methods
+    """
+    for name in names:
+        obj.__dict__.pop(name, None)
@@ -0,0 +1,196 @@
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import Callable, Dict
+
+from gym_tafl.envs._rules import *
+
+# kind of the target square of a ray step, for the move generation kernels
+NORMAL_SQUARE = 0
+THRONE_SQUARE = 1
+CORNER_SQUARE = 2
+
+# throne behaviour for a moving piece
+THRONE_LAND = 0
+THRONE_PASS = 1
+THRONE_BLOCK = 2
+
+PIECES = (KING, DEFENDER, ATTACKER)
+
+
+def throne_rule(rules: VariantRules, piece: int) -> int:
+    """
+    Get how the throne square behaves for a moving piece
+
+    :param rules: The variant rules
+    :param piece: The moving piece
+    :return: One of THRONE_LAND, THRONE_PASS or THRONE_BLOCK
+    """
+    if piece == KING and rules.only_king_can_land_on_throne:
+        return THRONE_LAND
+    elif piece != KING and not rules.no_one_can_land_on_throne:
+        return THRONE_LAND
+    elif (piece == KING and rules.throne_blocks_all_except_king) or (not rules.throne_blocks_all):
+        return THRONE_PASS
+    return THRONE_BLOCK
+
+
+def _moves_source(rules: VariantRules, piece: int) -> str:
+    """
+    Generate the source of the move generation kernel of a piece, walking the rays of its square until the first
+    blocker. The throne and corner branches are only generated when the piece can pass or land on them.
+    """
+    rule = throne_rule(rules, piece)
+    lines = [
+        'def piece_moves(cells, rays):',
+        '    moves = []',
+        '    for ray in rays:',
+        '        for t, action, kind in ray:',
+        '            tile = cells[t]',
+        f'            if tile == {EMPTY}:',
+        '                moves.append(action)',
+    ]
+    if rule == THRONE_LAND:
+        lines += [f'            elif kind == {THRONE_SQUARE} and tile == {THRONE}:',
+                  '                moves.append(action)']
+    elif rule == THRONE_PASS:
+        lines += [f'            elif kind == {THRONE_SQUARE} and tile == {THRONE}:',
+                  '                continue']
+    # corners are the last square of their rays, so for the other pieces they are just blockers
+    if piece == KING:
+        lines += [f'            elif kind == {CORNER_SQUARE} and tile == {CORNER}:',
+                  '                moves.append(action)']
+    lines += [
+        '            else:',
+        '                break',
+        '    return moves',
+    ]
+    return '\n'.join(lines)
+
+
+def _captures_source(rules: VariantRules) -> str:
+    """
+    Generate the source of the capture kernel, with a branch for each moving piece listing its victims and the pieces
+    acting as the other side of the capture. The king captures are only generated for the enabled rules.
+    """
+    # the king is captured by four pieces (or three and the throne) on or next to the throne
+    zone_capture = rules.king_captured_with_four_pieces or rules.king_captured_with_two_pieces_except_near_or_on_throne
+    # (moving piece, victim, anvils) of the normal captures; the attackers also capture against the throne
+    sides = [(ATTACKER, DEFENDER, (ATTACKER, THRONE)),
+             (DEFENDER, ATTACKER, (DEFENDER, KING) if rules.armed_king or rules.anvil_king else (DEFENDER,))]
+    if rules.armed_king:
+        sides.append((KING, ATTACKER, (DEFENDER, KING)))
+
+    def is_any(name: str, tiles: tuple) -> str:
+        return ' or '.join(f'{name} == {t}' for t in tiles)
+
+    lines = [
+        'def process_captures(flat, sq):',
+        '    captures = []',
+        '    piece = flat[sq]',
+    ]
+    for k, (piece, victim, anvils) in enumerate(sides):
+        lines += [
+            f'    {"if" if k == 0 else "elif"} piece == {piece}:',
+            '        for n1, n2 in NEIGHBOURS[sq]:',
+            '            middle = flat[n1]',
+            f'            if middle == {victim}:',
+            f'                if n2 >= 0 and ({is_any("flat[n2]", anvils)}):',
+            '                    captures.append(POSITIONS[n1])',
+        ]
+        if piece == ATTACKER:
+            if rules.king_captured_with_two_pieces:
+                lines += [f'            elif middle == {KING}:',
+                          f'                if n2 >= 0 and ({is_any("flat[n2]", (ATTACKER, THRONE))}):',
+                          '                    captures.append(POSITIONS[n1])']
+            elif rules.king_captured_with_two_pieces_except_near_or_on_throne:
+                lines += [f'            elif middle == {KING}:',
+                          f'                if not THRONE_ZONE[n1] and n2 >= 0 and '
+                          f'({is_any("flat[n2]", (ATTACKER, THRONE))}):',
+                          '                    captures.append(POSITIONS[n1])']
+            elif zone_capture:
+                # the king next to an attacker is never captured by the zone rule
+                lines += [f'            elif middle == {KING}:',
+                          '                pass']
+        if zone_capture:
+            lines += [f'            elif ({is_any("middle", PIECES)}) and THRONE_ZONE[n1] and threats(flat, n1) == 4:',
+                      '                captures.append(POSITIONS[n1])']
+    if zone_capture:
+        # the remaining moving pieces can only complete a capture around the throne
+        lines += [
+            '    else:',
+            '        for n1, n2 in NEIGHBOURS[sq]:',
+            '            middle = flat[n1]',
+            f'            if ({is_any("middle", PIECES)}) and THRONE_ZONE[n1] and threats(flat, n1) == 4:',
+            '                captures.append(POSITIONS[n1])',
+        ]
+    lines.append('    return captures')
+
+    threats = (ATTACKER, THRONE) if rules.king_captured_with_two_pieces_except_near_or_on_throne else (ATTACKER,)
+    lines += [
+        '',
+        '',
+        'def threats(flat, sq):',
+        '    n = 0',
+        '    for n1, _ in NEIGHBOURS[sq]:',
+        f'        if {is_any("flat[n1]", threats)}:',
+        '            n += 1',
+        '    return n',
+    ]
+    return '\n'.join(lines)
+
+
+def _compile(source: str, name: str, variant: str, namespace: dict) -> Callable:
+    code = compile(source, f'<gym_tafl kernel {variant}:{name}>', 'exec')
+    exec(code, namespace)
+    return namespace[name]
+
+
+@lru_cache(maxsize=None)
+def make_kernels(variant: str) -> SimpleNamespace:
+    """
+    Generate the move generation and capture kernels specialized for the rules of a variant, once per process. Only
+    the branches of the enabled rules are generated, the others are resolved at generation time.
+
+    The kernels work on the flattened board, where the square `(i, j)` is `i * n_cols + j`:
+
+    - `piece_moves[piece](cells, piece_rays[piece][square])` lists the legal actions of a piece
+    - `process_captures(flat, square)` lists the `(row, col)` positions captured by the piece that moved to the square
+
+    :param variant: The variant name, or the path of a variant file
+    :return: The kernels and their tables
+    """
+    rules = load_rules(variant)
+    rows, cols = rules.n_rows, rules.n_cols
+    throne = (rows // 2, cols // 2)
+    positions = tuple(divmod(sq, cols) for sq in range(rows * cols))
+
+    # ray steps of each piece, limited by the movement rules, with the kind of their target square
+    piece_rays = {}
+    for p in PIECES:
+        limit = None if rules.unrestricted_movement else rules.m_counter[p]
+        piece_rays[p] = tuple(
+            tuple(ray for ray in (tuple((t, action, THRONE_SQUARE if on_throne else
+                                         CORNER_SQUARE if on_corner else NORMAL_SQUARE)
+                                        for t, action, on_throne, on_corner in square_ray[:limit])
+                                  for square_ray in square_rays) if ray)
+            for square_rays in rules.rays)
+    piece_moves = {p: _compile(_moves_source(rules, p), 'piece_moves', rules.variant, {}) for p in PIECES}
+
+    # neighbours at distance 1 and 2 in each direction, the second one is -1 if outside the board
+    neighbours = []
+    for i, j in positions:
+        square_neighbours = []
+        for inc_i, inc_j in DIRECTIONS:
+            if 0 <= i + inc_i < rows and 0 <= j + inc_j < cols:
+                n2 = (i + 2 * inc_i) * cols + j + 2 * inc_j if 0 <= i + 2 * inc_i < rows and \
+                    0 <= j + 2 * inc_j < cols else -1
+                square_neighbours.append(((i + inc_i) * cols + j + inc_j, n2))
+        neighbours.append(tuple(square_neighbours))
+    throne_zone = tuple((i, j) == throne or abs(i - throne[0]) + abs(j - throne[1]) == 1 for i, j in positions)
+    process_captures = _compile(_captures_source(rules), 'process_captures', rules.variant, {
+        'NEIGHBOURS': tuple(neighbours),
+        'POSITIONS': positions,
+        'THRONE_ZONE': throne_zone
+    })
+
+    return SimpleNamespace(piece_rays=piece_rays, piece_moves=piece_moves, process_captures=process_captures)
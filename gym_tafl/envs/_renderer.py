@@ -0,0 +1,280 @@
+import shutil
+import struct
+import subprocess
+import zlib
+from functools import lru_cache
+from typing import Iterable, Union
+
+from gym_tafl.envs._rules import *
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+# sprite of each tile value, the empty squares have none
+TILE_ASSETS = {
+    DEFENDER: 'defender.png',
+    ATTACKER: 'attacker.png',
+    KING: 'king.png',
+    THRONE: 'throne.png',
+    CORNER: 'throne.png'
+}
+# background of the window around the board
+WINDOW_COLOR = (255, 255, 255)
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_CHANNELS = {0: 1, 2: 3, 4: 2, 6: 4}
+
+
+def _paeth(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> np.ndarray:
+    p = a + b - c
+    pa, pb, pc = np.abs(p - a), np.abs(p - b), np.abs(p - c)
+    return np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+
+
+@lru_cache(maxsize=None)
+def read_png(path: str) -> np.ndarray:
+    """
+    Decode an 8 bits, non interlaced PNG image, as the assets are, without any imaging library
+
+    :param path: The image path
+    :return: The `(height, width, 4)` uint8 RGBA image
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert data[:8] == PNG_SIGNATURE, f"[ERR: read_png] {path} is not a PNG image"
+    pos, idat = 8, []
+    width = height = color_type = None
+    while pos < len(data):
+        length, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        chunk = data[pos + 8:pos + 8 + length]
+        if kind == b'IHDR':
+            width, height, depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', chunk)
+            assert depth == 8 and interlace == 0 and color_type in PNG_CHANNELS, \
+                f"[ERR: read_png] Unsupported PNG format in {path}"
+        elif kind == b'IDAT':
+            idat.append(chunk)
+        elif kind == b'IEND':
+            break
+        pos += length + 12
+    bpp = PNG_CHANNELS[color_type]
+    raw = np.frombuffer(zlib.decompress(b''.join(idat)), dtype=np.uint8).reshape(height, width * bpp + 1)
+    pixels = np.zeros((height, width * bpp), dtype=np.uint8)
+    prior = np.zeros(width * bpp, dtype=np.uint8)
+    for y in range(height):
+        kind, row = raw[y, 0], raw[y, 1:]
+        if kind == 0:
+            pixels[y] = row
+        elif kind == 1:
+            pixels[y] = np.cumsum(row.reshape(width, bpp), axis=0, dtype=np.uint8).ravel()
+        elif kind == 2:
+            pixels[y] = row + prior
+        else:
+            # average and Paeth depend on the previous pixel of the row, so they are undone pixel by pixel
+            line = pixels[y].reshape(width, bpp).astype(np.int16)
+            up = prior.reshape(width, bpp).astype(np.int16)
+            left = np.zeros(bpp, dtype=np.int16)
+            up_left = np.zeros(bpp, dtype=np.int16)
+            for x, values in enumerate(row.reshape(width, bpp).astype(np.int16)):
+                if kind == 3:
+                    line[x] = (values + (left + up[x]) // 2) % 256
+                else:
+                    line[x] = (values + _paeth(left, up[x], up_left)) % 256
+                left, up_left = line[x], up[x]
+            pixels[y] = line.ravel().astype(np.uint8)
+        prior = pixels[y]
+    image = pixels.reshape(height, width, bpp)
+    if bpp < 3:
+        image = np.concatenate([image[..., :1]] * 3 + [image[..., 1:]], axis=-1)
+    if image.shape[-1] == 3:
+        image = np.concatenate([image, np.full((height, width, 1), 255, dtype=np.uint8)], axis=-1)
+    return image
+
+
+def write_png(path: str, frame: np.ndarray):
+    """
+    Encode an RGB frame as a PNG image
+
+    :param path: The image path
+    :param frame: The `(height, width, 3)` uint8 frame
+    """
+    height, width, _ = frame.shape
+    raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8),
+                          np.ascontiguousarray(frame, dtype=np.uint8).reshape(height, width * 3)], axis=1)
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    with open(path, 'wb') as f:
+        f.write(PNG_SIGNATURE)
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw.tobytes())))
+        f.write(chunk(b'IEND', b''))
+
+
+def _resize_weights(n_in: int, n_out: int) -> np.ndarray:
+    """
+    Area averaging weights resizing `n_in` pixels to `n_out` ones
+    """
+    edges = np.linspace(0, n_in, n_out + 1)
+    weights = np.zeros((n_out, n_in))
+    for o in range(n_out):
+        for i in range(int(edges[o]), int(np.ceil(edges[o + 1]))):
+            weights[o, i] = min(edges[o + 1], i + 1) - max(edges[o], i)
+    return weights / weights.sum(axis=1, keepdims=True)
+
+
+def load_sprite(path: str, height: int, width: int) -> np.ndarray:
+    """
+    Load an asset scaled to the given size, with the colors premultiplied by the alpha channel
+
+    :param path: The asset path
+    :param height: The sprite height
+    :param width: The sprite width
+    :return: The `(height, width, 4)` float premultiplied RGBA sprite, in [0, 1]
+    """
+    image = read_png(path).astype(np.float64) / 255
+    image[..., :3] *= image[..., 3:]
+    rows, cols = _resize_weights(image.shape[0], height), _resize_weights(image.shape[1], width)
+    return np.einsum('pw,owc->opc', cols, np.einsum('oh,hwc->owc', rows, image))
+
+
+def _over(background: np.ndarray, sprite: np.ndarray) -> np.ndarray:
+    return sprite[..., :3] + background * (1 - sprite[..., 3:])
+
+
+class BoardRenderer:
+    """
+    Headless renderer of the boards of a variant, drawing the same picture as the `human` mode of the environment
+    without any display: the board with its coordinates on the left and bottom sides.
+
+    The assets are loaded and scaled once, and every (tile, square background) pair is composited once as well, so a
+    frame is only a lookup of the square images of its tiles: whole batches of boards are rendered with a single
+    indexing.
+    """
+
+    def __init__(self, variant: str, width: int = SCR_WIDTH, height: int = SCR_HEIGHT):
+        """
+        :param variant: The variant name, or the path of a variant file
+        :param width: The width of the frames, rounded down to a multiple of the number of columns plus one
+        :param height: The height of the frames, rounded down to a multiple of the number of rows plus one
+        """
+        rules = load_rules(variant)
+        rows, cols = rules.n_rows, rules.n_cols
+        self.n_rows, self.n_cols = rows, cols
+        sq_h, sq_w = height // (rows + 1), width // (cols + 1)
+        self.square_height, self.square_width = sq_h, sq_w
+        self.height, self.width = sq_h * (rows + 1), sq_w * (cols + 1)
+
+        # static frame: window, coordinates and the empty board
+        frame = np.empty((self.height, self.width, 3))
+        frame[:] = np.array(WINDOW_COLOR) / 255
+        for k in range(rows):
+            label = load_sprite(os.path.join(ASSETS_DIR, 'rows', f'{k}.png'), sq_h, sq_w)
+            top = (rows - 1 - k) * sq_h
+            frame[top:top + sq_h, :sq_w] = _over(frame[top:top + sq_h, :sq_w], label)
+        for k in range(cols):
+            label = load_sprite(os.path.join(ASSETS_DIR, 'columns', f'{k}.png'), sq_h, sq_w)
+            left = (k + 1) * sq_w
+            frame[rows * sq_h:, left:left + sq_w] = _over(frame[rows * sq_h:, left:left + sq_w], label)
+        colors = [np.array([int(c[i:i + 2], 16) for i in (0, 2, 4)]) / 255 for c in BOARD_COLORS]
+        # the squares alternate colors in the drawing order of the pyglet viewer, column by column from the right and
+        # from the bottom
+        parity = np.zeros((rows, cols), dtype=np.int64)
+        for i in range(rows):
+            for j in range(cols):
+                parity[i, j] = ((cols - 1 - j) * cols + (rows - 1 - i)) % 2
+        # square backgrounds: the two colors, and the throne square
+        backgrounds = [np.broadcast_to(color, (sq_h, sq_w, 3)) for color in colors]
+        throne = load_sprite(os.path.join(ASSETS_DIR, TILE_ASSETS[THRONE]), sq_h, sq_w)
+        square_kind = parity.copy()
+        if not rules.no_throne:
+            backgrounds.append(_over(backgrounds[parity[rows // 2, cols // 2]], throne))
+            square_kind[rows // 2, cols // 2] = 2
+        self.square_kind = square_kind
+        for i in range(rows):
+            for j in range(cols):
+                top, left = i * sq_h, (j + 1) * sq_w
+                frame[top:top + sq_h, left:left + sq_w] = backgrounds[square_kind[i, j]]
+        self.background = np.round(frame * 255).astype(np.uint8)
+
+        # square images by (tile value, square background)
+        n_tiles = max(TILE_ASSETS.keys() | {EMPTY}) + 1
+        squares = np.zeros((n_tiles, len(backgrounds), sq_h, sq_w, 3))
+        for t in range(n_tiles):
+            sprite = load_sprite(os.path.join(ASSETS_DIR, TILE_ASSETS[t]), sq_h, sq_w) if t in TILE_ASSETS else None
+            for b, background in enumerate(backgrounds):
+                squares[t, b] = background if sprite is None else _over(background, sprite)
+        self.squares = np.round(squares * 255).astype(np.uint8)
+
+    def render_batch(self, boards: np.ndarray) -> np.ndarray:
+        """
+        Render a batch of boards
+
+        :param boards: The `(n, rows, cols)` boards
+        :return: The `(n, height, width, 3)` uint8 RGB frames
+        """
+        boards = np.asarray(boards).astype(np.int64)
+        n = boards.shape[0]
+        sq_h, sq_w = self.square_height, self.square_width
+        # (n, rows, cols, sq_h, sq_w, 3) square images, laid out as (n, rows * sq_h, cols * sq_w, 3)
+        cells = self.squares[boards, self.square_kind]
+        frames = np.empty((n, self.height, self.width, 3), dtype=np.uint8)
+        frames[:] = self.background
+        frames[:, :self.n_rows * sq_h, sq_w:] = cells.transpose(0, 1, 3, 2, 4, 5).reshape(
+            n, self.n_rows * sq_h, self.n_cols * sq_w, 3)
+        return frames
+
+    def render(self, board: np.ndarray) -> np.ndarray:
+        """
+        Render a board
+
+        :param board: The `(rows, cols)` board
+        :return: The `(height, width, 3)` uint8 RGB frame
+        """
+        return self.render_batch(board[None])[0]
+
+
+@lru_cache(maxsize=None)
+def make_renderer(variant: str, width: int = SCR_WIDTH, height: int = SCR_HEIGHT) -> BoardRenderer:
+    """
+    Get the renderer of a variant, created once per process and size
+
+    :param variant: The variant name, or the path of a variant file
+    :param width: The width of the frames
+    :param height: The height of the frames
+    :return: The renderer
+    """
+    return BoardRenderer(variant, width, height)
+
+
+def save_video(frames: Union[np.ndarray, Iterable[np.ndarray]], path: str, fps: int = 25, ffmpeg: str = 'ffmpeg'):
+    """
+    Encode frames to a video file with the ffmpeg executable, streaming them so that long videos never have to be kept
+    in memory
+
+    :param frames: The `(n, height, width, 3)` frames, or an iterable of such batches (or of single frames)
+    :param path: The video path, its extension selects the format
+    :param fps: The frames per second
+    :param ffmpeg: The ffmpeg executable
+    """
+    executable = shutil.which(ffmpeg)
+    assert executable is not None, f"[ERR: save_video] {ffmpeg} not found, it is required to write videos"
+    if isinstance(frames, np.ndarray):
+        frames = [frames]
+    process = None
+    try:
+        for batch in frames:
+            batch = np.ascontiguousarray(batch, dtype=np.uint8)
+            if batch.ndim == 3:
+                batch = batch[None]
+            if process is None:
+                height, width = batch.shape[1:3]
+                process = subprocess.Popen([executable, '-y', '-loglevel', 'error',
+                                            '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}',
+                                            '-r', str(fps), '-i', '-',
+                                            '-pix_fmt', 'yuv420p', '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', path],
+                                           stdin=subprocess.PIPE)
+            process.stdin.write(batch.tobytes())
+    finally:
+        if process is not None:
+            process.stdin.close()
+            process.wait()
+    assert process is None or process.returncode == 0, f"[ERR: save_video] ffmpeg failed with code {process.returncode}"
@@ -0,0 +1,207 @@
+import copyreg
+import hashlib
+import pickle
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional
+
+from gym_tafl.envs._utils import *
+from gym_tafl.envs._zobrist import make_zobrist_keys
+from gym_tafl.envs.configs import *
+
+VARIANTS_DIR = os.path.join(PACKAGE_DIR, 'variants')
+# environment variable of the default on-disk cache directory of the compiled rules
+CACHE_DIR_VAR = 'GYM_TAFL_CACHE_DIR'
+# bump when the compiled rules change, to invalidate the on-disk caches
+RULES_VERSION = 2
+
+CHAR_TO_TILE = {
+    'a': ATTACKER,
+    'k': KING,
+    'd': DEFENDER
+}
+
+
+def _read_only(mapping: dict) -> Mapping:
+    """
+    Get a read-only view of a mapping, the type of the tables of the rules
+
+    :param mapping: The mapping
+    :return: The read-only view
+    """
+    return MappingProxyType(mapping)
+
+
+# the read-only tables are pickled (on-disk cache) and deep copied (with the engines) as a copy of their mapping
+copyreg.pickle(MappingProxyType, lambda mapping: (_read_only, (dict(mapping),)))
+
+
+class VariantRules(NamedTuple):
+    """
+    Rules of a variant compiled from its file: geometry, starting board, rule flags and the static tables derived from
+    them. The rules are shared by all the engines of the variant, so their tables are read-only mappings and tuples.
+    """
+    variant: str
+    board: Tuple[str, ...]
+    n_rows: int
+    n_cols: int
+    STARTING_PLAYER: int
+    MAX_MOVES: int
+    GAME_OVER_REWARD: int
+    piece_reward: Mapping[int, int]
+    MAX_REWARD: int
+    # draw conditions
+    draw_after_50_turns_without_capture: bool
+    threefold_repetition_as_draw: bool
+    threefold_repetition_by_position: bool
+    # objective and throne
+    edge_escape: bool
+    no_throne: bool
+    # movement, the maximum distance of each piece is None if unrestricted
+    unrestricted_movement: bool
+    m_counter: Optional[Mapping[int, int]]
+    only_king_can_land_on_throne: bool
+    no_one_can_land_on_throne: bool
+    throne_blocks_all_except_king: bool
+    throne_blocks_all: bool
+    # king power
+    armed_king: bool
+    anvil_king: bool
+    unarmed_king: bool
+    # king capture
+    king_captured_with_two_pieces: bool
+    king_captured_with_two_pieces_except_near_or_on_throne: bool
+    king_captured_with_four_pieces: bool
+    # static tables: action space size, rays of each square (see `make_rays`), move of each action, Zobrist keys
+    n_actions: int
+    rays: tuple
+    action_moves: Tuple[Tuple[int, int, int, int], ...]
+    zobrist_keys: Mapping[int, Tuple[int, ...]]
+    zobrist_side_key: int
+
+
+def variant_file(variant: str) -> str:
+    """
+    Get the file of a variant
+
+    :param variant: The variant name, or the path of a variant file
+    :return: The variant file path
+    """
+    path = variant if variant.endswith('.ini') else os.path.join(VARIANTS_DIR, f'{variant}.ini')
+    assert os.path.isfile(path), f"[ERR variant_file] Unknown variant {variant}"
+    return path
+
+
+def compile_rules(variant: str) -> VariantRules:
+    """
+    Parse a variant file and compile its rules
+
+    :param variant: The variant name, or the path of a variant file
+    :return: The rules
+    """
+    variant_config = configparser.ConfigParser()
+    variant_config.read(variant_file(variant))
+
+    board = tuple(variant_config['VARIANT'].get('board').split(','))
+    n_rows = variant_config['VARIANT'].getint('n_rows')
+    n_cols = variant_config['VARIANT'].getint('n_cols')
+    players = {
+        'ATK': ATK,
+        'DEF': DEF
+    }
+    piece_reward = _read_only({
+        KING: 16,
+        DEFENDER: 2,
+        ATTACKER: -1
+    })
+    game_over_reward = 100
+
+    movement = variant_config['MOVEMENT']
+    unrestricted_movement = movement.getboolean('unrestricted_movement')
+    m_counter = None
+    if not unrestricted_movement:
+        max_steps = max(n_rows, n_cols)
+        m_counter = _read_only({
+            KING: 1 if (movement.getboolean('king_only_moves_1_tile') or
+                        movement.getboolean('all_move_only_1_tile')) else max_steps,
+            ATTACKER: 1 if movement.getboolean('all_move_only_1_tile') else max_steps,
+            DEFENDER: 1 if movement.getboolean('all_move_only_1_tile') else max_steps
+        })
+
+    rays = make_rays(n_rows, n_cols)
+    actions = make_action_codec(n_rows, n_cols).move_tuples
+    zobrist_keys, zobrist_side_key = make_zobrist_keys(n_rows, n_cols)
+
+    return VariantRules(
+        variant=os.path.splitext(os.path.basename(variant))[0],
+        board=board,
+        n_rows=n_rows,
+        n_cols=n_cols,
+        STARTING_PLAYER=players[variant_config['VARIANT'].get('starting_player')],
+        MAX_MOVES=variant_config['VARIANT'].getint('max_moves') - 1,
+        GAME_OVER_REWARD=game_over_reward,
+        piece_reward=piece_reward,
+        # rewards are normalized with the value of all the pieces of the starting board
+        MAX_REWARD=game_over_reward + sum(abs(piece_reward[CHAR_TO_TILE[c.lower()]])
+                                          for row in board for c in row if not c.isdigit()),
+        draw_after_50_turns_without_capture=variant_config['DRAW CONDITION'].getboolean(
+            'draw_after_50_turns_without_capture'),
+        threefold_repetition_as_draw=variant_config['DRAW CONDITION'].getboolean('threefold_repetition_as_draw'),
+        threefold_repetition_by_position=variant_config['DRAW CONDITION'].getboolean(
+            'threefold_repetition_by_position', fallback=False),
+        edge_escape=variant_config['OBJECTIVE'].getboolean('edge_escape'),
+        no_throne=variant_config['THRONE'].getboolean('no_throne'),
+        unrestricted_movement=unrestricted_movement,
+        m_counter=m_counter,
+        only_king_can_land_on_throne=variant_config['THRONE MOVEMENT'].getboolean('only_king_can_land_on_throne'),
+        no_one_can_land_on_throne=variant_config['THRONE MOVEMENT'].getboolean('no_one_can_land_on_throne'),
+        throne_blocks_all_except_king=variant_config['THRONE MOVEMENT'].getboolean('throne_blocks_all_except_king'),
+        throne_blocks_all=variant_config['THRONE MOVEMENT'].getboolean('throne_blocks_all'),
+        armed_king=variant_config['KING POWER'].getboolean('armed_king'),
+        anvil_king=variant_config['KING POWER'].getboolean('anvil_king'),
+        unarmed_king=variant_config['KING POWER'].getboolean('unarmed_king'),
+        king_captured_with_two_pieces=variant_config['KING CAPTURE'].getboolean('king_captured_with_two_pieces'),
+        king_captured_with_two_pieces_except_near_or_on_throne=variant_config['KING CAPTURE'].getboolean(
+            'king_captured_with_two_pieces_except_near_or_on_throne'),
+        king_captured_with_four_pieces=variant_config['KING CAPTURE'].getboolean('king_captured_with_four_pieces'),
+        n_actions=len(actions),
+        rays=rays,
+        action_moves=actions,
+        zobrist_keys=_read_only({t: tuple(keys) for t, keys in zobrist_keys.items()}),
+        zobrist_side_key=zobrist_side_key
+    )
+
+
+@lru_cache(maxsize=None)
+def load_rules(variant: str, cache_dir: str = None) -> VariantRules:
+    """
+    Get the compiled rules of a variant, compiling them only once per process. If a cache directory is given (or set
+    with the GYM_TAFL_CACHE_DIR environment variable), the compiled rules are also stored there and loaded by the
+    other processes, as long as the variant file is unchanged.
+
+    :param variant: The variant name, or the path of a variant file
+    :param cache_dir: The on-disk cache directory, if None only the in-process cache is used
+    :return: The rules
+    """
+    cache_dir = cache_dir or os.environ.get(CACHE_DIR_VAR)
+    if not cache_dir:
+        return compile_rules(variant)
+    digest = hashlib.sha1(str(RULES_VERSION).encode())
+    # the tile and player values are compiled in the rules as well
+    for path in (variant_file(variant), CONFIG_FILE):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    digest = digest.hexdigest()
+    name = os.path.splitext(os.path.basename(variant))[0]
+    cache_file = os.path.join(cache_dir, f'{name}-{digest[:16]}.pickle')
+    if os.path.isfile(cache_file):
+        with open(cache_file, 'rb') as f:
+            return pickle.load(f)
+    rules = compile_rules(variant)
+    os.makedirs(cache_dir, exist_ok=True)
+    # write then rename, so that concurrent processes never read a partial file
+    tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+    with open(tmp_file, 'wb') as f:
+        pickle.dump(rules, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, cache_file)
+    return rules
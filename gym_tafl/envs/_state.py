@@ -0,0 +1,228 @@
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from gym_tafl.envs._zobrist import HashHistory
+from gym_tafl.envs.configs import *
+
+
+class GameState:
+    """
+    Per-game state of a board played through a game engine: the tracked board, the player to move, the pieces on the
+    board and their value, the position hash with the hashes of the previous positions, and the no capture turns
+    counter.
+
+    The engines keep no per-game state of their own, so one engine (and its precomputed tables) can play any number of
+    games, each with its own state passed to the engine methods. Backends keeping more state per game extend this class.
+    """
+    __slots__ = ('board', 'player', 'piece_counts', 'material', 'hash', 'history', 'no_capture_turns_counter')
+
+    def __init__(self, player: int = None):
+        """
+        :param player: The player to move
+        """
+        self.board: Optional[np.ndarray] = None
+        self.player = player
+        self.piece_counts: Dict[int, int] = {KING: 0, DEFENDER: 0, ATTACKER: 0}
+        self.material = 0
+        self.hash = 0
+        self.history = HashHistory()
+        self.no_capture_turns_counter = 0
+
+    def copy(self) -> 'GameState':
+        """
+        Copy the state, board and history included
+
+        :return: The copy
+        """
+        state = self.__class__.__new__(self.__class__)
+        state.board = None if self.board is None else self.board.copy()
+        state.player = self.player
+        state.piece_counts = dict(self.piece_counts)
+        state.material = self.material
+        state.hash = self.hash
+        state.history = self.history.copy()
+        state.no_capture_turns_counter = self.no_capture_turns_counter
+        return state
+
+    def __repr__(self) -> str:
+        return (f"{self.__class__.__name__}(player={self.player}, pieces={self.piece_counts}, hash={self.hash:#018x}, "
+                f"plies={len(self.history) - 1}, no_capture_turns={self.no_capture_turns_counter})")
+
+
+# number of recent actions kept by a compact game state, the moves history of the threefold repetition check
+RECENT_ACTIONS = 8
+
+
+@lru_cache(maxsize=None)
+def compact_state_dtype(n_rows: int, n_cols: int) -> np.dtype:
+    """
+    Get the record type of the compact game states of a board geometry, as stored by `to_bytes` and `pack_states`
+
+    :param n_rows: The number of rows of the board
+    :param n_cols: The number of columns of the board
+    :return: The little endian structured dtype, with no padding
+    """
+    n_actions = n_rows * n_cols * (n_rows + n_cols - 2)
+    assert n_actions <= np.iinfo(np.uint16).max + 1, \
+        f"[ERR: compact_state_dtype] {n_actions} actions do not fit the uint16 recent actions"
+    return np.dtype([('player', np.int8),
+                     ('done', np.bool_),
+                     # ring buffer of the recent actions, the next one is written at `head`
+                     ('head', np.uint8),
+                     ('n_recent', np.uint8),
+                     ('n_moves', '<u2'),
+                     ('no_capture_turns', '<u2'),
+                     ('recent', '<u2', (RECENT_ACTIONS,)),
+                     ('board', np.int8, (n_rows, n_cols))])
+
+
+class CompactGameState:
+    """
+    Compact state of a game in progress, enough to resume it: the int8 board, the player to move, whether the game is
+    over, the moves and no capture turns counters, and a ring buffer of the last `RECENT_ACTIONS` uint16 actions.
+
+    The whole state is a single fixed size record (105 bytes on a 9x9 board, see `compact_state_dtype`): `copy` is one
+    memory copy, `to_bytes` is the record itself, and many states can be packed into one structured array with
+    `pack_states`, whose rows `unpack_states` wraps without copying. The hashes of the previous positions are not kept,
+    so a resumed game only detects the repetitions of positions (for the variants checking them) played after resuming.
+    """
+    __slots__ = ('record',)
+
+    def __init__(self, record: np.ndarray):
+        """
+        :param record: The 0-d `compact_state_dtype` record of the state, shared and not copied
+        """
+        self.record = record
+
+    @classmethod
+    def empty(cls, n_rows: int, n_cols: int) -> 'CompactGameState':
+        """
+        Create an empty state, with no pieces on the board and no moves played
+
+        :param n_rows: The number of rows of the board
+        :param n_cols: The number of columns of the board
+        :return: The state
+        """
+        return cls(np.zeros((), dtype=compact_state_dtype(n_rows, n_cols)))
+
+    @property
+    def board(self) -> np.ndarray:
+        """
+        The int8 board, a view on the state
+        """
+        return self.record['board']
+
+    @property
+    def player(self) -> int:
+        return int(self.record['player'])
+
+    @player.setter
+    def player(self, player: int):
+        self.record['player'] = player
+
+    @property
+    def done(self) -> bool:
+        return bool(self.record['done'])
+
+    @done.setter
+    def done(self, done: bool):
+        self.record['done'] = done
+
+    @property
+    def n_moves(self) -> int:
+        return int(self.record['n_moves'])
+
+    @n_moves.setter
+    def n_moves(self, n_moves: int):
+        self.record['n_moves'] = n_moves
+
+    @property
+    def no_capture_turns(self) -> int:
+        return int(self.record['no_capture_turns'])
+
+    @no_capture_turns.setter
+    def no_capture_turns(self, no_capture_turns: int):
+        self.record['no_capture_turns'] = no_capture_turns
+
+    def push_action(self, action: int):
+        """
+        Add an action to the recent actions, overwriting the oldest one when the ring buffer is full
+
+        :param action: The action
+        """
+        record = self.record
+        head = int(record['head'])
+        record['recent'][head] = action
+        record['head'] = (head + 1) % RECENT_ACTIONS
+        record['n_recent'] = min(int(record['n_recent']) + 1, RECENT_ACTIONS)
+
+    def recent_actions(self) -> List[int]:
+        """
+        Get the recent actions
+
+        :return: The actions, from the oldest to the last one
+        """
+        record = self.record
+        n, head = int(record['n_recent']), int(record['head'])
+        return record['recent'][(head - n + np.arange(n)) % RECENT_ACTIONS].tolist()
+
+    def copy(self) -> 'CompactGameState':
+        """
+        Copy the state
+
+        :return: The copy
+        """
+        return CompactGameState(self.record.copy())
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialize the state
+
+        :return: The record bytes
+        """
+        return self.record.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, n_rows: int, n_cols: int) -> 'CompactGameState':
+        """
+        Deserialize a state serialized with `to_bytes`
+
+        :param data: The record bytes
+        :param n_rows: The number of rows of the board
+        :param n_cols: The number of columns of the board
+        :return: The state
+        """
+        dtype = compact_state_dtype(n_rows, n_cols)
+        assert len(data) == dtype.itemsize, \
+            f"[ERR: CompactGameState] Expected {dtype.itemsize} bytes for a {n_rows}x{n_cols} board, got {len(data)}"
+        return cls(np.frombuffer(data, dtype=dtype).reshape(()).copy())
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CompactGameState) and self.to_bytes() == other.to_bytes()
+
+    def __repr__(self) -> str:
+        return (f"CompactGameState(player={self.player}, done={self.done}, n_moves={self.n_moves}, "
+                f"no_capture_turns={self.no_capture_turns}, recent={self.recent_actions()})")
+
+
+def pack_states(states: Sequence[CompactGameState]) -> np.ndarray:
+    """
+    Pack compact states of the same board geometry into one array
+
+    :param states: The states
+    :return: The `(n,)` structured array of their records
+    """
+    assert len(states) > 0, "[ERR: pack_states] No states to pack"
+    return np.array([state.record for state in states], dtype=states[0].record.dtype)
+
+
+def unpack_states(packed: np.ndarray) -> List[CompactGameState]:
+    """
+    Wrap the records of a packed array into compact states, without copying them: the states are views on the array
+
+    :param packed: The `(n,)` structured array made by `pack_states` (or `TaflVecEnv.get_states`)
+    :return: The states
+    """
+    return [CompactGameState(packed[i:i + 1].reshape(())) for i in range(len(packed))]
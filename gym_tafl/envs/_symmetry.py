@@ -0,0 +1,152 @@
+from functools import lru_cache
+from typing import Union
+
+from gym_tafl.envs._rules import *
+from gym_tafl.envs._zobrist import HASHED_TILES
+
+# transformations of the square (i, j) of a board with `r` rows and `c` cols, by symmetry index; the last four ones swap
+# rows and cols, so they only exist for square boards
+SYMMETRIES = (
+    ('identity', lambda i, j, r, c: (i, j)),
+    ('flip_rows', lambda i, j, r, c: (r - 1 - i, j)),
+    ('flip_cols', lambda i, j, r, c: (i, c - 1 - j)),
+    ('rotate_180', lambda i, j, r, c: (r - 1 - i, c - 1 - j)),
+    ('transpose', lambda i, j, r, c: (j, i)),
+    ('rotate_90', lambda i, j, r, c: (j, r - 1 - i)),
+    ('rotate_270', lambda i, j, r, c: (c - 1 - j, i)),
+    ('anti_transpose', lambda i, j, r, c: (c - 1 - j, r - 1 - i))
+)
+
+
+class BoardSymmetries:
+    """
+    Symmetries of the board of a variant: the rotations and reflections of the square, or only the reflections and the
+    half turn for rectangular boards. The rules of all the variants are invariant under them, as the throne is at the
+    center and the corners and edges map to themselves.
+
+    A symmetry moves the piece on square `sq` to `squares[k, sq]`, and the action `a` becomes `actions[k, a]`. The
+    `gather_*` tables are the inverse permutations, transforming flat arrays by indexing: `flat[..., gather_squares[k]]`
+    is the transformed board and `policy[..., gather_actions[k]]` the transformed policy.
+    """
+
+    def __init__(self, variant: str):
+        """
+        :param variant: The variant name, or the path of a variant file
+        """
+        rules = load_rules(variant)
+        rows, cols = rules.n_rows, rules.n_cols
+        self.n_rows, self.n_cols = rows, cols
+        self.names = tuple(name for name, _ in SYMMETRIES[:8 if rows == cols else 4])
+        self.n_symmetries = len(self.names)
+
+        n_squares = rows * cols
+        self.squares = np.zeros((self.n_symmetries, n_squares), dtype=np.int64)
+        for k, (_, transform) in enumerate(SYMMETRIES[:self.n_symmetries]):
+            for sq in range(n_squares):
+                i, j = transform(sq // cols, sq % cols, rows, cols)
+                self.squares[k, sq] = i * cols + j
+        move_to_action = {move: action for action, move in enumerate(rules.action_moves)}
+        self.actions = np.zeros((self.n_symmetries, rules.n_actions), dtype=np.int64)
+        for k in range(self.n_symmetries):
+            for action, (fi, fj, ti, tj) in enumerate(rules.action_moves):
+                f_sq, t_sq = self.squares[k, fi * cols + fj], self.squares[k, ti * cols + tj]
+                self.actions[k, action] = move_to_action[(f_sq // cols, f_sq % cols, t_sq // cols, t_sq % cols)]
+        self.gather_squares = np.argsort(self.squares, axis=1)
+        self.gather_actions = np.argsort(self.actions, axis=1)
+        # symmetry undoing each symmetry, e.g. to map back a move found on the canonical board
+        self.inverse = np.array([next(m for m in range(self.n_symmetries)
+                                      if np.array_equal(self.squares[m], self.gather_squares[k]))
+                                 for k in range(self.n_symmetries)])
+
+        # Zobrist keys by tile value of each square after each symmetry, zero for the tiles that are not hashed
+        n_tiles = max(HASHED_TILES + (EMPTY,)) + 1
+        keys = np.zeros((n_tiles, n_squares), dtype=np.uint64)
+        for t in HASHED_TILES:
+            keys[t] = rules.zobrist_keys[t]
+        self.zobrist_keys = keys[:, self.squares]
+        self.zobrist_side_key = np.uint64(rules.zobrist_side_key)
+
+    def transform_boards(self, boards: np.ndarray, symmetry: Union[int, np.ndarray]) -> np.ndarray:
+        """
+        Transform boards
+
+        :param boards: The `(rows, cols)` board or `(n, rows, cols)` boards
+        :param symmetry: The symmetry index, or the `(n,)` symmetry indices of each board
+        :return: The transformed boards, with the shape of the given ones
+        """
+        flat = boards.reshape(boards.shape[:-2] + (self.n_rows * self.n_cols,))
+        if np.ndim(symmetry) == 0:
+            return flat[..., self.gather_squares[symmetry]].reshape(boards.shape)
+        return np.take_along_axis(flat, self.gather_squares[symmetry], axis=-1).reshape(boards.shape)
+
+    def transform_policies(self, policies: np.ndarray, symmetry: Union[int, np.ndarray]) -> np.ndarray:
+        """
+        Transform policies (or legal action masks) over the action space
+
+        :param policies: The `(n_actions,)` policy or `(n, n_actions)` policies
+        :param symmetry: The symmetry index, or the `(n,)` symmetry indices of each policy
+        :return: The transformed policies
+        """
+        if np.ndim(symmetry) == 0:
+            return policies[..., self.gather_actions[symmetry]]
+        return np.take_along_axis(policies, self.gather_actions[symmetry], axis=-1)
+
+    def augment(self, boards: np.ndarray, policies: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Augment training pairs with all the symmetries
+
+        :param boards: The `(n, rows, cols)` boards
+        :param policies: The `(n, n_actions)` policies
+        :return: The `(n_symmetries * n, rows, cols)` boards and `(n_symmetries * n, n_actions)` policies, grouped by
+            symmetry
+        """
+        flat = boards.reshape(boards.shape[0], -1)
+        return (flat[:, self.gather_squares].transpose(1, 0, 2).reshape((-1,) + boards.shape[1:]),
+                policies[:, self.gather_actions].transpose(1, 0, 2).reshape(-1, policies.shape[1]))
+
+    def hashes(self, board: np.ndarray, player: int) -> np.ndarray:
+        """
+        Compute the Zobrist hashes of a position under all the symmetries
+
+        :param board: The board
+        :param player: The player to move
+        :return: The `(n_symmetries,)` hashes, the first one is the hash of the position itself
+        """
+        flat = board.ravel().astype(np.int64)
+        h = np.bitwise_xor.reduce(self.zobrist_keys[flat, :, np.arange(flat.shape[0])], axis=0)
+        return h ^ self.zobrist_side_key if player == ATK else h
+
+    def canonical_hash(self, board: np.ndarray, player: int) -> Tuple[int, int]:
+        """
+        Compute the hash of the canonical form of a position: the smallest hash of its symmetric positions, shared by
+        all of them
+
+        :param board: The board
+        :param player: The player to move
+        :return: The canonical hash, and the symmetry transforming the position into its canonical form
+        """
+        hashes = self.hashes(board, player)
+        k = int(np.argmin(hashes))
+        return int(hashes[k]), k
+
+    def canonical_board(self, board: np.ndarray, player: int) -> Tuple[np.ndarray, int]:
+        """
+        Transform a position into its canonical form, the one with the canonical hash
+
+        :param board: The board
+        :param player: The player to move
+        :return: The canonical board, and the symmetry transforming the board into it
+        """
+        _, k = self.canonical_hash(board, player)
+        return self.transform_boards(board, k), k
+
+
+@lru_cache(maxsize=None)
+def make_symmetries(variant: str) -> BoardSymmetries:
+    """
+    Get the board symmetries of a variant, computed once per process
+
+    :param variant: The variant name, or the path of a variant file
+    :return: The symmetries
+    """
+    return BoardSymmetries(variant)
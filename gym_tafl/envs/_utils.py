@@ -1,4 +1,5 @@
-from typing import Tuple, List
+from functools import lru_cache
+from typing import Dict, List, Tuple, Union
 
 import numpy as np
 
@@ -8,9 +9,6 @@ DIRECTIONS = [(-1, 0),  # up
               (0, -1)  # left
               ]
 
-IDX_TO_POS = {}
-POS_TO_IDX = {}
-
 
 def decimal_to_space(value: int, rows: int, cols: int) -> Tuple[int, int, int, int]:
     """
@@ -22,11 +20,10 @@ def decimal_to_space(value: int, rows: int, cols: int) -> Tuple[int, int, int, i
     :param cols: The number of cols
     :return: The 4D tuple representation
     """
-    if len(IDX_TO_POS.keys()) == 0:
-        make_dictionaries(rows, cols)
+    codec = make_action_codec(rows, cols)
     assert value >= 0, f'[Conversion error]: Value is negative: {value}'
-    assert value in IDX_TO_POS.keys(), f'[Conversion error]: Invalid index value {value}'
-    return IDX_TO_POS.get(value)
+    assert value < codec.n_actions, f'[Conversion error]: Invalid index value {value}'
+    return codec.decode(value)
 
 
 def space_to_decimal(values: Tuple[int, int, int, int], rows: int, cols: int) -> int:
@@ -39,19 +36,20 @@ def space_to_decimal(values: Tuple[int, int, int, int], rows: int, cols: int) ->
     :param cols: The number of cols
     :return: The decimal representation
     """
-    if len(IDX_TO_POS.keys()) == 0:
-        make_dictionaries(rows, cols)
+    codec = make_action_codec(rows, cols)
     assert len(values) == 4, f'[Conversion error]: Unknown space value {values}'
     fi, fj, ti, tj = values
     assert fi < rows, f'[Conversion error]: From {values}: Invalid fi {fi} in [{rows}, {cols}, {rows}, {cols}]'
     assert fj < cols, f'[Conversion error]: From {values}: Invalid fj {fj} in [{rows}, {cols}, {rows}, {cols}]'
     assert ti < rows, f'[Conversion error]: From {values}: Invalid ti {ti} in [{rows}, {cols}, {rows}, {cols}]'
     assert tj < cols, f'[Conversion error]: From {values}: Invalid tj {tj} in [{rows}, {cols}, {rows}, {cols}]'
-    assert values in POS_TO_IDX.keys(), f'[Conversion error]: Invalid space value {values}'
-    return POS_TO_IDX.get(values)
+    action = codec.move_actions.get(tuple(values))
+    assert action is not None, f'[Conversion error]: Invalid space value {values}'
+    return action
 
 
-def make_dictionaries(rows: int, cols: int):
+def make_dictionaries(rows: int, cols: int) -> Tuple[Dict[int, Tuple[int, int, int, int]],
+                                                      Dict[Tuple[int, int, int, int], int]]:
     """
     Since we have that a move is
 
@@ -68,22 +66,148 @@ def make_dictionaries(rows: int, cols: int):
     .. math::
         index \\leftrightarrow (row_from , col_from , row_to , col_to)
 
-    relation.
+    relation. The encoding itself is kept by the `ActionCodec` of the geometry.
 
     :param rows: The number of rows
     :param cols: The number of columns
+    :return: The index to move and move to index dictionaries
+    """
+    codec = make_action_codec(rows, cols)
+    return dict(enumerate(codec.move_tuples)), dict(codec.move_actions)
+
+
+@lru_cache(maxsize=None)
+def make_rays(rows: int, cols: int) -> Tuple[Tuple[Tuple[Tuple[int, int, bool, bool], ...], ...], ...]:
     """
+    Precompute the rays of the board: for every square `i * cols + j` and every direction in `DIRECTIONS`, the ordered
+    targets `(square, action, on_throne, on_corner)`, from the closest to the farthest, where the action is the index
+    of the move in the `make_dictionaries` encoding.
+    The rays only depend on the board geometry, so they are computed once and shared.
+
+    :param rows: The number of rows
+    :param cols: The number of columns
+    :return: The rays of each square
+    """
+    throne = (rows // 2, cols // 2)
+    corners = [(0, 0), (0, cols - 1), (rows - 1, cols - 1), (rows - 1, 0)]
+    rays = []
     c = 0
     for i in range(rows):
         for j in range(cols):
+            square_rays = []
             for inc_i, inc_j in DIRECTIONS:
+                ray = []
                 s_i, s_j = i, j
                 while 0 <= s_i + inc_i < rows and 0 <= s_j + inc_j < cols:
                     s_i += inc_i
                     s_j += inc_j
-                    IDX_TO_POS[c] = (i, j, s_i, s_j)
-                    POS_TO_IDX[(i, j, s_i, s_j)] = c
+                    ray.append((s_i * cols + s_j, c, (s_i, s_j) == throne, (s_i, s_j) in corners))
                     c += 1
+                square_rays.append(tuple(ray))
+            rays.append(tuple(square_rays))
+    return tuple(rays)
+
+
+class ActionCodec:
+    """
+    Encoding of the moves `(row_from, col_from, row_to, col_to)` of a board geometry as action indices, in the
+    `make_rays` order: by origin square, then direction, then distance.
+
+    The encoding is kept as arrays, so that batches of actions are encoded and decoded with a single indexing; `decode`
+    and `encode` are the scalar fast paths, with no validation.
+    """
+
+    def __init__(self, rows: int, cols: int):
+        """
+        :param rows: The number of rows
+        :param cols: The number of columns
+        """
+        self.n_rows, self.n_cols = rows, cols
+        moves = []
+        for sq, square_rays in enumerate(make_rays(rows, cols)):
+            for ray in square_rays:
+                for t, _, _, _ in ray:
+                    moves.append((sq // cols, sq % cols, t // cols, t % cols))
+        self.n_actions = len(moves)
+        # move of each action, as tuples for the scalar path and as an (n_actions, 4) array for the batches
+        self.move_tuples: Tuple[Tuple[int, int, int, int], ...] = tuple(moves)
+        self.moves = np.array(moves, dtype=np.int64).reshape(-1, 4)
+        self.from_squares = self.moves[:, 0] * cols + self.moves[:, 1]
+        self.to_squares = self.moves[:, 2] * cols + self.moves[:, 3]
+        # action of each (origin square, destination square), -1 if not a straight line move
+        self.square_actions = np.full((rows * cols, rows * cols), -1, dtype=np.int64)
+        self.square_actions[self.from_squares, self.to_squares] = np.arange(self.n_actions)
+        self.move_actions = {move: action for action, move in enumerate(moves)}
+        for array in (self.moves, self.from_squares, self.to_squares, self.square_actions):
+            array.flags.writeable = False
+
+    def decode(self, action: int) -> Tuple[int, int, int, int]:
+        """
+        Decode an action
+
+        :param action: The action
+        :return: The move
+        """
+        return self.move_tuples[action]
+
+    def encode(self, move: Tuple[int, int, int, int]) -> int:
+        """
+        Encode a move
+
+        :param move: The move, a straight line one
+        :return: The action
+        """
+        return self.move_actions[move]
+
+    def decode_batch(self, actions: np.ndarray) -> np.ndarray:
+        """
+        Decode a batch of actions
+
+        :param actions: The actions, of any shape
+        :return: The moves, with a last dimension of 4 added to the actions shape
+        """
+        return self.moves[actions]
+
+    def encode_batch(self, moves: np.ndarray) -> np.ndarray:
+        """
+        Encode a batch of moves
+
+        :param moves: The moves, with a last dimension of 4
+        :return: The actions, -1 for the moves that are not straight line moves
+        """
+        moves = np.asarray(moves)
+        return self.square_actions[moves[..., 0] * self.n_cols + moves[..., 1],
+                                   moves[..., 2] * self.n_cols + moves[..., 3]]
+
+    def sample(self, policies: np.ndarray,
+               rng: Union[np.random.Generator, np.random.RandomState] = None) -> np.ndarray:
+        """
+        Sample an action from each policy, without a Python call per action
+
+        :param policies: The `(n, n_actions)` non negative policies, for example the probabilities masked with the
+            legal actions masks; they don't have to be normalized but each one must have a positive sum
+        :param rng: The random generator, either a `Generator` or a `RandomState`, the global NumPy one if None
+        :return: The `(n,)` sampled actions
+        """
+        rng = rng or np.random
+        cdf = np.cumsum(policies, axis=1)
+        assert np.all(cdf[:, -1] > 0), \
+            f"[ERR: sample] Policies without any positive probability: {np.flatnonzero(cdf[:, -1] <= 0)}"
+        draws = rng.random(len(policies)) * cdf[:, -1]
+        actions = (cdf <= draws[:, None]).sum(axis=1)
+        return np.minimum(actions, self.n_actions - 1)
+
+
+@lru_cache(maxsize=None)
+def make_action_codec(rows: int, cols: int) -> ActionCodec:
+    """
+    Get the action codec of a board geometry, created once per process
+
+    :param rows: The number of rows
+    :param cols: The number of columns
+    :return: The action codec
+    """
+    return ActionCodec(rows, cols)
 
 
 def vector_mask(vector: np.array, valid_indexes: np.array) -> np.array:
@@ -95,9 +219,10 @@ def vector_mask(vector: np.array, valid_indexes: np.array) -> np.array:
     :return: A mask array with the same shape of vector
     """
     mask = np.zeros(vector.shape)
-    for index in valid_indexes:
-        assert index < len(vector), f'Invalid index {index} for vector with length {len(vector)}'
-        mask[index] = 1
+    valid_indexes = np.asarray(valid_indexes, dtype=int)
+    assert np.all(valid_indexes < len(vector)), \
+        f'Invalid index {valid_indexes.max()} for vector with length {len(vector)}'
+    mask[valid_indexes] = 1
     return mask
 
 
@@ -114,6 +239,22 @@ def position_as_str(position: Tuple[int, int], rows: int) -> str:
     return col + str(row)
 
 
+def move_as_str(move: Tuple[int, int, int, int], captured: List[Tuple[int, int]], rows: int) -> str:
+    """
+    Convert a move and its captures to the notation used in the info dict, e.g. `E1-E3xD3`
+
+    :param move: The move
+    :param captured: The positions `(row, col)` of the captured pieces
+    :param rows: The number of rows in the board
+    :return: The move as string
+    """
+    fi, fj, ti, tj = move
+    notation = position_as_str((fi, fj), rows).upper() + '-' + position_as_str((ti, tj), rows).upper()
+    for position in captured:
+        notation += 'x' + position_as_str(position, rows).upper()
+    return notation
+
+
 # TODO: This will break with size > 9
 
 def position_as_tuple(position: str, rows: int) -> Tuple[int, int]:
@@ -0,0 +1,103 @@
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from gym_tafl.envs.configs import *
+
+# tiles contributing to the hash of a position
+HASHED_TILES = (KING, DEFENDER, ATTACKER, THRONE, CORNER)
+
+
+@lru_cache(maxsize=None)
+def make_zobrist_keys(rows: int, cols: int, seed: int = 0) -> Tuple[Dict[int, List[int]], int]:
+    """
+    Generate the random 64 bits Zobrist keys of a board geometry: one for every hashed tile on every square, and one
+    for the side to move. The keys are deterministic for a given seed, so hashes are comparable across processes.
+
+    :param rows: The number of rows
+    :param cols: The number of columns
+    :param seed: The random seed
+    :return: The keys of each tile by square, and the side to move key
+    """
+    rng = np.random.RandomState(seed)
+    keys = rng.randint(0, 2 ** 63, size=(len(HASHED_TILES), rows * cols), dtype=np.int64).astype(np.uint64)
+    keys = keys ^ (rng.randint(0, 2, size=keys.shape, dtype=np.int64).astype(np.uint64) << np.uint64(63))
+    side_key = int(rng.randint(1, 2 ** 63, dtype=np.int64))
+    return {t: keys[i].tolist() for i, t in enumerate(HASHED_TILES)}, side_key
+
+
+def zobrist_hash(board: np.array, player: int, keys: Dict[int, List[int]], side_key: int) -> int:
+    """
+    Compute the Zobrist hash of a position from scratch
+
+    :param board: The board
+    :param player: The player to move
+    :param keys: The keys of each tile by square
+    :param side_key: The side to move key
+    :return: The hash of the position
+    """
+    h = side_key if player == ATK else 0
+    for sq, t in enumerate(board.ravel().tolist()):
+        if t in keys:
+            h ^= keys[t][sq]
+    return h
+
+
+class HashHistory:
+    """
+    Stack of the hashes of the positions of a game, counting how many times each position occurred
+    """
+
+    def __init__(self):
+        self.hashes = []
+        self.counts = {}
+
+    def push(self, h: int):
+        """
+        Add a position
+
+        :param h: The position hash
+        """
+        self.hashes.append(h)
+        self.counts[h] = self.counts.get(h, 0) + 1
+
+    def pop(self) -> int:
+        """
+        Remove the last position
+
+        :return: The removed position hash
+        """
+        h = self.hashes.pop()
+        if self.counts[h] == 1:
+            del self.counts[h]
+        else:
+            self.counts[h] -= 1
+        return h
+
+    def count(self, h: int) -> int:
+        """
+        Count the occurrences of a position
+
+        :param h: The position hash
+        :return: The number of times the position occurred
+        """
+        return self.counts.get(h, 0)
+
+    def copy(self) -> 'HashHistory':
+        """
+        Copy the history
+
+        :return: The copy
+        """
+        history = HashHistory()
+        history.hashes = list(self.hashes)
+        history.counts = dict(self.counts)
+        return history
+
+    def clear(self):
+        self.hashes.clear()
+        self.counts.clear()
+
+    def __len__(self) -> int:
+        return len(self.hashes)
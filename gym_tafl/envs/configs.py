@@ -1,11 +1,12 @@
 import configparser
 import os
 
-curr_dir = os.getcwd()
-config_file = os.path.join(curr_dir, 'configs.ini')
+# the configuration and the variants are looked up in the package directory, whatever the working directory
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_FILE = os.path.join(PACKAGE_DIR, 'configs.ini')
 
 config = configparser.ConfigParser()
-config.read(config_file)
+config.read(CONFIG_FILE)
 
 # tile values
 EMPTY = config['TILES'].getint('empty')
@@ -24,3 +25,15 @@ DRAW = config['PLAYERS'].getint('draw')
 SCR_WIDTH = config['GRAPHIC'].getint('scr_width')
 SCR_HEIGHT = config['GRAPHIC'].getint('scr_height')
 BOARD_COLORS = config['GRAPHIC'].get('board_colors').split(',')
+
+# game end reasons, stored by their index in the shared arrays of the processes pool, in the game records and in the
+# server protocol: new reasons are appended, the existing ones never change index
+REASONS = ('',
+           'King escaped',
+           'King was captured',
+           'Moves limit reached',
+           'Threefold repetition',
+           '50 turns with no capture',
+           'Opponents has no moves available',
+           'Endgame tablebase')
+REASON_CODES = {reason: code for code, reason in enumerate(REASONS)}
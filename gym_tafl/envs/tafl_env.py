@@ -1,8 +1,16 @@
+from collections import deque
+from typing import Deque
+
 import gym
 from gym import spaces, logger
 from gym.utils import seeding
 
+from gym_tafl.envs._engines import make_game_engine
+from gym_tafl.envs._features import FeaturePlanes
 from gym_tafl.envs._game_engine import *
+from gym_tafl.envs._instrumentation import *
+from gym_tafl.envs._renderer import make_renderer
+from gym_tafl.envs._state import RECENT_ACTIONS, CompactGameState
 from gym_tafl.envs._utils import *
 from gym_tafl.envs.configs import *
 
@@ -13,32 +21,64 @@ class TaflEnv(gym.Env):
         'video.frames_per_second': 25
     }
 
-    def __init__(self):
+    def __init__(self,
+                 backend: str = 'numpy',
+                 compact_observations: bool = False,
+                 training_mode: bool = False,
+                 tablebase=None,
+                 feature_planes: bool = False,
+                 history_length: int = 8,
+                 **engine_kwargs):
         """
         Create the environment
+
+        :param backend: The game engine backend, one of 'numpy', 'bitboard' or 'incremental'
+        :param compact_observations: If True, the board is an int8 array instead of a float64 one
+        :param training_mode: If True, the actions and moves are not validated beyond the legal actions mask, and the
+            move notation is left out of the info dict (it is still available with `last_move_str`)
+        :param tablebase: An endgame `Tablebase`: when a move reaches one of its positions, the game ends with the exact
+            result, the `distance` of the result with perfect play is added to the info dict. If the tablebase gives
+            the win to the player who moved, the game over reward of a king escape or capture is added to the reward of
+            the move, as if the game was played out; a draw or a loss adds nothing
+        :param feature_planes: If True, the observation is the `(n_planes, rows, cols)` float32 stack of `FeaturePlanes`
+            instead of the board, updated in place at every step
+        :param history_length: The number of positions in the feature planes, the current one included
+        :param engine_kwargs: Additional game engine backend options
         """
         # game variables
         self.variant = 'tablut'
-        self.game_engine = GameEngine(self.variant)
+        self.backend = backend
+        self.engine_kwargs = engine_kwargs
+        self.board_dtype = np.int8 if compact_observations else np.float64
+        self.training_mode = training_mode
+        self.tablebase = tablebase
+        self.feature_planes = feature_planes
+        self.history_length = history_length
+        self.features: Optional[FeaturePlanes] = None
+        self.planes: Optional[np.ndarray] = None
+        self.game_engine = self._make_engine()
         self.n_rows = self.game_engine.n_rows
         self.n_cols = self.game_engine.n_cols
-        self.board = np.zeros((self.n_rows, self.n_cols))
+        self.board = np.zeros((self.n_rows, self.n_cols), dtype=self.board_dtype)
         self.player = self.game_engine.STARTING_PLAYER
-        self.last_moves: List[Tuple[int, int, int, int]] = []
+        # short-term moves history, for the threefold repetition check
+        self.last_moves: Deque[Tuple[int, int, int, int]] = deque(maxlen=RECENT_ACTIONS)
         self.n_moves = 0
+        # undo record of the last move, for the move notation
+        self._last_undo = None
         # environment variables
         # from(row, col) -> to(row, col)
         self.action_space = None
         self.valid_actions = None
+        # boolean mask of the valid actions, updated in place
+        self.action_mask = np.zeros(self.game_engine.n_actions, dtype=bool)
         self.observation_space = None
         self.done = False
         self.steps_beyond_done = None
         self.viewer = None
-        self.np_random = seeding.np_random(0)
-        # location independent assets directory
-        self.assets = {}
-        self.square_width = 0
-        self.square_height = 0
+        self.np_random, _ = seeding.np_random(0)
+        # profiling statistics, None unless enabled with `enable_stats`
+        self.stats: Optional[PerfStats] = None
 
     def step(self, action: int) -> Tuple[np.ndarray, int, bool, dict]:
         """
@@ -46,28 +86,33 @@ class TaflEnv(gym.Env):
 
         :param action: The action to apply
         """
-        assert self.action_space.contains(action), f"[ERR: step] Unrecognized action: {action}"
-        assert action in self.valid_actions, f"[ERR: step] Invalid action: {action}"
+        if not self.training_mode:
+            assert self.action_space.contains(action), f"[ERR: step] Unrecognized action: {action}"
+        assert self.action_mask[action], f"[ERR: step] Invalid action: {action}"
 
         info = {}  # TODO: Info should be handled by game engine
         if self.done:
             logger.warn('Stop calling `step()` after the episode is done! Use `reset()`')
             reward = 0
         else:
-            move = decimal_to_space(action, self.board.shape[0], self.board.shape[1])
-            res = self.game_engine.apply_move(self.board, move)
-            move_str = res.get('move')
-            info['move'] = move_str
-            reward = res.get('reward')
-            logger.debug(
-                f"[{str(self.n_moves + 1).zfill(int(np.log10(self.game_engine.MAX_MOVES)) + 1)}/{self.game_engine.MAX_MOVES + 1}] "
-                f"{'ATK' if self.player == ATK else 'DEF'} : {move_str}")
-            if res.get('game_over', False):
+            move = self.game_engine.action_moves[action]
+            self._last_undo, game_over = self.game_engine.make_move(self.board, move)
+            if self.features is not None:
+                self.features.apply_move(0, self._last_undo)
+            reward = self.game_engine.move_reward(self._last_undo, game_over)
+            debug = logger.MIN_LEVEL <= logger.DEBUG
+            move_str = self.last_move_str if debug or not self.training_mode else None
+            if not self.training_mode:
+                info['move'] = move_str
+            if debug:
+                logger.debug(
+                    f"[{str(self.n_moves + 1).zfill(int(np.log10(self.game_engine.MAX_MOVES)) + 1)}/{self.game_engine.MAX_MOVES + 1}] "
+                    f"{'ATK' if self.player == ATK else 'DEF'} : {move_str}")
+            if game_over:
                 self.done = True
                 info = {
                     'winner': self.player,
-                    'reason': 'King escaped' if self.player == DEF else 'King was captured',
-                    'move': move_str
+                    'reason': 'King escaped' if self.player == DEF else 'King was captured'
                 }
             else:
                 res = self.game_engine.check_endgame(last_moves=self.last_moves,
@@ -79,18 +124,16 @@ class TaflEnv(gym.Env):
                     self.done = True
                     info = {
                         'winner': res.get('winner'),
-                        'reason': res.get('reason'),
-                        'move': move_str
+                        'reason': res.get('reason')
                     }
                 else:
                     # update moves short-term history
-                    if len(self.last_moves) == 8:
-                        self.last_moves.pop(0)
                     self.last_moves.append(move)
 
                     # update the action space
                     self.player = ATK if self.player == DEF else DEF
                     self.valid_actions = self.game_engine.legal_moves(self.board, self.player)
+                    self._update_action_mask()
 
                     # no moves for the opponent check
                     if len(self.valid_actions) == 0:
@@ -98,20 +141,173 @@ class TaflEnv(gym.Env):
                         reward += 100
                         info = {
                             'winner': 'ATK' if self.player == DEF else 'DEF',
-                            'reason': 'Opponents has no moves available',
-                            'move': move_str
+                            'reason': 'Opponents has no moves available'
                         }
-            if self.done:
+                    elif self.tablebase is not None and self.tablebase.variant == self.variant:
+                        counts = self.game_engine.piece_counts
+                        if self.tablebase.covers(counts[ATTACKER], counts[DEFENDER]):
+                            entry = self.tablebase.probe(self.board, self.player)
+                            # the player who moved is the opponent of the side to move of the tablebase position:
+                            # only a win gets the terminal reward `move_reward` gives to the move ending the game
+                            if entry.winner not in (DRAW, self.player):
+                                reward += self.game_engine.GAME_OVER_REWARD / self.game_engine.MAX_REWARD
+                            self.done = True
+                            info = {
+                                'winner': entry.winner,
+                                'reason': 'Endgame tablebase',
+                                'distance': entry.distance
+                            }
+            if self.done and not self.training_mode:
+                info['move'] = move_str
+            if self.done and debug:
                 logger.debug(f"Match ended; reason: {info.get('reason')}; "
                              f"Winner: {'ATK' if info.get('winner') == ATK else ('DEF' if info.get('winner') == DEF else 'DRAW')}")
             self.n_moves += 1
 
-        return self.board, reward, self.done, info
+        return self._observation(), reward, self.done, info
+
+    def _observation(self) -> np.ndarray:
+        if self.features is None:
+            return self.board
+        self.features.set_counters(0, self.player, self.n_moves, self.game_engine.no_capture_turns_counter)
+        return self.features.game_planes(0, out=self.planes)
+
+    @property
+    def last_move_str(self) -> Optional[str]:
+        """
+        The notation of the last move, e.g. `E1-E3xD3`, None before the first move
+        """
+        if self._last_undo is None:
+            return None
+        fi, fj, ti, tj, _, _, captured, _, _ = self._last_undo
+        return move_as_str((fi, fj, ti, tj), [(i, j) for i, j, _ in captured], self.n_rows)
+
+    def _make_engine(self) -> GameEngine:
+        engine = make_game_engine(self.variant, self.backend, **self.engine_kwargs)
+        engine.validate = not self.training_mode
+        return engine
+
+    def enable_stats(self, stats: PerfStats = None) -> PerfStats:
+        """
+        Start collecting profiling statistics: the calls and time of `step`, `reset` and the engine phases, the legal
+        moves and captures per ply, and the length and end reason of the episodes. The statistics follow the environment
+        across variant changes, and are exported periodically if `PerfStats` is given an export file or callback.
+
+        :param stats: The statistics to update, possibly shared with other environments, if None new ones are created
+        :return: The statistics
+        """
+        self.disable_stats()
+        self.stats = self.game_engine.enable_stats(stats)
+        self.stats.labels.update(variant=self.variant, backend=self.backend)
+        instrument(self, self.stats, {'step': self._count_episode, 'reset': None})
+        return self.stats
+
+    def disable_stats(self):
+        """
+        Stop collecting the statistics
+        """
+        uninstrument(self, ENV_PHASES)
+        self.game_engine.disable_stats()
+        self.stats = None
+
+    def _count_episode(self, result: tuple):
+        _, _, done, info = result
+        if done and 'reason' in info:
+            self.stats.end_episode(self.n_moves, info['reason'])
+
+    def _update_action_mask(self):
+        self.action_mask[:] = False
+        self.action_mask[self.valid_actions] = True
+
+    def seed(self, seed: int = None) -> List[int]:
+        """
+        Seed the random generator of the environment
+
+        :param seed: The seed, if None a random one is used
+        :return: The list of used seeds
+        """
+        self.np_random, seed = seeding.np_random(seed)
+        return [seed]
+
+    def random_action(self) -> int:
+        """
+        Draw one of the valid actions with the random generator of the environment
+
+        :return: The action
+        """
+        return self.valid_actions[self.np_random.randint(len(self.valid_actions))]
+
+    @property
+    def position_hash(self) -> int:
+        """
+        The Zobrist hash of the current position, side to move included
+        """
+        return self.game_engine.hash
+
+    def observation_extras(self) -> dict:
+        """
+        Get the material of the current board, kept up to date by the game engine
+
+        :return: The number of attackers and defenders, whether the king is still on the board and the material value
+        """
+        counts = self.game_engine.piece_counts
+        return {
+            'attackers': counts[ATTACKER],
+            'defenders': counts[DEFENDER],
+            'king': counts[KING] > 0,
+            'material': self.game_engine.material
+        }
+
+    def get_state(self) -> CompactGameState:
+        """
+        Save the current game as a compact state, to be resumed with `set_state` by any environment of the variant
+
+        :return: The state
+        """
+        state = CompactGameState.empty(self.n_rows, self.n_cols)
+        state.board[:] = self.board
+        state.player = self.player
+        state.done = self.done
+        state.n_moves = self.n_moves
+        state.no_capture_turns = self.game_engine.no_capture_turns_counter
+        for move in self.last_moves:
+            state.push_action(self.game_engine.codec.encode(move))
+        return state
+
+    def set_state(self, state: CompactGameState) -> np.ndarray:
+        """
+        Resume a game saved with `get_state`. The environment must have been reset once; the positions played before the
+        state are not restored, see `CompactGameState`.
+
+        :param state: The state
+        :return: The observation
+        """
+        assert self.action_space is not None, "[ERR: set_state] Call reset before set_state"
+        assert state.done or state.n_moves <= self.game_engine.MAX_MOVES, \
+            f"[ERR: set_state] Game beyond the moves limit of {self.variant}: {state.n_moves} moves"
+        self.board[:] = state.board
+        self.player = state.player
+        self.done = state.done
+        self.steps_beyond_done = None
+        self.n_moves = state.n_moves
+        self.last_moves = deque((self.game_engine.codec.decode(a) for a in state.recent_actions()),
+                                maxlen=RECENT_ACTIONS)
+        self.game_engine.sync(self.board, self.player)
+        self.game_engine.no_capture_turns_counter = state.no_capture_turns
+        self.valid_actions = self.game_engine.legal_moves(self.board, self.player)
+        self._update_action_mask()
+        self._last_undo = None
+        if self.features is not None:
+            self.features.reset([0], self.board[None], [self.player])
+        return self._observation()
 
     def change_variant(self,
                        variant: str) -> None:
         self.variant = variant
-        self.game_engine = GameEngine(self.variant)
+        self.game_engine = self._make_engine()
+        if self.stats is not None:
+            self.game_engine.enable_stats(self.stats)
+            self.stats.labels['variant'] = variant
         self.reset()
 
     def reset(self) -> np.array:
@@ -124,104 +320,48 @@ class TaflEnv(gym.Env):
         self.player = self.game_engine.STARTING_PLAYER
         self.n_rows = self.game_engine.n_rows
         self.n_cols = self.game_engine.n_cols
-        self.board = np.zeros((self.n_rows, self.n_cols))
+        self.board = np.zeros((self.n_rows, self.n_cols), dtype=self.board_dtype)
         self.game_engine.no_capture_turns_counter = 0
         self.game_engine.fill_board(self.board)
+        if self.feature_planes:
+            if self.features is None or self.features.variant != self.variant:
+                self.features = FeaturePlanes(self.variant, history_length=self.history_length)
+                self.planes = np.zeros(self.features.shape, dtype=self.features.dtype)
+            self.features.reset([0], self.board[None], [self.player])
+            self.observation_space = spaces.Box(low=0, high=1, shape=self.features.shape, dtype=self.features.dtype)
+        else:
+            tiles = [EMPTY, CORNER, THRONE, KING, DEFENDER, ATTACKER]
+            self.observation_space = spaces.Box(low=min(tiles), high=max(tiles), shape=self.board.shape,
+                                                dtype=self.board_dtype)
         # initialize action space
         self.valid_actions = self.game_engine.legal_moves(self.board, self.game_engine.STARTING_PLAYER)
-        self.action_space = spaces.Discrete(len(IDX_TO_POS.keys()))
-        self.last_moves = []
+        self.action_space = spaces.Discrete(self.game_engine.n_actions)
+        if self.action_mask.shape[0] != self.game_engine.n_actions:
+            self.action_mask = np.zeros(self.game_engine.n_actions, dtype=bool)
+        self._update_action_mask()
+        self.last_moves = deque(maxlen=RECENT_ACTIONS)
         self.n_moves = 0
+        self._last_undo = None
         logger.debug('New match started')
-        return self.board
+        return self._observation()
 
     def render(self, mode: str = 'human'):
         """
-        Render the current state of the scene
+        Render the current state of the scene. The frame is drawn by the headless `BoardRenderer`, and only the `human`
+        mode needs a display, to show it.
 
         :param mode: The rendering mode to use
+        :return: The `(height, width, 3)` RGB frame in `rgb_array` mode, else whether the window is open
         """
+        frame = make_renderer(self.variant).render(self.board)
+        if mode == 'rgb_array':
+            return frame
         from gym.envs.classic_control import rendering
-        import os
 
         if self.viewer is None:
-            assets_dir = os.path.dirname(__file__)
-            assets_dir = os.path.join(assets_dir, 'assets')
-            # assets for tiles and background
-            self.assets = {
-                DEFENDER: os.path.join(assets_dir, 'defender.png'),
-                ATTACKER: os.path.join(assets_dir, 'attacker.png'),
-                KING: os.path.join(assets_dir, 'king.png'),
-                THRONE: os.path.join(assets_dir, 'throne.png'),
-                CORNER: os.path.join(assets_dir, 'throne.png'),
-            }
-            # game & rendering variables
-            self.square_width = SCR_WIDTH / (self.n_cols + 1)
-            self.square_height = SCR_HEIGHT / (self.n_rows + 1)
-            board_colors = [
-                tuple(int(BOARD_COLORS[0][i:i + 2], 16) / 255 for i in (0, 2, 4)),
-                tuple(int(BOARD_COLORS[1][i:i + 2], 16) / 255 for i in (0, 2, 4))
-            ]
-
-            self.viewer = rendering.Viewer(SCR_WIDTH, SCR_HEIGHT)
-
-            # rows numbers and columns letters
-            rows = [rendering.Image(fname=os.path.join((os.path.join(assets_dir, 'rows')), str(i) + '.png'),
-                                    width=self.square_width,
-                                    height=self.square_height) for i in range(self.n_rows)]
-            columns = [rendering.Image(fname=os.path.join((os.path.join(assets_dir, 'columns')), str(i) + '.png'),
-                                       width=self.square_width,
-                                       height=self.square_height) for i in range(self.n_rows)]
-            for i, img in enumerate(rows):
-                img.set_color(1., 1., 1.)
-                img.add_attr(rendering.Transform(translation=(self.square_width / 2,
-                                                              i * self.square_height + (3 / 2) * self.square_height)))
-                self.viewer.add_geom(img)
-
-            for i, img in enumerate(columns):
-                img.set_color(1., 1., 1.)
-                img.add_attr(rendering.Transform(translation=(i * self.square_width + (3 / 2) * self.square_width,
-                                                              self.square_height / 2)))
-                self.viewer.add_geom(img)
-
-            # add the tiles
-            c = 0
-            for i in range(self.n_rows, 0, -1):
-                for j in range(1, self.n_cols + 1):
-                    tile = rendering.make_polygon([(i * self.square_width, j * self.square_height),
-                                                   ((i + 1) * self.square_width, j * self.square_height),
-                                                   ((i + 1) * self.square_width, (j + 1) * self.square_height),
-                                                   (i * self.square_width, (j + 1) * self.square_height)])
-                    r, g, b = board_colors[c]
-                    tile.set_color(r, g, b)
-                    c = 1 if c == 0 else 0
-                    self.viewer.add_geom(tile)
-            # throne
-            if not self.game_engine.no_throne:
-                throne = rendering.Image(self.assets.get(THRONE), self.square_width, self.square_height)
-                throne.set_color(1., 1., 1.)
-                throne.add_attr(
-                    rendering.Transform(
-                        translation=((self.n_cols // 2 + 1) * self.square_width + (self.square_width / 2),
-                                     (self.n_rows // 2 + 1) * self.square_height + (self.square_height / 2))))
-                self.viewer.add_geom(throne)
-
-        # add pieces as a one-time render
-        for i in range(self.board.shape[0]):
-            for j in range(self.board.shape[1]):
-                p = self.board[i, j]
-                if p != EMPTY:
-                    r = i + 1
-                    c = j + 1
-                    tile = rendering.Image(self.assets.get(p), self.square_width, self.square_height)
-                    tile.set_color(1., 1., 1.)
-                    tile.add_attr(rendering.Transform(translation=(c * self.square_width + (self.square_width / 2),
-                                                                   (self.board.shape[
-                                                                        0] - r + 1) * self.square_height + (
-                                                                           self.square_height / 2))))
-                    self.viewer.add_onetime(tile)
-
-        return self.viewer.render(return_rgb_array=mode == 'rgb_array')
+            self.viewer = rendering.SimpleImageViewer()
+        self.viewer.imshow(frame)
+        return self.viewer.isopen
 
     def close(self):
         """
@@ -0,0 +1,230 @@
+import ctypes
+import multiprocessing as mp
+import os
+import traceback
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from gym import spaces, logger
+from gym.vector import VectorEnv
+
+from gym_tafl.envs._rules import load_rules
+from gym_tafl.envs.configs import *
+from gym_tafl.envs.tafl_env import TaflEnv
+
+
+def _shared_specs(num_envs: int, n_rows: int, n_cols: int, n_actions: int) -> Dict[str, tuple]:
+    """
+    Get the dtype and shape of each array shared between the workers and the main process
+    """
+    return {
+        'actions': (np.int64, (num_envs,)),
+        'boards': (np.int8, (num_envs, n_rows, n_cols)),
+        'action_masks': (np.bool_, (num_envs, n_actions)),
+        'rewards': (np.float64, (num_envs,)),
+        'dones': (np.bool_, (num_envs,)),
+        'winners': (np.int8, (num_envs,)),
+        'reasons': (np.int8, (num_envs,)),
+        'terminal_boards': (np.int8, (num_envs, n_rows, n_cols))
+    }
+
+
+def _as_arrays(buffers: dict, specs: dict) -> Dict[str, np.ndarray]:
+    return {name: np.frombuffer(buffers[name], dtype=dtype).reshape(shape) for name, (dtype, shape) in specs.items()}
+
+
+def _worker(remote, parent_remote, buffers: dict, specs: dict, envs_range: Tuple[int, int], seed: int,
+            variant: str, backend: str, engine_kwargs: dict):
+    """
+    Run the games of a slice of the pool, reading the actions from and writing the results to the shared arrays. The
+    pipe only carries the commands and the acknowledgements.
+    """
+    parent_remote.close()
+    arrays = _as_arrays(buffers, specs)
+    actions, boards, masks = arrays['actions'], arrays['boards'], arrays['action_masks']
+    rewards, dones, winners, reasons = arrays['rewards'], arrays['dones'], arrays['winners'], arrays['reasons']
+    terminal_boards = arrays['terminal_boards']
+    start, stop = envs_range
+    envs = []
+    for i in range(start, stop):
+        env = TaflEnv(backend=backend, compact_observations=True, training_mode=True, **engine_kwargs)
+        if variant != env.variant:
+            env.change_variant(variant)
+        env.seed(seed + i)
+        envs.append(env)
+    try:
+        while True:
+            cmd = remote.recv()
+            if cmd == 'close':
+                break
+            try:
+                if cmd == 'reset':
+                    for i, env in enumerate(envs, start):
+                        boards[i] = env.reset()
+                        masks[i] = env.action_mask
+                elif cmd in ('step', 'step_random'):
+                    for i, env in enumerate(envs, start):
+                        action = env.random_action() if cmd == 'step_random' else int(actions[i])
+                        actions[i] = action
+                        _, rewards[i], dones[i], info = env.step(action)
+                        if dones[i]:
+                            winner = info.get('winner')
+                            # the environment reports the no moves winner as a string
+                            winners[i] = {'ATK': ATK, 'DEF': DEF}.get(winner, winner)
+                            reasons[i] = REASON_CODES[info.get('reason')]
+                            terminal_boards[i] = env.board
+                            env.reset()
+                        boards[i] = env.board
+                        masks[i] = env.action_mask
+                else:
+                    raise ValueError(f"[ERR: _worker] Unknown command {cmd}")
+                remote.send(None)
+            except Exception:
+                remote.send(traceback.format_exc())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        remote.close()
+
+
+class TaflSubprocVecEnv(VectorEnv):
+    """
+    Pool of Tafl games stepped by worker processes, each owning a contiguous slice of the games.
+
+    Boards, legal actions masks, rewards and dones are written by the workers straight into shared memory arrays, and
+    the actions are read from one as well: the pipes to the workers only carry a command per step. `step_async`
+    returns as soon as the workers are notified, so the agent can work while the games are stepped.
+
+    Game `i` is seeded with `seed + i` through `TaflEnv.np_random`, whatever the number of workers; the random actions
+    of `step_async(None)` are drawn from it. As in `TaflVecEnv`, finished games are automatically reset, their final
+    board is in the info dict as `terminal_observation`, and the `winner` is always one of `ATK`, `DEF` or `DRAW`.
+    """
+
+    def __init__(self,
+                 num_envs: int,
+                 num_workers: int = None,
+                 variant: str = 'tablut',
+                 backend: str = 'numpy',
+                 seed: int = 0,
+                 context: str = None,
+                 **engine_kwargs):
+        """
+        Create the pool and start the workers
+
+        :param num_envs: The number of games
+        :param num_workers: The number of worker processes, by default one per core
+        :param variant: The variant played in all the games
+        :param backend: The game engine backend of the games
+        :param seed: The seed of the first game
+        :param context: The multiprocessing start method, the platform default if None
+        :param engine_kwargs: Additional game engine backend options
+        """
+        self.variant = variant
+        rules = load_rules(variant)
+        self.n_rows, self.n_cols, self.n_actions = rules.n_rows, rules.n_cols, rules.n_actions
+        super().__init__(num_envs,
+                         spaces.Box(low=EMPTY, high=ATTACKER, shape=(self.n_rows, self.n_cols), dtype=np.int8),
+                         spaces.Discrete(self.n_actions))
+        num_workers = min(num_workers or os.cpu_count() or 1, num_envs)
+        self.num_workers = num_workers
+
+        ctx = mp.get_context(context)
+        specs = _shared_specs(num_envs, self.n_rows, self.n_cols, self.n_actions)
+        buffers = {name: ctx.RawArray(ctypes.c_byte, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+                   for name, (dtype, shape) in specs.items()}
+        arrays = _as_arrays(buffers, specs)
+        self.boards, self.action_masks = arrays['boards'], arrays['action_masks']
+        self._actions, self._rewards, self._dones = arrays['actions'], arrays['rewards'], arrays['dones']
+        self._winners, self._reasons = arrays['winners'], arrays['reasons']
+        self._terminal_boards = arrays['terminal_boards']
+
+        bounds = np.linspace(0, num_envs, num_workers + 1).astype(int).tolist()
+        self.remotes, self.processes = [], []
+        for w in range(num_workers):
+            remote, work_remote = ctx.Pipe()
+            process = ctx.Process(target=_worker,
+                                  args=(work_remote, remote, buffers, specs, (bounds[w], bounds[w + 1]), seed,
+                                        variant, backend, engine_kwargs),
+                                  daemon=True)
+            process.start()
+            work_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+        self._stepping = False
+
+    def _send(self, cmd: str):
+        for remote in self.remotes:
+            remote.send(cmd)
+
+    def _wait(self):
+        errors = [e for e in (remote.recv() for remote in self.remotes) if e is not None]
+        if errors:
+            raise RuntimeError(f"[ERR: TaflSubprocVecEnv] Worker failed:\n{errors[0]}")
+
+    def reset_async(self):
+        self._send('reset')
+
+    def reset_wait(self, **kwargs) -> np.ndarray:
+        """
+        Reset all the games
+
+        :return: The boards
+        """
+        self._wait()
+        logger.debug(f'{self.num_envs} new matches started')
+        return self.boards
+
+    def step_async(self, actions: Optional[np.ndarray]):
+        """
+        Send an action to each game, without waiting for the games to be stepped
+
+        :param actions: The actions, if None each game plays a random valid action drawn from its own generator
+        """
+        assert not self._stepping, "[ERR: step_async] Call step_wait before stepping again"
+        if actions is None:
+            self._send('step_random')
+        else:
+            actions = np.asarray(actions, dtype=np.int64)
+            assert actions.shape == (self.num_envs,), \
+                f"[ERR: step_async] Expected {self.num_envs} actions, got {actions.shape}"
+            self._actions[:] = actions
+            self._send('step')
+        self._stepping = True
+
+    def step_wait(self, **kwargs) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[dict]]:
+        """
+        Wait for the games to be stepped
+
+        :return: The boards, the rewards, the dones and the info dicts
+        """
+        self._wait()
+        self._stepping = False
+        dones = self._dones.copy()
+        infos = [{} for _ in range(self.num_envs)]
+        for i in np.flatnonzero(dones).tolist():
+            infos[i] = {
+                'winner': int(self._winners[i]),
+                'reason': REASONS[self._reasons[i]],
+                'terminal_observation': self._terminal_boards[i].copy()
+            }
+        return self.boards, self._rewards.copy(), dones, infos
+
+    @property
+    def last_actions(self) -> np.ndarray:
+        """
+        The actions played by the last step, including the random ones
+        """
+        return self._actions
+
+    def close_extras(self, **kwargs):
+        if self._stepping:
+            self._wait()
+        for remote in self.remotes:
+            try:
+                remote.send('close')
+            except (BrokenPipeError, EOFError):
+                pass
+        for process in self.processes:
+            process.join()
+        for remote in self.remotes:
+            remote.close()
@@ -0,0 +1,468 @@
+from gym import spaces, logger
+from gym.vector import VectorEnv
+
+from gym_tafl.envs._bitboard_engine import THRONE_LAND, THRONE_PASS, THRONE_BLOCK
+from gym_tafl.envs._features import FeaturePlanes
+from gym_tafl.envs._game_engine import *
+from gym_tafl.envs._state import RECENT_ACTIONS, compact_state_dtype
+from gym_tafl.envs._zobrist import HASHED_TILES
+from gym_tafl.envs._utils import *
+from gym_tafl.envs.configs import *
+
+# tile value for squares outside the board
+WALL = -1
+
+
+class TaflVecEnv(VectorEnv):
+    """
+    Batched Tafl environment, stepping N games of the same variant at once.
+
+    The boards are kept in a single `(N, rows, cols)` int8 array, and moves, captures, rewards, endgame checks and the
+    legal actions masks are computed for all the games with array operations. Games that end are automatically reset:
+    their final board is returned in the info dict as `terminal_observation`, and the returned observation is already
+    the starting board of the next game.
+    The rewards are the same as the ones returned by `TaflEnv`, while the `winner` in the info dict is always one of
+    `ATK`, `DEF` or `DRAW`.
+    With `feature_planes=True` the observations are the `(N, n_planes, rows, cols)` stacks of `FeaturePlanes` instead
+    of the boards, which are still available in `boards`.
+    """
+
+    def __init__(self, num_envs: int, variant: str = 'tablut', feature_planes: bool = False, history_length: int = 8):
+        """
+        Create the environment
+
+        :param num_envs: The number of games
+        :param variant: The variant played in all the games
+        :param feature_planes: If True, the observations are the feature planes of the games instead of the boards
+        :param history_length: The number of positions in the feature planes, the current one included
+        """
+        self.variant = variant
+        self.game_engine = GameEngine(self.variant)
+        self.n_rows = self.game_engine.n_rows
+        self.n_cols = self.game_engine.n_cols
+        self.n_actions = self.game_engine.n_actions
+        self.features: Optional[FeaturePlanes] = None
+        self.planes: Optional[np.ndarray] = None
+        self.terminal_planes: Optional[np.ndarray] = None
+        if feature_planes:
+            self.features = FeaturePlanes(variant, num_envs, history_length)
+            self.planes = np.zeros((num_envs,) + self.features.shape, dtype=self.features.dtype)
+            observation_space = spaces.Box(low=0, high=1, shape=self.features.shape, dtype=self.features.dtype)
+        else:
+            observation_space = spaces.Box(low=EMPTY, high=ATTACKER, shape=(self.n_rows, self.n_cols), dtype=np.int8)
+        super().__init__(num_envs, observation_space, spaces.Discrete(self.n_actions))
+        self._make_tables()
+
+        # starting position
+        start = np.zeros((self.n_rows, self.n_cols))
+        self.game_engine.fill_board(start)
+        self.start_board = start.astype(np.int8)
+        self.start_material = self.game_engine.material
+        self.start_hash = np.uint64(self.game_engine.hash)
+        self.MAX_REWARD = self.game_engine.MAX_REWARD
+
+        # game variables
+        self.boards = np.zeros((num_envs, self.n_rows, self.n_cols), dtype=np.int8)
+        self.players = np.zeros(num_envs, dtype=np.int8)
+        self.n_moves = np.zeros(num_envs, dtype=np.int64)
+        self.no_capture_turns_counter = np.zeros(num_envs, dtype=np.int64)
+        self.material = np.zeros(num_envs)
+        # Zobrist hashes of the positions of each game, the current one is at index `n_moves`
+        self.hashes = np.zeros(num_envs, dtype=np.uint64)
+        self.hash_history = np.zeros((num_envs, self.game_engine.MAX_MOVES + 2), dtype=np.uint64)
+        self.last_moves = np.zeros((num_envs, 8, 4), dtype=np.int64)
+        self.n_last_moves = np.zeros(num_envs, dtype=np.int64)
+        self.action_masks = np.zeros((num_envs, self.n_actions), dtype=bool)
+        self._actions = None
+        self.start_mask = self._legal_masks(self.start_board[None], np.array([self.game_engine.STARTING_PLAYER]))[0]
+
+    def _make_tables(self):
+        """
+        Precompute the geometry tables used by the batched operations
+        """
+        engine = self.game_engine
+        rows, cols = self.n_rows, self.n_cols
+        n_squares = rows * cols
+        max_dist = max(rows, cols) - 1
+
+        # ray targets and actions for each square, direction and distance, padded with the square itself and -1
+        self.ray_targets = np.zeros((n_squares, len(DIRECTIONS), max_dist), dtype=np.int64)
+        self.ray_actions = np.full((n_squares, len(DIRECTIONS), max_dist), -1, dtype=np.int64)
+        for sq, square_rays in enumerate(engine.rays):
+            self.ray_targets[sq] = sq
+            for d, ray in enumerate(square_rays):
+                for k, (t, action, _, _) in enumerate(ray):
+                    self.ray_targets[sq, d, k] = t
+                    self.ray_actions[sq, d, k] = action
+        self.ray_valid = self.ray_actions >= 0
+        # action decoding
+        self.action_from = engine.codec.from_squares
+        self.action_to = engine.codec.to_squares
+        self.action_moves = engine.codec.moves
+
+        # movement rules by tile value: ray limits, and if the throne and corners can be passed over or landed on
+        n_tiles = max(KING, DEFENDER, ATTACKER, THRONE, CORNER, EMPTY) + 1
+        steps = np.arange(max_dist)
+        self.tile_rays = np.zeros((n_tiles,) + self.ray_targets.shape, dtype=bool)
+        self.throne_passable = np.zeros(n_tiles, dtype=bool)
+        self.throne_landable = np.zeros(n_tiles, dtype=bool)
+        self.corner_landable = np.zeros(n_tiles, dtype=bool)
+        for p in [KING, DEFENDER, ATTACKER]:
+            max_steps = max_dist if engine.unrestricted_movement else engine.m_counter[p]
+            self.tile_rays[p] = self.ray_valid & (steps < max_steps)
+            if p == KING and engine.only_king_can_land_on_throne:
+                rule = THRONE_LAND
+            elif p != KING and not engine.no_one_can_land_on_throne:
+                rule = THRONE_LAND
+            elif (p == KING and engine.throne_blocks_all_except_king) or (not engine.throne_blocks_all):
+                rule = THRONE_PASS
+            else:
+                rule = THRONE_BLOCK
+            self.throne_passable[p] = rule != THRONE_BLOCK
+            self.throne_landable[p] = rule == THRONE_LAND
+            self.corner_landable[p] = p == KING
+
+        # neighbours at distance 1 and 2, -1 if outside the board
+        self.nb1 = np.full((n_squares, len(DIRECTIONS)), -1, dtype=np.int64)
+        self.nb2 = np.full((n_squares, len(DIRECTIONS)), -1, dtype=np.int64)
+        for i in range(rows):
+            for j in range(cols):
+                for d, (inc_i, inc_j) in enumerate(DIRECTIONS):
+                    if 0 <= i + inc_i < rows and 0 <= j + inc_j < cols:
+                        self.nb1[i * cols + j, d] = (i + inc_i) * cols + j + inc_j
+                    if 0 <= i + 2 * inc_i < rows and 0 <= j + 2 * inc_j < cols:
+                        self.nb2[i * cols + j, d] = (i + 2 * inc_i) * cols + j + 2 * inc_j
+
+        # static masks
+        self.throne_sq = (rows // 2) * cols + cols // 2
+        squares = np.arange(n_squares)
+        sq_i, sq_j = squares // cols, squares % cols
+        self.edge = (sq_i == 0) | (sq_j == 0) | (sq_i == rows - 1) | (sq_j == cols - 1)
+        self.corner = np.zeros(n_squares, dtype=bool)
+        for (i, j) in [(0, 0), (0, rows - 1), (cols - 1, rows - 1), (cols - 1, 0)]:
+            self.corner[i * cols + j] = True
+        self.throne_zone = np.zeros(n_squares, dtype=bool)
+        self.throne_zone[self.throne_sq] = True
+        self.throne_zone[self.nb1[self.throne_sq][self.nb1[self.throne_sq] >= 0]] = True
+
+        # rewards and Zobrist keys by tile value
+        self.tile_reward = np.zeros(n_tiles)
+        for p, r in engine.piece_reward.items():
+            self.tile_reward[p] = r
+        self.zobrist_keys = np.zeros((n_tiles, n_squares), dtype=np.uint64)
+        for t in HASHED_TILES:
+            self.zobrist_keys[t] = engine.zobrist_keys[t]
+        self.zobrist_side_key = np.uint64(engine.zobrist_side_key)
+
+    def _legal_masks(self, boards: np.ndarray, players: np.ndarray) -> np.ndarray:
+        """
+        Compute the legal actions masks
+
+        :param boards: The `(n, rows, cols)` boards
+        :param players: The `(n,)` players to move
+        :return: The `(n, n_actions)` boolean masks
+        """
+        flat = boards.reshape(boards.shape[0], self.n_rows * self.n_cols)
+        # only the rays starting from the pieces of the player to move
+        owner = np.where(flat == ATTACKER, ATK, np.where((flat == KING) | (flat == DEFENDER), DEF, DRAW))
+        envs, squares = np.nonzero(owner == players[:, None])
+        pieces = flat[envs, squares]
+        tiles = flat[envs[:, None, None], self.ray_targets[squares]]
+        empty = tiles == EMPTY
+        throne = tiles == THRONE
+        corner = tiles == CORNER
+        passable = (empty | corner | (throne & self.throne_passable[pieces][:, None, None])) & \
+            self.tile_rays[pieces, squares]
+        landable = empty | (corner & self.corner_landable[pieces][:, None, None]) | \
+            (throne & self.throne_landable[pieces][:, None, None])
+        # a target is reachable if all the tiles before it (itself included) are passable
+        legal = np.logical_and.accumulate(passable, axis=-1) & landable
+        masks = np.zeros((boards.shape[0], self.n_actions), dtype=bool)
+        masks[np.broadcast_to(envs[:, None, None], legal.shape)[legal], self.ray_actions[squares][legal]] = True
+        return masks
+
+    def _process_captures(self, flat: np.ndarray, piece: np.ndarray, to_sq: np.ndarray) -> np.ndarray:
+        """
+        Compute the pieces captured by the moved pieces
+
+        :param flat: The `(n, rows * cols)` boards
+        :param piece: The `(n,)` moved pieces
+        :param to_sq: The `(n,)` squares where the pieces moved to
+        :return: The `(n, 4)` boolean captures of the neighbours in each direction
+        """
+        engine = self.game_engine
+        idx = np.arange(flat.shape[0])[:, None]
+        n1, n2 = self.nb1[to_sq], self.nb2[to_sq]
+        middle = np.where(n1 >= 0, flat[idx, n1], WALL)
+        outer = np.where(n2 >= 0, flat[idx, n2], WALL)
+        piece = piece[:, None]
+        is_piece = (middle == KING) | (middle == DEFENDER) | (middle == ATTACKER)
+        outer_piece = (outer == KING) | (outer == DEFENDER) | (outer == ATTACKER)
+
+        # normal capture, or capture next to throne
+        victim = ((piece == DEFENDER) & (middle == ATTACKER)) | \
+                 ((piece == KING) & engine.armed_king & (middle == ATTACKER)) | \
+                 ((piece == ATTACKER) & (middle == DEFENDER))
+        anvil = (outer_piece & ((piece == outer) |
+                                ((piece == DEFENDER) & (outer == KING) & (engine.armed_king or engine.anvil_king)) |
+                                ((piece == KING) & engine.armed_king & (outer == DEFENDER)))) | \
+                ((outer == THRONE) & (piece == ATTACKER) & (middle == DEFENDER))
+        captures = victim & anvil
+        # capture king
+        king = ~victim & (piece == ATTACKER) & (middle == KING)
+        zone = self.throne_zone[np.maximum(n1, 0)]
+        if engine.king_captured_with_two_pieces:
+            captures |= king & ((outer == ATTACKER) | (outer == THRONE))
+        elif engine.king_captured_with_two_pieces_except_near_or_on_throne:
+            captures |= king & ~zone & ((outer == ATTACKER) | (outer == THRONE))
+        # king surrounded on or next to the throne
+        if engine.king_captured_with_four_pieces or engine.king_captured_with_two_pieces_except_near_or_on_throne:
+            around = self.nb1[np.maximum(n1, 0)]
+            around_tiles = np.where(around >= 0, flat[idx[:, :, None], around], WALL)
+            threats = (around_tiles == ATTACKER).sum(axis=-1)
+            if engine.king_captured_with_two_pieces_except_near_or_on_throne:
+                threats += (around_tiles == THRONE).sum(axis=-1)
+            captures |= is_piece & ~victim & ~king & zone & (threats == 4)
+        return captures & is_piece
+
+    def reset_wait(self, **kwargs) -> np.ndarray:
+        """
+        Reset all the games
+
+        :return: The boards, or the feature planes
+        """
+        self.reset_games(np.arange(self.num_envs))
+        logger.debug(f'{self.num_envs} new matches started')
+        return self._observations()
+
+    def _observations(self) -> np.ndarray:
+        if self.features is None:
+            return self.boards
+        return self.features.planes(out=self.planes)
+
+    def reset_games(self, idx: np.ndarray):
+        """
+        Reset some of the games
+
+        :param idx: The indices of the games
+        """
+        self.boards[idx] = self.start_board
+        self.players[idx] = self.game_engine.STARTING_PLAYER
+        self.n_moves[idx] = 0
+        self.no_capture_turns_counter[idx] = 0
+        self.material[idx] = self.start_material
+        self.hashes[idx] = self.start_hash
+        self.hash_history[idx, 0] = self.start_hash
+        self.n_last_moves[idx] = 0
+        self.action_masks[idx] = self.start_mask
+        if self.features is not None:
+            self.features.reset(idx, self.boards[idx], self.players[idx])
+
+    def set_positions(self, idx: np.ndarray, boards: np.ndarray, players: np.ndarray, action_masks: np.ndarray = None):
+        """
+        Start some of the games from the given positions, with no moves history
+
+        :param idx: The `(m,)` indices of the games
+        :param boards: The `(m, rows, cols)` boards
+        :param players: The `(m,)` players to move
+        :param action_masks: The `(m, n_actions)` legal actions masks of the positions, computed if None
+        """
+        idx = np.asarray(idx, dtype=np.int64)
+        boards = np.asarray(boards, dtype=np.int8).reshape(len(idx), self.n_rows, self.n_cols)
+        players = np.asarray(players, dtype=np.int8)
+        self.reset_games(idx)
+        flat = boards.reshape(len(idx), -1).astype(np.int64)
+        hashes = np.bitwise_xor.reduce(self.zobrist_keys[flat, np.arange(flat.shape[1])], axis=1)
+        hashes ^= np.where(players == ATK, self.zobrist_side_key, np.uint64(0))
+        self.boards[idx] = boards
+        self.players[idx] = players
+        self.material[idx] = self.tile_reward[flat].sum(axis=1)
+        self.hashes[idx] = hashes
+        self.hash_history[idx, 0] = hashes
+        self.action_masks[idx] = self._legal_masks(boards, players) if action_masks is None else action_masks
+        if self.features is not None:
+            self.features.reset(idx, boards, players)
+
+    def get_states(self, idx: np.ndarray = None) -> np.ndarray:
+        """
+        Save games as packed compact states, see `CompactGameState` and `unpack_states`
+
+        :param idx: The `(m,)` indices of the games, all of them if None
+        :return: The `(m,)` structured array of the states
+        """
+        idx = np.arange(self.num_envs) if idx is None else np.asarray(idx, dtype=np.int64)
+        n_recent = self.n_last_moves[idx]
+        recent = self.game_engine.codec.encode_batch(self.last_moves[idx])
+        states = np.zeros(len(idx), dtype=compact_state_dtype(self.n_rows, self.n_cols))
+        states['board'] = self.boards[idx]
+        states['player'] = self.players[idx]
+        states['n_moves'] = self.n_moves[idx]
+        states['no_capture_turns'] = self.no_capture_turns_counter[idx]
+        states['recent'] = np.where(np.arange(RECENT_ACTIONS) < n_recent[:, None], recent, 0)
+        states['n_recent'] = n_recent
+        states['head'] = n_recent % RECENT_ACTIONS
+        return states
+
+    def set_states(self, idx: np.ndarray, states: np.ndarray):
+        """
+        Resume games saved as packed compact states, with `get_states`, `TaflEnv.get_state` or `pack_states`. The
+        positions played before the states are not restored, see `CompactGameState`.
+
+        :param idx: The `(m,)` indices of the games
+        :param states: The `(m,)` structured array of the states, none of them finished
+        """
+        idx = np.asarray(idx, dtype=np.int64)
+        assert not states['done'].any(), "[ERR: set_states] Finished games cannot be resumed"
+        n_moves, counter = states['n_moves'].astype(np.int64), states['no_capture_turns'].astype(np.int64)
+        beyond = n_moves > self.game_engine.MAX_MOVES
+        assert not beyond.any(), f"[ERR: set_states] Games beyond the moves limit of {self.variant}: {n_moves[beyond]}"
+        self.set_positions(idx, states['board'], states['player'])
+        self.n_moves[idx] = n_moves
+        self.no_capture_turns_counter[idx] = counter
+        # only the resumed position is known, at its ply
+        self.hash_history[idx] = 0
+        self.hash_history[idx, n_moves] = self.hashes[idx]
+        # recent actions from the oldest one
+        n_recent = states['n_recent'].astype(np.int64)
+        steps = np.arange(RECENT_ACTIONS)
+        order = (states['head'].astype(np.int64)[:, None] - n_recent[:, None] + steps) % RECENT_ACTIONS
+        moves = self.action_moves[np.take_along_axis(states['recent'].astype(np.int64), order, axis=1)]
+        moves[steps >= n_recent[:, None]] = 0
+        self.last_moves[idx] = moves
+        self.n_last_moves[idx] = n_recent
+        if self.features is not None:
+            self.features.set_counters(idx, self.players[idx], n_moves, counter)
+
+    def step_async(self, actions):
+        self._actions = np.asarray(actions, dtype=np.int64)
+
+    def step_wait(self, **kwargs) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[dict]]:
+        """
+        Apply an action in each game
+
+        :return: The boards (or the feature planes), the rewards, the dones and the info dicts
+        """
+        n = self.num_envs
+        assert self._actions.shape == (n,), f"[ERR: step] Expected {n} actions, got {self._actions.shape}"
+        rewards, dones, winners, reasons, terminal_boards = self.step_games(np.arange(n), self._actions)
+        infos = [{} for _ in range(n)]
+        for k, i in enumerate(np.nonzero(dones)[0].tolist()):
+            infos[i] = {
+                'winner': int(winners[i]),
+                'reason': str(reasons[i]),
+                'terminal_observation': terminal_boards[k] if self.features is None else self.terminal_planes[k]
+            }
+        return self._observations(), rewards, dones, infos
+
+    def step_games(self, envs: np.ndarray, actions: np.ndarray) -> Tuple[np.ndarray, ...]:
+        """
+        Apply an action in some of the games, leaving the others untouched. The finished games are reset.
+
+        :param envs: The `(m,)` distinct indices of the games
+        :param actions: The `(m,)` actions
+        :return: The `(m,)` rewards, dones, winners (ATK, DEF or DRAW) and reasons of the games, and the final boards of
+            the finished ones (their final feature planes are in `terminal_planes`)
+        """
+        envs = np.asarray(envs, dtype=np.int64)
+        actions = np.asarray(actions, dtype=np.int64)
+        n = len(envs)
+        rows = np.arange(n)
+        engine = self.game_engine
+        assert actions.shape == (n,), f"[ERR: step_games] Expected {n} actions, got {actions.shape}"
+        assert self.action_masks[envs, actions].all(), \
+            f"[ERR: step_games] Invalid actions: {actions[~self.action_masks[envs, actions]]}"
+
+        # state of the stepped games, written back at the end
+        flat = self.boards[envs].reshape(n, -1)
+        hashes, players, n_moves = self.hashes[envs], self.players[envs], self.n_moves[envs]
+        material, counter = self.material[envs], self.no_capture_turns_counter[envs]
+        lm, n_last_moves = self.last_moves[envs], self.n_last_moves[envs]
+
+        from_sq, to_sq = self.action_from[actions], self.action_to[actions]
+        moves = self.action_moves[actions]
+        # update board, piece and hash
+        keys = self.zobrist_keys
+        piece = flat[rows, from_sq]
+        hashes ^= keys[piece, from_sq] ^ keys[piece, to_sq] ^ keys[flat[rows, to_sq], to_sq]
+        flat[rows, to_sq] = piece
+        flat[rows, from_sq] = np.where((not engine.no_throne) & (from_sq == self.throne_sq), THRONE, EMPTY)
+        hashes ^= keys[flat[rows, from_sq], from_sq]
+        # check if king has escaped
+        escaped = (piece == KING) & (self.edge[to_sq] if engine.edge_escape else self.corner[to_sq])
+        # process captures
+        captures = self._process_captures(flat, piece, to_sq)
+        captured = np.nonzero(captures)
+        captured_sq = self.nb1[to_sq][captured]
+        captured_pieces = flat[captured[0], captured_sq]
+        king_captured = np.zeros(n, dtype=bool)
+        king_captured[captured[0][captured_pieces == KING]] = True
+        np.subtract.at(material, captured[0], self.tile_reward[captured_pieces])
+        flat[captured[0], captured_sq] = np.where(captured_sq == self.throne_sq, THRONE, EMPTY)
+        np.bitwise_xor.at(hashes, captured[0],
+                          keys[captured_pieces, captured_sq] ^ keys[flat[captured[0], captured_sq], captured_sq])
+        hashes ^= self.zobrist_side_key
+        self.hash_history[envs, n_moves + 1] = hashes
+        any_capture = captures.any(axis=1)
+        counter = np.where(any_capture, 0, counter + 1)
+        # normalize rewards in [-1, 1]
+        rewards = (engine.GAME_OVER_REWARD * escaped + 100 * king_captured + material) / self.MAX_REWARD
+
+        dones = escaped | king_captured
+        winners = np.where(dones, players, DRAW)
+        reasons = np.full(n, '', dtype=object)
+        reasons[dones] = np.where(players[dones] == DEF, 'King escaped', 'King was captured')
+
+        # moves limit, threefold repetition and 50 turns without captures
+        limit = ~dones & (n_moves == engine.MAX_MOVES)
+        if engine.threefold_repetition_by_position:
+            played = np.arange(self.hash_history.shape[1]) <= n_moves[:, None] + 1
+            repetition = ~dones & ~limit & \
+                (((self.hash_history[envs] == hashes[:, None]) & played).sum(axis=1) >= 3)
+        else:
+            repetition = ~dones & ~limit & (n_last_moves == 8) & \
+                (moves == lm[:, 4]).all(axis=1) & (moves[:, 3] == lm[:, 0, 3]) & \
+                (lm[:, 7] == lm[:, 3]).all(axis=1) & (lm[:, 6] == lm[:, 2]).all(axis=1) & \
+                (lm[:, 5] == lm[:, 1]).all(axis=1)
+        no_captures = ~dones & ~limit & ~repetition & engine.draw_after_50_turns_without_capture & \
+            (counter == 100)
+        reasons[limit] = 'Moves limit reached'
+        reasons[repetition] = 'Threefold repetition'
+        if not engine.threefold_repetition_as_draw:
+            winners[repetition] = np.where(players[repetition] == DEF, ATK, DEF)
+        reasons[no_captures] = '50 turns with no capture'
+        dones |= limit | repetition | no_captures
+
+        # update moves short-term history, the player and the action masks of the running games
+        running = np.nonzero(~dones)[0]
+        full = running[n_last_moves[running] == 8]
+        lm[full, :-1] = lm[full, 1:]
+        lm[running, np.minimum(n_last_moves[running], 7)] = moves[running]
+        n_last_moves[running] = np.minimum(n_last_moves[running] + 1, 8)
+        players[running] = np.where(players[running] == DEF, ATK, DEF)
+        boards = flat.reshape(n, self.n_rows, self.n_cols)
+        masks = self._legal_masks(boards[running], players[running])
+        self.action_masks[envs[running]] = masks
+
+        # no moves for the opponent check
+        stuck = running[~masks.any(axis=1)]
+        dones[stuck] = True
+        rewards[stuck] += 100
+        winners[stuck] = np.where(players[stuck] == DEF, ATK, DEF)
+        reasons[stuck] = 'Opponents has no moves available'
+
+        self.boards[envs] = boards
+        self.hashes[envs], self.players[envs], self.n_moves[envs] = hashes, players, n_moves + 1
+        self.material[envs], self.no_capture_turns_counter[envs] = material, counter
+        self.last_moves[envs], self.n_last_moves[envs] = lm, n_last_moves
+        ended = np.nonzero(dones)[0]
+        terminal_boards = boards[ended]
+        if self.features is not None:
+            self.features.push(envs, boards)
+            self.features.set_counters(envs, players, n_moves + 1, counter)
+            self.terminal_planes = self.features.planes(envs[ended])
+        if len(ended) > 0:
+            self.reset_games(envs[ended])
+        return rewards, dones, winners, reasons, terminal_boards
+
+    def close_extras(self, **kwargs):
+        pass
@@ -0,0 +1,2 @@
+from gym_tafl.records.reader import GameRecord, GameRecordReader, PositionBatch
+from gym_tafl.records.recorder import GameRecorder
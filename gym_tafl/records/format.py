@@ -0,0 +1,78 @@
+import json
+import os
+from typing import Tuple
+
+import numpy as np
+
+# a record set is made of three files sharing the same path prefix: the index, the actions and (optionally) the rewards
+INDEX_SUFFIX = '.index'
+ACTIONS_SUFFIX = '.actions'
+REWARDS_SUFFIX = '.rewards'
+
+MAGIC = b'TAFLREC\x00'
+# bump when the layout of the files changes
+FORMAT_VERSION = 1
+
+# one entry per game: first ply in the actions (and rewards) file, number of plies, variant id, winner and end reason
+INDEX_DTYPE = np.dtype([('offset', '<u8'),
+                        ('length', '<u4'),
+                        ('variant', 'u1'),
+                        ('winner', 'i1'),
+                        ('reason', 'u1')])
+ACTION_DTYPE = np.dtype('<u2')
+REWARD_DTYPE = np.dtype('<f4')
+
+
+def write_index(path: str, header: dict, index: np.ndarray):
+    """
+    Write the index file of a record set: the magic bytes, the format version, the JSON header and the index entries,
+    aligned to 8 bytes. The file is written then renamed, so readers never see a partial index.
+
+    :param path: The record set path, without suffix
+    :param header: The header, with the variants list and whether the rewards are recorded
+    :param index: The index entries
+    """
+    data = json.dumps(header).encode()
+    data += b' ' * (-(len(MAGIC) + 8 + len(data)) % 8)
+    tmp_file = f'{path}{INDEX_SUFFIX}.{os.getpid()}.tmp'
+    with open(tmp_file, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.array([FORMAT_VERSION, len(data)], dtype='<u4').tobytes())
+        f.write(data)
+        f.write(np.ascontiguousarray(index, dtype=INDEX_DTYPE).tobytes())
+    os.replace(tmp_file, path + INDEX_SUFFIX)
+
+
+def read_index(path: str, mmap: bool = True) -> Tuple[dict, np.ndarray]:
+    """
+    Read the index file of a record set
+
+    :param path: The record set path, without suffix
+    :param mmap: If True, the index entries are memory mapped instead of loaded
+    :return: The header and the index entries
+    """
+    with open(path + INDEX_SUFFIX, 'rb') as f:
+        assert f.read(len(MAGIC)) == MAGIC, f"[ERR: read_index] {path} is not a game records file"
+        version, size = np.frombuffer(f.read(8), dtype='<u4').tolist()
+        assert version == FORMAT_VERSION, f"[ERR: read_index] Unsupported records version {version}"
+        header = json.loads(f.read(size).decode())
+    offset = len(MAGIC) + 8 + size
+    n_games = (os.path.getsize(path + INDEX_SUFFIX) - offset) // INDEX_DTYPE.itemsize
+    if not mmap or n_games == 0:
+        index = np.fromfile(path + INDEX_SUFFIX, dtype=INDEX_DTYPE, count=n_games, offset=offset)
+    else:
+        index = np.memmap(path + INDEX_SUFFIX, dtype=INDEX_DTYPE, mode='r', offset=offset, shape=(n_games,))
+    return header, index
+
+
+def map_array(file: str, dtype: np.dtype) -> np.ndarray:
+    """
+    Memory map a flat array file, read only
+
+    :param file: The file path
+    :param dtype: The array dtype
+    :return: The array, empty if the file is empty
+    """
+    if os.path.getsize(file) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(file, dtype=dtype, mode='r')
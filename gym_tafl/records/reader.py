@@ -0,0 +1,151 @@
+from typing import Iterator, NamedTuple, Optional
+
+from gym_tafl.envs._engines import make_game_engine
+from gym_tafl.envs._game_engine import *
+from gym_tafl.envs.configs import REASONS
+from gym_tafl.records.format import *
+
+
+class GameRecord(NamedTuple):
+    """
+    Game read from the records, the winner is one of ATK, DEF or DRAW
+    """
+    variant: str
+    actions: np.ndarray
+    winner: int
+    reason: str
+    rewards: Optional[np.ndarray]
+
+
+class PositionBatch(NamedTuple):
+    """
+    Positions replayed from the records, with the action played from each of them
+    """
+    variant: str
+    boards: np.ndarray
+    players: np.ndarray
+    actions: np.ndarray
+    games: np.ndarray
+    plies: np.ndarray
+
+
+class GameRecordReader:
+    """
+    Reader of the game records written by `GameRecorder`. The index, actions and rewards files are memory mapped, so
+    opening a record set is immediate whatever its size, and a game is only read when it is accessed.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: The record set path, without suffix
+        """
+        self.path = path
+        header, self.index = read_index(path)
+        self.variants: List[str] = header['variants']
+        self.actions = map_array(path + ACTIONS_SUFFIX, ACTION_DTYPE)
+        self.rewards = map_array(path + REWARDS_SUFFIX, REWARD_DTYPE) if header['rewards'] else None
+        self._engines = {}
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __getitem__(self, game: int) -> GameRecord:
+        """
+        Get a game, its actions and rewards are views on the mapped files
+
+        :param game: The game index
+        :return: The game
+        """
+        offset, length, variant, winner, reason = self.index[game].tolist()
+        return GameRecord(variant=self.variants[variant],
+                          actions=self.actions[offset:offset + length],
+                          winner=winner,
+                          reason=REASONS[reason],
+                          rewards=None if self.rewards is None else self.rewards[offset:offset + length])
+
+    def __iter__(self) -> Iterator[GameRecord]:
+        for game in range(len(self)):
+            yield self[game]
+
+    def select(self, variant: str = None, winner: int = None) -> np.ndarray:
+        """
+        Select games by variant and winner, from the index only
+
+        :param variant: The variant, any if None
+        :param winner: The winner (ATK, DEF or DRAW), any if None
+        :return: The indices of the selected games
+        """
+        selected = np.ones(len(self), dtype=bool)
+        if variant is not None:
+            selected &= self.index['variant'] == (self.variants.index(variant) if variant in self.variants else -1)
+        if winner is not None:
+            selected &= self.index['winner'] == winner
+        return np.flatnonzero(selected)
+
+    def _engine(self, variant: str) -> GameEngine:
+        if variant not in self._engines:
+            self._engines[variant] = make_game_engine(variant)
+        return self._engines[variant]
+
+    def replay(self, game: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Reconstruct the boards of a game through the game engine
+
+        :param game: The game index
+        :return: The `(plies + 1, rows, cols)` int8 boards, from the starting one to the final one, and the player to
+            move on each of them but the last
+        """
+        record = self[game]
+        engine = self._engine(record.variant)
+        board = np.zeros((engine.n_rows, engine.n_cols), dtype=np.int8)
+        engine.fill_board(board)
+        boards = np.zeros((len(record.actions) + 1,) + board.shape, dtype=np.int8)
+        players = np.zeros(len(record.actions), dtype=np.int8)
+        boards[0] = board
+        player = engine.STARTING_PLAYER
+        engine.sync(board, player)
+        for ply, action in enumerate(record.actions.tolist()):
+            players[ply] = player
+            engine.make_move(board, engine.action_moves[action])
+            boards[ply + 1] = board
+            player = ATK if player == DEF else DEF
+        return boards, players
+
+    def iter_positions(self, batch_size: int = 256, games: np.ndarray = None) -> Iterator[PositionBatch]:
+        """
+        Stream the positions of the games in batches, for training: each position is the board before an action, with
+        the player to move and the played action. The games are replayed through the game engine, and the batches
+        never mix variants.
+
+        :param batch_size: The number of positions in a batch, the last batch of each variant may be smaller
+        :param games: The indices of the games to replay, all of them if None
+        :return: The batches
+        """
+        games = np.arange(len(self)) if games is None else np.asarray(games)
+        variant_ids = self.index['variant'][games]
+        for variant_id in np.unique(variant_ids).tolist():
+            variant = self.variants[variant_id]
+            engine = self._engine(variant)
+            shape = (batch_size, engine.n_rows, engine.n_cols)
+            boards, players = np.zeros(shape, dtype=np.int8), np.zeros(batch_size, dtype=np.int8)
+            actions, batch_games, plies = (np.zeros(batch_size, dtype=np.int64) for _ in range(3))
+            n = 0
+            board = np.zeros(shape[1:], dtype=np.int8)
+            for game in games[variant_ids == variant_id].tolist():
+                offset, length = int(self.index['offset'][game]), int(self.index['length'][game])
+                board[:] = EMPTY
+                engine.fill_board(board)
+                player = engine.STARTING_PLAYER
+                engine.sync(board, player)
+                for ply, action in enumerate(self.actions[offset:offset + length].tolist()):
+                    boards[n], players[n], actions[n], batch_games[n], plies[n] = board, player, action, game, ply
+                    n += 1
+                    if n == batch_size:
+                        yield PositionBatch(variant, boards, players, actions, batch_games, plies)
+                        boards, players = np.zeros(shape, dtype=np.int8), np.zeros(batch_size, dtype=np.int8)
+                        actions, batch_games, plies = (np.zeros(batch_size, dtype=np.int64) for _ in range(3))
+                        n = 0
+                    engine.make_move(board, engine.action_moves[action])
+                    player = ATK if player == DEF else DEF
+            if n > 0:
+                yield PositionBatch(variant, boards[:n], players[:n], actions[:n], batch_games[:n], plies[:n])
@@ -0,0 +1,156 @@
+from typing import List, Optional, Union
+
+from gym_tafl.envs._rules import load_rules
+from gym_tafl.envs.configs import *
+from gym_tafl.records.format import *
+
+
+class GameRecorder:
+    """
+    Writer of compact binary game records. Each game is stored as its actions (uint16, the action indices of the
+    environment), its variant, winner and end reason, and optionally its per-ply rewards (float32): a tablut game of
+    100 plies takes 214 bytes, 614 with the rewards.
+
+    Games are written as they are played, with `start_game`, `add_ply` and `end_game`, or all at once with `add_game`.
+    The index is written on `flush` and `close`, so only the games recorded before the last flush are visible to the
+    readers.
+    """
+
+    def __init__(self, path: str, record_rewards: bool = False, append: bool = False):
+        """
+        Create the record set, or open an existing one
+
+        :param path: The record set path, without suffix
+        :param record_rewards: If True, the per-ply rewards are recorded as well
+        :param append: If True and the record set exists, the new games are added to it, with its rewards setting
+        """
+        self.path = path
+        if append and os.path.isfile(path + INDEX_SUFFIX):
+            header, index = read_index(path, mmap=False)
+            self.variants: List[str] = header['variants']
+            self.record_rewards = header['rewards']
+            self._entries = index.tolist()
+            # drop the plies of the games that were not indexed
+            self._n_plies = int(index['offset'][-1] + index['length'][-1]) if len(index) else 0
+            mode = 'r+b'
+        else:
+            self.variants = []
+            self.record_rewards = record_rewards
+            self._entries = []
+            self._n_plies = 0
+            mode = 'w+b'
+        self._actions_file = open(path + ACTIONS_SUFFIX, mode)
+        self._actions_file.truncate(self._n_plies * ACTION_DTYPE.itemsize)
+        self._actions_file.seek(0, os.SEEK_END)
+        self._rewards_file = None
+        if self.record_rewards:
+            self._rewards_file = open(path + REWARDS_SUFFIX, mode)
+            self._rewards_file.truncate(self._n_plies * REWARD_DTYPE.itemsize)
+            self._rewards_file.seek(0, os.SEEK_END)
+        # the game being recorded
+        self._variant = None
+        self._actions = []
+        self._rewards = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _variant_id(self, variant: str) -> int:
+        if variant not in self.variants:
+            rules = load_rules(variant)
+            assert rules.n_actions <= np.iinfo(ACTION_DTYPE).max + 1, \
+                f"[ERR: GameRecorder] The actions of {variant} do not fit in {ACTION_DTYPE}"
+            assert len(self.variants) <= np.iinfo(INDEX_DTYPE['variant']).max, \
+                "[ERR: GameRecorder] Too many variants in a record set"
+            self.variants.append(variant)
+        return self.variants.index(variant)
+
+    def start_game(self, variant: str):
+        """
+        Start recording a game
+
+        :param variant: The variant name, or the path of a variant file
+        """
+        assert self._variant is None, "[ERR: start_game] The previous game was not ended"
+        self._variant = variant
+        self._actions.clear()
+        self._rewards.clear()
+
+    def add_ply(self, action: int, reward: float = None):
+        """
+        Record an action of the game being recorded
+
+        :param action: The action
+        :param reward: The reward of the action, required if the rewards are recorded
+        """
+        assert self._variant is not None, "[ERR: add_ply] No game started"
+        self._actions.append(action)
+        if self.record_rewards:
+            assert reward is not None, "[ERR: add_ply] The rewards are recorded, but no reward was given"
+            self._rewards.append(reward)
+
+    def end_game(self, winner: Union[int, str], reason: str = ''):
+        """
+        End the game being recorded and write it
+
+        :param winner: ATK, DEF or DRAW; the 'ATK' and 'DEF' strings reported by the environment are accepted as well
+        :param reason: The reason of the end of the game, as reported by the environment
+        """
+        assert self._variant is not None, "[ERR: end_game] No game started"
+        variant_id = self._variant_id(self._variant)
+        winner = {'ATK': ATK, 'DEF': DEF}.get(winner, winner)
+        assert winner in (ATK, DEF, DRAW), f"[ERR: end_game] Invalid winner {winner}"
+        assert reason in REASON_CODES, f"[ERR: end_game] Unknown end reason {reason!r}, expected one of {REASONS}"
+        np.asarray(self._actions, dtype=ACTION_DTYPE).tofile(self._actions_file)
+        if self.record_rewards:
+            np.asarray(self._rewards, dtype=REWARD_DTYPE).tofile(self._rewards_file)
+        self._entries.append((self._n_plies, len(self._actions), variant_id, winner, REASON_CODES[reason]))
+        self._n_plies += len(self._actions)
+        self._variant = None
+
+    def add_game(self,
+                 variant: str,
+                 actions: List[int],
+                 winner: Union[int, str],
+                 reason: str = '',
+                 rewards: Optional[List[float]] = None):
+        """
+        Record a whole game
+
+        :param variant: The variant name, or the path of a variant file
+        :param actions: The actions
+        :param winner: ATK, DEF or DRAW; the 'ATK' and 'DEF' strings reported by the environment are accepted as well
+        :param reason: The reason of the end of the game, as reported by the environment
+        :param rewards: The rewards of the actions, required if the rewards are recorded
+        """
+        self.start_game(variant)
+        self._actions.extend(actions)
+        if self.record_rewards:
+            assert rewards is not None and len(rewards) == len(actions), \
+                "[ERR: add_game] The rewards are recorded, one reward per action is required"
+            self._rewards.extend(rewards)
+        self.end_game(winner, reason)
+
+    def flush(self):
+        """
+        Write the pending data and the index, making the recorded games visible to the readers
+        """
+        self._actions_file.flush()
+        if self._rewards_file is not None:
+            self._rewards_file.flush()
+        write_index(self.path, {'variants': self.variants, 'rewards': self.record_rewards},
+                    np.array(self._entries, dtype=INDEX_DTYPE))
+
+    def close(self):
+        if self._actions_file.closed:
+            return
+        self.flush()
+        self._actions_file.close()
+        if self._rewards_file is not None:
+            self._rewards_file.close()
+
+    def __enter__(self) -> 'GameRecorder':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
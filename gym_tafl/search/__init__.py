@@ -0,0 +1,5 @@
+from gym_tafl.search.alphabeta import AlphaBetaSearch
+from gym_tafl.search.game import SearchGame, material_evaluation
+from gym_tafl.search.mcts import MCTS, material_evaluator, tablebase_evaluator
+from gym_tafl.search.stats import SearchStats
+from gym_tafl.search.transposition import TranspositionTable
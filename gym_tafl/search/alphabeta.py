@@ -0,0 +1,187 @@
+import time
+from typing import Callable
+
+from gym_tafl.search.game import *
+from gym_tafl.search.stats import SearchStats
+from gym_tafl.search.transposition import *
+
+WIN_VALUE = 1_000_000
+# values beyond this are wins or losses, shifted by their distance from the root
+WIN_THRESHOLD = WIN_VALUE - 10_000
+
+
+def _to_tt(value: float, ply: int) -> float:
+    # wins and losses are stored as distances from the node, not from the root
+    if value >= WIN_THRESHOLD:
+        return value + ply
+    if value <= -WIN_THRESHOLD:
+        return value - ply
+    return value
+
+
+def _from_tt(value: float, ply: int) -> float:
+    if value >= WIN_THRESHOLD:
+        return value - ply
+    if value <= -WIN_THRESHOLD:
+        return value + ply
+    return value
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the search when the node or time budget is exhausted
+    """
+    pass
+
+
+class AlphaBetaSearch:
+    """
+    Iterative deepening negamax alpha-beta search. Moves are ordered by the transposition table best action, then by
+    killer actions of the same ply, then by the history heuristic.
+    """
+
+    def __init__(self,
+                 evaluate: Callable[[SearchGame], float] = material_evaluation,
+                 tt: TranspositionTable = None,
+                 max_depth: int = 64,
+                 max_nodes: int = None,
+                 max_time: float = None,
+                 tablebase=None):
+        """
+        :param evaluate: The evaluation of a non terminal position, for the player to move
+        :param tt: The transposition table, if None a new one is created
+        :param max_depth: The maximum depth of the iterative deepening
+        :param max_nodes: The maximum number of searched nodes, if None the nodes are not limited
+        :param max_time: The maximum search time in seconds, if None the time is not limited
+            (the first iteration always completes, whatever the node and time budgets)
+        :param tablebase: The endgame `Tablebase` of the variant, giving the exact value of the positions it contains
+        """
+        self.evaluate = evaluate
+        self.tt = tt if tt is not None else TranspositionTable()
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.max_time = max_time
+        self.tablebase = tablebase
+        self.stats = SearchStats()
+        self.killers = []
+        self.history = {}
+        self._deadline = None
+        self._root_action = None
+
+    def search(self, game: SearchGame) -> Tuple[Optional[int], float]:
+        """
+        Search the best action of the player to move. When the budget runs out, the result of the last completed
+        iteration is returned: the first iteration is never interrupted, so the value is always a searched one.
+
+        :param game: The game, it is left in its current position
+        :return: The best action (None if there are no legal moves) and its value for the player to move
+        """
+        self.stats = SearchStats()
+        self.killers = [[None, None] for _ in range(self.max_depth + 1)]
+        self.history = {}
+        self.tt.new_search()
+        self._deadline = None if self.max_time is None else self.stats.start + self.max_time
+        best_action, best_value = None, -WIN_VALUE
+        root_ply = game.ply
+        self._root_action = None
+        try:
+            for depth in range(1, self.max_depth + 1):
+                best_value = self._negamax(game, depth, -WIN_VALUE - 1, WIN_VALUE + 1, 0)
+                best_action = self._root_action
+                self.stats.depth = depth
+                if abs(best_value) >= WIN_THRESHOLD or best_action is None:
+                    break
+        except SearchTimeout:
+            game.undo_to(root_ply)
+        self.stats.stop()
+        return best_action, best_value
+
+    def _check_budget(self):
+        if self.stats.depth == 0:
+            # the budget only interrupts the iterations after the first one
+            return
+        if self.max_nodes is not None and self.stats.nodes >= self.max_nodes:
+            raise SearchTimeout()
+        if self._deadline is not None and self.stats.nodes & 0x3ff == 0 and time.perf_counter() >= self._deadline:
+            raise SearchTimeout()
+
+    def _order(self, actions: List[int], tt_action: Optional[int], ply: int) -> List[int]:
+        first = [a for a in (tt_action, *self.killers[ply]) if a is not None]
+        history = self.history
+        ordered = sorted(actions, key=lambda a: -history.get(a, 0))
+        if first:
+            ordered = [a for a in dict.fromkeys(first) if a in actions] + [a for a in ordered if a not in first]
+        return ordered
+
+    def _negamax(self, game: SearchGame, depth: int, alpha: float, beta: float, ply: int) -> float:
+        self.stats.nodes += 1
+        self._check_budget()
+        key = game.state.hash
+        alpha_orig = alpha
+        entry = self.tt.probe(key)
+        tt_action = None
+        if entry is not None:
+            self.stats.tt_hits += 1
+            e_depth, e_value, e_bound, tt_action, _ = entry
+            e_value = _from_tt(e_value, ply)
+            if ply > 0 and e_depth >= depth:
+                if e_bound == EXACT:
+                    return e_value
+                if e_bound == LOWER:
+                    alpha = max(alpha, e_value)
+                elif e_bound == UPPER:
+                    beta = min(beta, e_value)
+                if alpha >= beta:
+                    return e_value
+
+        if ply > 0 and self.tablebase is not None:
+            counts = game.state.piece_counts
+            if self.tablebase.covers(counts[ATTACKER], counts[DEFENDER]):
+                entry = self.tablebase.probe(game.board, game.player)
+                if entry is not None:
+                    self.stats.tb_hits += 1
+                    if entry.winner == DRAW:
+                        return 0
+                    return WIN_VALUE - ply - entry.distance if entry.winner == game.player \
+                        else -WIN_VALUE + ply + entry.distance
+
+        actions = game.legal_moves()
+        if not actions:
+            # the player to move has no moves available and loses
+            return -WIN_VALUE + ply
+        if depth == 0:
+            self.stats.evaluations += 1
+            return self.evaluate(game)
+
+        best_value, best_action = -WIN_VALUE - 1, None
+        for action in self._order(actions, tt_action, ply):
+            mover = game.player
+            winner = game.play(action)
+            if winner is None:
+                value = -self._negamax(game, depth - 1, -beta, -alpha, ply + 1)
+            elif winner == DRAW:
+                value = 0
+            else:
+                value = WIN_VALUE - ply - 1 if winner == mover else -WIN_VALUE + ply + 1
+            game.undo()
+            if value > best_value:
+                best_value, best_action = value, action
+            if value > alpha:
+                alpha = value
+            if alpha >= beta:
+                killers = self.killers[ply]
+                if action != killers[0]:
+                    killers[0], killers[1] = action, killers[0]
+                self.history[action] = self.history.get(action, 0) + depth * depth
+                break
+
+        if best_value <= alpha_orig:
+            bound = UPPER
+        elif best_value >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        if ply == 0:
+            self._root_action = best_action
+        self.tt.store(key, depth, _to_tt(best_value, ply), bound, best_action)
+        return best_value
@@ -0,0 +1,139 @@
+from typing import Optional
+
+from gym_tafl.envs._engines import make_game_engine
+from gym_tafl.envs._game_engine import *
+from gym_tafl.envs._utils import *
+from gym_tafl.envs._zobrist import HashHistory
+
+
+class SearchGame:
+    """
+    Game played by the searches directly on a game engine, without going through the environment. Moves are played
+    with `play` and taken back with `undo`, through the engine make/unmake moves.
+
+    The game works on its own copy of the board and its own engine `GameState`, so the engine can be shared with other
+    games, environments included.
+    """
+
+    def __init__(self,
+                 engine: GameEngine,
+                 board: np.array,
+                 player: int,
+                 last_moves: List[Tuple[int, int, int, int]] = (),
+                 n_moves: int = 0,
+                 no_capture_turns_counter: int = 0,
+                 history: HashHistory = None):
+        """
+        :param engine: The game engine
+        :param board: The board
+        :param player: The player to move
+        :param last_moves: The short-term moves history, as kept by the environment
+        :param n_moves: The number of moves already played
+        :param no_capture_turns_counter: The number of turns already played without captures
+        :param history: The hashes of the positions already played, if None only the current position is known
+        """
+        self.engine = engine
+        self.board = board.copy()
+        self.player = player
+        self.last_moves = list(last_moves)
+        self.n_moves = n_moves
+        self.state = engine.new_state(self.board, player)
+        self.state.no_capture_turns_counter = no_capture_turns_counter
+        if history is not None:
+            self.state.history = history.copy()
+        self._stack = []
+
+    @classmethod
+    def from_env(cls, env, engine: GameEngine = None) -> 'SearchGame':
+        """
+        Create a game from the current position of an environment, leaving the environment untouched
+
+        :param env: The environment
+        :param engine: The game engine to search with, if None a new one is created for the environment variant
+        :return: The game
+        """
+        if engine is None:
+            engine = make_game_engine(env.variant, env.backend, **env.engine_kwargs)
+        return cls(engine, env.board, env.player,
+                   last_moves=env.last_moves,
+                   n_moves=env.n_moves,
+                   no_capture_turns_counter=env.game_engine.no_capture_turns_counter,
+                   history=env.game_engine.history)
+
+    @property
+    def ply(self) -> int:
+        """
+        The number of moves played since the game was created
+        """
+        return len(self._stack)
+
+    def legal_moves(self) -> List[int]:
+        """
+        Get the legal actions of the player to move
+
+        :return: The legal actions
+        """
+        return self.engine.legal_moves(self.board, self.player, state=self.state)
+
+    def play(self, action: int) -> Optional[int]:
+        """
+        Play an action of the player to move, checking the end of the game as the environment does. When the game is not
+        over the turn passes to the opponent; the opponent having no legal moves is left to the caller.
+
+        :param action: The action
+        :return: The winner (or DRAW) if the game is over, else None
+        """
+        move = self.engine.action_moves[action]
+        dropped = None
+        undo, game_over = self.engine.make_move(self.board, move, state=self.state)
+        winner = None
+        if game_over:
+            winner = self.player
+        else:
+            res = self.engine.check_endgame(last_moves=self.last_moves,
+                                            last_move=move,
+                                            player=self.player,
+                                            n_moves=self.n_moves,
+                                            state=self.state)
+            if res.get('game_over', False):
+                winner = res.get('winner')
+            else:
+                if len(self.last_moves) == 8:
+                    dropped = self.last_moves.pop(0)
+                self.last_moves.append(move)
+                self.player = ATK if self.player == DEF else DEF
+        self._stack.append((undo, winner is None, dropped))
+        self.n_moves += 1
+        return winner
+
+    def undo(self):
+        """
+        Take back the last played action
+        """
+        undo, moved_on, dropped = self._stack.pop()
+        self.engine.unmake_move(self.board, undo, state=self.state)
+        self.n_moves -= 1
+        if moved_on:
+            self.player = ATK if self.player == DEF else DEF
+            self.last_moves.pop()
+            if dropped is not None:
+                self.last_moves.insert(0, dropped)
+
+    def undo_to(self, ply: int = 0):
+        """
+        Take back the actions played after the given ply
+
+        :param ply: The ply to go back to, 0 for the position the game was created from
+        """
+        while len(self._stack) > ply:
+            self.undo()
+
+
+def material_evaluation(game: SearchGame) -> float:
+    """
+    Evaluate a position by its material, as kept by the game state
+
+    :param game: The game
+    :return: The value of the position for the player to move
+    """
+    return game.state.material if game.player == DEF else -game.state.material
@@ -0,0 +1,221 @@
+import math
+import time
+from typing import Callable
+
+from gym_tafl.search.game import *
+from gym_tafl.search.stats import SearchStats
+
+# batched evaluator: (boards (B, rows, cols), players (B,), legal action masks (B, n_actions)) ->
+# (priors (B, n_actions), values (B,) for the player to move)
+Evaluator = Callable[[np.ndarray, np.ndarray, np.ndarray], Tuple[np.ndarray, np.ndarray]]
+
+
+def material_evaluator(engine: GameEngine) -> Evaluator:
+    """
+    Create an evaluator with uniform priors over the legal actions, valuing the positions by their material
+
+    :param engine: The game engine of the variant
+    :return: The evaluator
+    """
+    tile_reward = np.zeros(max(engine.piece_reward) + 1)
+    for p, r in engine.piece_reward.items():
+        tile_reward[p] = r
+    scale = float(sum(abs(r) for r in engine.piece_reward.values()))
+
+    def evaluate(boards: np.ndarray, players: np.ndarray, masks: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        priors = masks / np.maximum(masks.sum(axis=1, keepdims=True), 1)
+        material = tile_reward[boards.astype(int).clip(0)].reshape(boards.shape[0], -1).sum(axis=1)
+        values = np.tanh(material / scale) * np.where(players == DEF, 1., -1.)
+        return priors, values
+
+    return evaluate
+
+
+def tablebase_evaluator(tablebase, evaluator: Evaluator) -> Evaluator:
+    """
+    Wrap an evaluator, replacing the values of the positions in an endgame tablebase with their exact ones
+
+    :param tablebase: The endgame `Tablebase` of the variant
+    :param evaluator: The evaluator of the priors and of the other positions
+    :return: The evaluator
+    """
+    def evaluate(boards: np.ndarray, players: np.ndarray, masks: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        priors, values = evaluator(boards, players, masks)
+        found, winners, _ = tablebase.probe_batch(boards, players)
+        exact = np.where(winners == DRAW, 0., np.where(winners == players, 1., -1.))
+        return priors, np.where(found, exact, values)
+
+    return evaluate
+
+
+class _Node:
+    __slots__ = ('player', 'actions', 'priors', 'visits', 'values', 'children', 'terminal')
+
+    def __init__(self, player: int):
+        self.player = player
+        self.actions = None
+        self.priors = None
+        self.visits = None
+        self.values = None
+        self.children = {}
+        # the value for the player to move of a terminal position
+        self.terminal = None
+
+    def expand(self, actions: List[int], priors: np.ndarray):
+        self.actions = actions
+        self.priors = priors
+        self.visits = np.zeros(len(actions))
+        self.values = np.zeros(len(actions))
+
+
+class MCTS:
+    """
+    Monte Carlo tree search guided by the PUCT rule. Leaves are collected with virtual losses, so that the evaluator
+    receives them in batches.
+    """
+
+    def __init__(self,
+                 evaluator: Evaluator = None,
+                 c_puct: float = 1.5,
+                 batch_size: int = 8,
+                 virtual_loss: float = 1.,
+                 max_simulations: int = 800,
+                 max_time: float = None):
+        """
+        :param evaluator: The batched evaluator of the leaves, see `Evaluator`, if None `material_evaluator` is used
+        :param c_puct: The exploration constant
+        :param batch_size: The maximum number of leaves evaluated together
+        :param virtual_loss: The loss temporarily added to the edges of a path waiting for its leaf evaluation
+        :param max_simulations: The maximum number of simulations
+        :param max_time: The maximum search time in seconds, if None the time is not limited
+        """
+        self.evaluator = evaluator
+        self.c_puct = c_puct
+        self.batch_size = batch_size
+        self.virtual_loss = virtual_loss
+        self.max_simulations = max_simulations
+        self.max_time = max_time
+        self.stats = SearchStats()
+        self.root = None
+        self._evaluator = None
+        self._root_ply = 0
+
+    def search(self, game: SearchGame) -> Tuple[Optional[int], np.ndarray]:
+        """
+        Search the best action of the player to move
+
+        :param game: The game, it is left in its current position
+        :return: The most visited action (None if there are no legal moves) and the visit distribution over the actions
+        """
+        self.stats = SearchStats()
+        deadline = None if self.max_time is None else self.stats.start + self.max_time
+        engine = game.engine
+        self._evaluator = self.evaluator if self.evaluator is not None else material_evaluator(engine)
+        self._root_ply = game.ply
+        policy = np.zeros(engine.n_actions)
+        self.root = _Node(game.player)
+        actions = game.legal_moves()
+        if not actions:
+            self.stats.stop()
+            return None, policy
+        self._evaluate(game, [(self.root, actions, game.board.copy())])
+
+        simulations = 0
+        while simulations < self.max_simulations and (deadline is None or time.perf_counter() < deadline):
+            pending = []
+            for _ in range(min(self.batch_size, self.max_simulations - simulations)):
+                simulations += 1
+                path, leaf, value, actions, board = self._select(game)
+                if value is None and all(leaf is not p[0] for p in pending):
+                    pending.append((leaf, actions, board, path))
+                    self._apply_virtual_loss(path, self.virtual_loss)
+                else:
+                    if value is None:
+                        # the leaf is already waiting for its evaluation
+                        simulations -= 1
+                        break
+                    self._backup(path, value)
+            if pending:
+                values = self._evaluate(game, [leaf[:3] for leaf in pending])
+                for (*_, path), value in zip(pending, values):
+                    self._apply_virtual_loss(path, -self.virtual_loss)
+                    self._backup(path, value)
+
+        self.stats.nodes = simulations
+        self.stats.stop()
+        root = self.root
+        policy[root.actions] = root.visits / max(root.visits.sum(), 1)
+        return root.actions[int(np.argmax(root.visits))], policy
+
+    def _select(self, game: SearchGame):
+        """
+        Walk down the tree from the root up to a leaf, then take back the played actions
+
+        :return: The path of (node, child index) edges, the leaf, and either the leaf value if known, or the leaf legal
+            actions and board to evaluate
+        """
+        node = self.root
+        path = []
+        value, actions, board = None, None, None
+        while True:
+            if node.terminal is not None:
+                value = node.terminal
+                break
+            if node.actions is None:
+                actions = game.legal_moves()
+                if not actions:
+                    # the player to move has no moves available and loses
+                    node.terminal = value = -1.
+                break
+            n = node.visits
+            q = np.divide(node.values, n, out=np.zeros_like(n), where=n > 0)
+            u = self.c_puct * node.priors * math.sqrt(n.sum() + 1) / (1 + n)
+            i = int(np.argmax(q + u))
+            action = node.actions[i]
+            path.append((node, i))
+            mover = game.player
+            winner = game.play(action)
+            child = node.children.get(action)
+            if child is None:
+                child = node.children[action] = _Node(game.player)
+                if winner is not None:
+                    # terminal value for the player to move after the last action, the opponent of the mover
+                    child.terminal = 0. if winner == DRAW else (-1. if winner == mover else 1.)
+            node = child
+        if value is None:
+            board = game.board.copy()
+        game.undo_to(self._root_ply)
+        return path, node, value, actions, board
+
+    def _evaluate(self, game: SearchGame, leaves: list) -> List[float]:
+        """
+        Evaluate a batch of (leaf, legal actions, board) and expand the leaves
+
+        :return: The values of the leaves for their player to move
+        """
+        engine = game.engine
+        boards = np.stack([board for _, _, board in leaves])
+        players = np.array([leaf.player for leaf, _, _ in leaves])
+        masks = np.zeros((len(leaves), engine.n_actions))
+        for b, (_, actions, _) in enumerate(leaves):
+            masks[b, actions] = 1
+        priors, values = self._evaluator(boards, players, masks)
+        self.stats.evaluations += len(leaves)
+        for b, (leaf, actions, _) in enumerate(leaves):
+            p = np.asarray(priors[b])[actions]
+            leaf.expand(actions, p / p.sum() if p.sum() > 0 else np.full(len(actions), 1. / len(actions)))
+        return [float(v) for v in values]
+
+    @staticmethod
+    def _apply_virtual_loss(path: list, loss: float):
+        for node, i in path:
+            node.visits[i] += loss
+            node.values[i] -= loss
+
+    @staticmethod
+    def _backup(path: list, value: float):
+        # the value is for the player to move at the leaf, every edge is valued for the player moving along it
+        for node, i in reversed(path):
+            value = -value
+            node.visits[i] += 1
+            node.values[i] += value
@@ -0,0 +1,33 @@
+import time
+
+
+class SearchStats:
+    """
+    Counters of a search run
+    """
+
+    def __init__(self):
+        self.nodes = 0
+        self.evaluations = 0
+        self.tt_hits = 0
+        self.tb_hits = 0
+        self.depth = 0
+        self.start = time.perf_counter()
+        self.elapsed = 0.
+
+    def stop(self):
+        """
+        Record the elapsed time of the search
+        """
+        self.elapsed = time.perf_counter() - self.start
+
+    @property
+    def nps(self) -> float:
+        """
+        The searched nodes per second
+        """
+        return self.nodes / self.elapsed if self.elapsed > 0 else 0.
+
+    def __repr__(self) -> str:
+        return (f"SearchStats(nodes={self.nodes}, evaluations={self.evaluations}, tt_hits={self.tt_hits}, "
+                f"tb_hits={self.tb_hits}, depth={self.depth}, elapsed={self.elapsed:.3f}s, nps={self.nps:.0f})")
@@ -0,0 +1,78 @@
+from typing import Optional, Tuple
+
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+
+class TranspositionTable:
+    """
+    Fixed size table of search results indexed by Zobrist hash. Every slot holds one entry; a new entry replaces the
+    stored one when it is for the same position, when the stored one comes from an older search, or when it was
+    searched at least as deep.
+    """
+
+    def __init__(self, size: int = 2 ** 18):
+        """
+        :param size: The number of slots
+        """
+        assert size > 0, f"[ERR: TranspositionTable] Invalid size: {size}"
+        self.size = size
+        self.keys = [None] * size
+        # (depth, value, bound, best action, generation) of each slot
+        self.entries = [None] * size
+        self.generation = 0
+        self.used = 0
+
+    def new_search(self):
+        """
+        Age the stored entries, so that they are replaced first by the next search
+        """
+        self.generation += 1
+
+    def clear(self):
+        self.keys = [None] * self.size
+        self.entries = [None] * self.size
+        self.used = 0
+
+    def probe(self, key: int) -> Optional[Tuple[int, float, int, Optional[int], int]]:
+        """
+        Look up a position
+
+        :param key: The position hash
+        :return: The stored (depth, value, bound, best action, generation), or None if the position is not stored
+        """
+        i = key % self.size
+        if self.keys[i] == key:
+            return self.entries[i]
+        return None
+
+    def store(self, key: int, depth: int, value: float, bound: int, action: Optional[int]):
+        """
+        Store a search result, following the replacement policy
+
+        :param key: The position hash
+        :param depth: The remaining depth the position was searched to
+        :param value: The value of the position
+        :param bound: Whether the value is EXACT, a LOWER or an UPPER bound
+        :param action: The best action found, if any
+        """
+        i = key % self.size
+        stored = self.entries[i]
+        if stored is None:
+            self.used += 1
+        elif self.keys[i] == key:
+            # keep the best action of a shallower result when this one has none
+            if action is None:
+                action = stored[3]
+        elif stored[4] == self.generation and stored[0] > depth:
+            return
+        self.keys[i] = key
+        self.entries[i] = (depth, value, bound, action, self.generation)
+
+    @property
+    def fill(self) -> float:
+        """
+        The fraction of used slots
+        """
+        return self.used / self.size
@@ -0,0 +1,2 @@
+from gym_tafl.server.client import TaflClient
+from gym_tafl.server.server import TaflServer, run_server
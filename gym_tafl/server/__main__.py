@@ -0,0 +1,29 @@
+import argparse
+import sys
+from typing import List
+
+from gym import logger
+
+from gym_tafl.server.server import run_server
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m gym_tafl.server',
+                                     description='Serve a pool of Tafl games to remote actors')
+    parser.add_argument('--variant', default='tablut', help='variant played in all the games')
+    parser.add_argument('--games', type=int, default=1024, help='number of games')
+    parser.add_argument('--host', default='127.0.0.1', help='TCP host')
+    parser.add_argument('--port', type=int, default=0, help='TCP port, any free port if 0')
+    parser.add_argument('--unix', metavar='PATH', help='serve on a Unix socket instead of TCP')
+    parser.add_argument('--batch-window', type=float, default=0.,
+                        help='seconds to wait for more requests before serving a batch')
+    args = parser.parse_args(argv)
+
+    logger.set_level(logger.INFO)
+    run_server(variant=args.variant, num_games=args.games, host=args.host, port=args.port, path=args.unix,
+               batch_window=args.batch_window)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
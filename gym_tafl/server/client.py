@@ -0,0 +1,114 @@
+import socket
+from typing import Tuple, Union
+
+from gym_tafl.envs.configs import REASONS
+from gym_tafl.server.protocol import *
+
+
+class TaflClient:
+    """
+    Blocking client of a `TaflServer`. Every method is a single round trip, whatever the number of games it addresses.
+    """
+
+    def __init__(self, address: Union[str, Tuple[str, int]], timeout: float = None):
+        """
+        Connect to a server
+
+        :param address: The path of the Unix socket, or the TCP host and port of the server
+        :param timeout: The timeout of the socket operations in seconds, none if None
+        """
+        if isinstance(address, str):
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.settimeout(timeout)
+            self.socket.connect(address)
+        else:
+            self.socket = socket.create_connection(tuple(address), timeout=timeout)
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        _, payload = self._request(HELLO)
+        info = json.loads(payload.decode())
+        self.variant: str = info['variant']
+        self.num_games: int = info['num_games']
+        self.n_rows: int = info['n_rows']
+        self.n_cols: int = info['n_cols']
+        self.n_actions: int = info['n_actions']
+
+    def _recv(self, size: int) -> bytes:
+        data = bytearray(size)
+        view = memoryview(data)
+        received = 0
+        while received < size:
+            n = self.socket.recv_into(view[received:])
+            if n == 0:
+                raise ConnectionError("[ERR: TaflClient] Connection closed by the server")
+            received += n
+        return bytes(data)
+
+    def _request(self, opcode: int, games: np.ndarray = None, actions: np.ndarray = None) -> Tuple[int, bytes]:
+        self.socket.sendall(encode_request(opcode, games, actions))
+        length, _, status, n = RESPONSE_HEADER.unpack(self._recv(RESPONSE_HEADER.size))
+        payload = self._recv(length)
+        if status == ERROR:
+            raise RuntimeError(f"[ERR: TaflClient] Request failed: {payload.decode()}")
+        return n, payload
+
+    def _games(self, games) -> np.ndarray:
+        return np.arange(self.num_games) if games is None else np.atleast_1d(games)
+
+    def reset(self, games: np.ndarray = None) -> np.ndarray:
+        """
+        Reset games
+
+        :param games: The game ids, all the games if None
+        :return: The `(n, rows, cols)` boards
+        """
+        n, payload = self._request(RESET, self._games(games))
+        return np.frombuffer(payload, dtype=np.int8).reshape(n, self.n_rows, self.n_cols)
+
+    def step(self, games: np.ndarray, actions: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, dict]:
+        """
+        Apply an action in each of the games, the finished games are reset
+
+        :param games: The distinct game ids
+        :param actions: The actions
+        :return: The boards, the rewards, the dones, and a dict with the `winners` (ATK, DEF or DRAW) and `reasons` of
+            the games and the `terminal_observations` of the finished ones
+        """
+        n, payload = self._request(STEP, self._games(games), actions)
+        rewards, dones, winners, reasons, boards, terminal_boards = decode_step(payload, n, self.n_rows, self.n_cols)
+        info = {
+            'winners': winners,
+            'reasons': [REASONS[reason] for reason in reasons.tolist()],
+            'terminal_observations': terminal_boards
+        }
+        return boards, rewards, dones, info
+
+    def action_masks(self, games: np.ndarray = None) -> np.ndarray:
+        """
+        Get the legal actions masks of games
+
+        :param games: The game ids, all the games if None
+        :return: The `(n, n_actions)` masks
+        """
+        n, payload = self._request(MASKS, self._games(games))
+        return unpack_masks(payload, n, self.n_actions)
+
+    def observations(self, games: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the boards of games
+
+        :param games: The game ids, all the games if None
+        :return: The `(n, rows, cols)` boards and the players to move
+        """
+        n, payload = self._request(OBSERVATIONS, self._games(games))
+        size = n * self.n_rows * self.n_cols
+        return (np.frombuffer(payload, dtype=np.int8, count=size).reshape(n, self.n_rows, self.n_cols),
+                np.frombuffer(payload, dtype=np.int8, offset=size))
+
+    def close(self):
+        self.socket.close()
+
+    def __enter__(self) -> 'TaflClient':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
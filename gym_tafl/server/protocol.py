@@ -0,0 +1,132 @@
+import json
+import struct
+from typing import Tuple
+
+import numpy as np
+
+# request opcodes
+HELLO = 0
+RESET = 1
+STEP = 2
+MASKS = 3
+OBSERVATIONS = 4
+OPCODES = (HELLO, RESET, STEP, MASKS, OBSERVATIONS)
+
+# response statuses
+OK = 0
+ERROR = 1
+
+# request header: payload length, opcode, number of games; the payload is the uint32 game ids, followed by the uint16
+# actions for a STEP
+REQUEST_HEADER = struct.Struct('<IBI')
+# response header: payload length, opcode of the request, status, number of games
+RESPONSE_HEADER = struct.Struct('<IBBI')
+GAME_DTYPE = np.dtype('<u4')
+ACTION_DTYPE = np.dtype('<u2')
+REWARD_DTYPE = np.dtype('<f4')
+# requests above this payload size are refused, as a guard against corrupted streams
+MAX_PAYLOAD = 1 << 28
+
+
+def encode_request(opcode: int, games: np.ndarray = None, actions: np.ndarray = None) -> bytes:
+    """
+    Encode a request
+
+    :param opcode: The opcode
+    :param games: The `(n,)` game ids, none for a HELLO
+    :param actions: The `(n,)` actions of a STEP
+    :return: The request message
+    """
+    games = np.asarray([] if games is None else games, dtype=GAME_DTYPE)
+    payload = games.tobytes()
+    if opcode == STEP:
+        actions = np.asarray(actions, dtype=ACTION_DTYPE)
+        assert actions.shape == games.shape, f"[ERR: encode_request] Expected {len(games)} actions, got {actions.shape}"
+        payload += actions.tobytes()
+    return REQUEST_HEADER.pack(len(payload), opcode, len(games)) + payload
+
+
+def decode_request(opcode: int, n: int, payload: bytes) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Decode the payload of a request
+
+    :param opcode: The opcode
+    :param n: The number of games
+    :param payload: The payload
+    :return: The game ids, and the actions of a STEP (None otherwise)
+    """
+    assert opcode in OPCODES, f"[ERR: decode_request] Unknown opcode {opcode}"
+    expected = n * GAME_DTYPE.itemsize + (n * ACTION_DTYPE.itemsize if opcode == STEP else 0)
+    assert len(payload) == expected, f"[ERR: decode_request] Expected a payload of {expected} bytes, got {len(payload)}"
+    games = np.frombuffer(payload, dtype=GAME_DTYPE, count=n).astype(np.int64)
+    actions = None
+    if opcode == STEP:
+        actions = np.frombuffer(payload, dtype=ACTION_DTYPE, offset=n * GAME_DTYPE.itemsize).astype(np.int64)
+    return games, actions
+
+
+def encode_response(opcode: int, n: int, *arrays: np.ndarray, status: int = OK) -> bytes:
+    """
+    Encode a response, its payload is the concatenated bytes of the arrays
+
+    :param opcode: The opcode of the request
+    :param n: The number of games
+    :param arrays: The result arrays, already in their wire dtype
+    :param status: OK, or ERROR with the utf-8 error message as the only array
+    :return: The response message
+    """
+    payload = b''.join(a.tobytes() if isinstance(a, np.ndarray) else bytes(a) for a in arrays)
+    return RESPONSE_HEADER.pack(len(payload), opcode, status, n) + payload
+
+
+def encode_hello(variant: str, num_games: int, n_rows: int, n_cols: int, n_actions: int) -> bytes:
+    """
+    Encode the description of the server, the answer to a HELLO
+
+    :return: The response message
+    """
+    info = {'variant': variant, 'num_games': num_games, 'n_rows': n_rows, 'n_cols': n_cols, 'n_actions': n_actions}
+    return encode_response(HELLO, 0, json.dumps(info).encode())
+
+
+def decode_step(payload: bytes, n: int, n_rows: int, n_cols: int) -> Tuple[np.ndarray, ...]:
+    """
+    Decode the payload of a STEP response: the float32 rewards, the bool dones, the int8 winners, the uint8 reason codes
+    and the int8 boards of the `n` games, followed by the int8 final boards of the finished games
+
+    :return: The rewards, dones, winners, reason codes, boards and final boards
+    """
+    size = n_rows * n_cols
+    offset = 0
+
+    def take(dtype, count):
+        nonlocal offset
+        array = np.frombuffer(payload, dtype=dtype, count=count, offset=offset)
+        offset += array.nbytes
+        return array
+
+    rewards, dones, winners, reasons = take(REWARD_DTYPE, n), take(np.bool_, n), take(np.int8, n), take(np.uint8, n)
+    boards = take(np.int8, n * size).reshape(n, n_rows, n_cols)
+    n_done = int(dones.sum())
+    terminal_boards = take(np.int8, n_done * size).reshape(n_done, n_rows, n_cols)
+    return rewards, dones, winners, reasons, boards, terminal_boards
+
+
+def pack_masks(masks: np.ndarray) -> np.ndarray:
+    """
+    Pack legal action masks as bits, row by row
+
+    :param masks: The `(n, n_actions)` masks
+    :return: The `(n, ceil(n_actions / 8))` uint8 array
+    """
+    return np.packbits(masks, axis=1)
+
+
+def unpack_masks(payload: bytes, n: int, n_actions: int) -> np.ndarray:
+    """
+    Unpack the legal action masks of a MASKS response
+
+    :return: The `(n, n_actions)` bool masks
+    """
+    packed = np.frombuffer(payload, dtype=np.uint8).reshape(n, (n_actions + 7) // 8)
+    return np.unpackbits(packed, axis=1, count=n_actions).astype(bool)
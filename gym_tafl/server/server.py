@@ -0,0 +1,250 @@
+import asyncio
+from typing import List, Optional, Tuple, Union
+
+from gym import logger
+
+from gym_tafl.envs.configs import REASON_CODES
+from gym_tafl.envs.tafl_vec_env import TaflVecEnv
+from gym_tafl.server.protocol import *
+
+
+class _Request:
+    """
+    Request waiting for the batching loop, answered through its future
+    """
+    __slots__ = ('opcode', 'games', 'actions', 'future')
+
+    def __init__(self, opcode: int, games: np.ndarray, actions: Optional[np.ndarray], future: asyncio.Future):
+        self.opcode = opcode
+        self.games = games
+        self.actions = actions
+        self.future = future
+
+
+class TaflServer:
+    """
+    Server hosting a pool of games of the same variant for remote actors, over TCP or a Unix socket.
+
+    The games live in a `TaflVecEnv` and are addressed by their index in the pool. The requests of all the connections
+    are queued and served by a single batching loop: the consecutive STEP requests on distinct games are merged into one
+    call to `TaflVecEnv.step_games`, so a thousand actors stepping one game each cost a handful of engine calls. The
+    requests are served in their arrival order, a RESET, MASKS or OBSERVATIONS request sees the effect of all the steps
+    received before it. As in `TaflVecEnv`, finished games are automatically reset.
+
+    See `gym_tafl.server.protocol` for the messages, and `TaflClient` for the client side.
+    """
+
+    def __init__(self, variant: str = 'tablut', num_games: int = 1024, batch_window: float = 0.):
+        """
+        Create the server, with all the games reset
+
+        :param variant: The variant played in all the games
+        :param num_games: The number of games
+        :param batch_window: The time in seconds to wait for more requests before serving a batch, 0 to only batch the
+            requests received while the previous batch was served
+        """
+        self.variant = variant
+        self.num_games = num_games
+        self.batch_window = batch_window
+        self.env = TaflVecEnv(num_games, variant)
+        self.env.reset()
+        self.n_requests = 0
+        self.n_batches = 0
+        self.n_engine_calls = 0
+        self._hello = encode_hello(variant, num_games, self.env.n_rows, self.env.n_cols, self.env.n_actions)
+        self._queue: Optional[asyncio.Queue] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._batch_task: Optional[asyncio.Task] = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0, path: str = None) -> Union[str, Tuple[str, int]]:
+        """
+        Start listening and serving the requests
+
+        :param host: The TCP host
+        :param port: The TCP port, any free port if 0
+        :param path: The path of a Unix socket, used instead of TCP if given
+        :return: The address of the server: the socket path, or the TCP host and port
+        """
+        assert self._server is None, "[ERR: start] The server is already started"
+        self._queue = asyncio.Queue()
+        self._batch_task = asyncio.ensure_future(self._batch_loop())
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._handle, path=path)
+            address = path
+        else:
+            self._server = await asyncio.start_server(self._handle, host=host, port=port)
+            address = self._server.sockets[0].getsockname()[:2]
+        logger.info(f'Serving {self.num_games} {self.variant} games on {address}')
+        return address
+
+    async def serve_forever(self):
+        assert self._server is not None, "[ERR: serve_forever] The server is not started"
+        await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._batch_task.cancel()
+        try:
+            await self._batch_task
+        except asyncio.CancelledError:
+            pass
+        self._batch_task = None
+        self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Serve the requests of a connection, one at a time
+        """
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(REQUEST_HEADER.size)
+                except asyncio.IncompleteReadError:
+                    break
+                length, opcode, n = REQUEST_HEADER.unpack(header)
+                if length > MAX_PAYLOAD:
+                    logger.warn(f'Closing a connection sending a payload of {length} bytes')
+                    break
+                payload = await reader.readexactly(length)
+                if opcode == HELLO:
+                    writer.write(self._hello)
+                else:
+                    try:
+                        games, actions = decode_request(opcode, n, payload)
+                        assert ((games >= 0) & (games < self.num_games)).all(), \
+                            f"[ERR: {self.__class__.__name__}] Invalid game ids {games[games >= self.num_games]}"
+                        if n == 0:
+                            # nothing to serve, the empty response is sent without going through the batching loop
+                            writer.write(encode_response(opcode, 0))
+                        else:
+                            future = asyncio.get_running_loop().create_future()
+                            self._queue.put_nowait(_Request(opcode, games, actions, future))
+                            writer.write(await future)
+                    except AssertionError as e:
+                        writer.write(encode_response(opcode, 0, str(e).encode(), status=ERROR))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _batch_loop(self):
+        while True:
+            requests = [await self._queue.get()]
+            if self.batch_window > 0:
+                await asyncio.sleep(self.batch_window)
+            while not self._queue.empty():
+                requests.append(self._queue.get_nowait())
+            self.n_requests += len(requests)
+            self.n_batches += 1
+            try:
+                self._serve(requests)
+            except Exception as e:
+                logger.error(f'Batch of {len(requests)} requests failed: {e!r}')
+                for request in requests:
+                    if not request.future.done():
+                        request.future.set_result(encode_response(request.opcode, 0, repr(e).encode(), status=ERROR))
+
+    def _serve(self, requests: List[_Request]):
+        """
+        Serve a batch of requests in their order, merging the consecutive steps of distinct games
+        """
+        steps, stepped = [], np.zeros(self.num_games, dtype=bool)
+        for request in requests:
+            if request.future.cancelled():
+                continue
+            if request.opcode != STEP:
+                self._step(steps, stepped)
+                request.future.set_result(self._read(request))
+                continue
+            games, actions = request.games, request.actions
+            error = None
+            if len(np.unique(games)) != len(games):
+                error = f"[ERR: {self.__class__.__name__}] Games stepped more than once in a request"
+            elif not (actions < self.env.n_actions).all():
+                error = f"[ERR: {self.__class__.__name__}] Invalid actions {actions[actions >= self.env.n_actions]}"
+            if error is None:
+                if stepped[games].any():
+                    # a game is stepped again, the merged steps are applied first
+                    self._step(steps, stepped)
+                illegal = ~self.env.action_masks[games, actions]
+                if illegal.any():
+                    error = f"[ERR: {self.__class__.__name__}] Illegal actions {actions[illegal]} in games " \
+                            f"{games[illegal]}"
+            if error is not None:
+                request.future.set_result(encode_response(STEP, 0, error.encode(), status=ERROR))
+                continue
+            steps.append(request)
+            stepped[games] = True
+        self._step(steps, stepped)
+
+    def _step(self, steps: List[_Request], stepped: np.ndarray):
+        """
+        Apply the merged steps with a single engine call and answer their requests
+        """
+        if not steps:
+            return
+        games = np.concatenate([request.games for request in steps])
+        actions = np.concatenate([request.actions for request in steps])
+        rewards, dones, winners, reasons, terminal_boards = self.env.step_games(games, actions)
+        self.n_engine_calls += 1
+        rewards = rewards.astype(REWARD_DTYPE)
+        winners = winners.astype(np.int8)
+        reasons = np.array([REASON_CODES[reason] for reason in reasons], dtype=np.uint8)
+        boards = self.env.boards[games]
+        start, terminal_start = 0, 0
+        for request in steps:
+            stop = start + len(request.games)
+            terminal_stop = terminal_start + int(dones[start:stop].sum())
+            request.future.set_result(encode_response(STEP, stop - start, rewards[start:stop], dones[start:stop],
+                                                      winners[start:stop], reasons[start:stop], boards[start:stop],
+                                                      terminal_boards[terminal_start:terminal_stop]))
+            start, terminal_start = stop, terminal_stop
+        steps.clear()
+        stepped[:] = False
+
+    def _read(self, request: _Request) -> bytes:
+        """
+        Serve a RESET, MASKS or OBSERVATIONS request
+        """
+        games = request.games
+        n = len(games)
+        if request.opcode == RESET:
+            self.env.reset_games(games)
+            return encode_response(RESET, n, self.env.boards[games])
+        if request.opcode == MASKS:
+            return encode_response(MASKS, n, pack_masks(self.env.action_masks[games]))
+        return encode_response(OBSERVATIONS, n, self.env.boards[games], self.env.players[games].astype(np.int8))
+
+
+def run_server(variant: str = 'tablut',
+               num_games: int = 1024,
+               host: str = '127.0.0.1',
+               port: int = 0,
+               path: str = None,
+               batch_window: float = 0.):
+    """
+    Run a server until interrupted
+
+    :param variant: The variant played in all the games
+    :param num_games: The number of games
+    :param host: The TCP host
+    :param port: The TCP port, any free port if 0
+    :param path: The path of a Unix socket, used instead of TCP if given
+    :param batch_window: The time in seconds to wait for more requests before serving a batch
+    """
+    async def serve():
+        server = TaflServer(variant, num_games, batch_window)
+        await server.start(host, port, path)
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
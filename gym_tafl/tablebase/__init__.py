@@ -0,0 +1,2 @@
+from gym_tafl.tablebase.generator import generate_tablebase
+from gym_tafl.tablebase.probe import Tablebase, TablebaseEntry
@@ -0,0 +1,25 @@
+import argparse
+import sys
+from typing import List
+
+from gym import logger
+
+from gym_tafl.tablebase.generator import generate_tablebase
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m gym_tafl.tablebase',
+                                     description='Generate the endgame tablebase of a variant')
+    parser.add_argument('path', help='directory of the tablebase')
+    parser.add_argument('--variant', default='custom', help='variant name or variant file')
+    parser.add_argument('--pieces', type=int, default=3, help='maximum number of pieces, the king included')
+    parser.add_argument('--batch-size', type=int, default=65536, help='positions and moves played at once')
+    args = parser.parse_args(argv)
+
+    logger.set_level(logger.INFO)
+    generate_tablebase(args.path, variant=args.variant, max_pieces=args.pieces, batch_size=args.batch_size)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
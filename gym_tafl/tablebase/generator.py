@@ -0,0 +1,206 @@
+import json
+import os
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+from gym import logger
+
+from gym_tafl.envs._rules import load_rules
+from gym_tafl.envs.configs import *
+from gym_tafl.envs.tafl_vec_env import TaflVecEnv
+from gym_tafl.tablebase.indexing import MaterialIndex, table_name
+
+# bump when the tables change, the tablebases of different versions are not loaded
+TABLEBASE_VERSION = 1
+HEADER_FILE = 'tablebase.json'
+TABLE_SUFFIX = '.npy'
+# value of the positions: 0 for a draw, `distance + 1` for a result in `distance` plies with perfect play, the player to
+# move winning on odd distances and losing on even ones; the slots of the index not mapping to a position are INVALID
+VALUE_DTYPE = np.uint8
+DRAW_VALUE = 0
+INVALID = 255
+MAX_DISTANCE = INVALID - 2
+
+
+def table_materials(max_pieces: int) -> List[Tuple[int, int]]:
+    """
+    Get the materials solved for a number of pieces, in solving order: a capture only leads to tables solved before
+
+    :param max_pieces: The maximum number of pieces on the board, the king included
+    :return: The (attackers, defenders) of each table
+    """
+    return [(a, n - 1 - a) for n in range(1, max_pieces + 1) for a in range(n)]
+
+
+def _check_rules(variant: str):
+    rules = load_rules(variant)
+    assert rules.edge_escape and not rules.no_throne, \
+        f"[ERR: generate_tablebase] Only edge escape variants with a throne are supported, not {variant}"
+    assert rules.no_one_can_land_on_throne or rules.only_king_can_land_on_throne, \
+        f"[ERR: generate_tablebase] Only variants where the pieces cannot land on the throne are supported, not {variant}"
+    # the positions do not record the moves played, the games no player can force to a win are draws by repetition
+    assert rules.threefold_repetition_as_draw, \
+        f"[ERR: generate_tablebase] Only variants where the threefold repetition is a draw are supported, not {variant}"
+
+
+class _Successors:
+    """
+    Successors of the positions of a table: the moves into the same table are kept as edges, the moves ending the game
+    or capturing into a smaller table are folded into the per position aggregates of their values
+    """
+
+    def __init__(self, size: int):
+        self.counts = np.zeros(size, dtype=np.int64)
+        self.edges = []
+        # over the moves leaving the table: the smallest winning value, the number of moves not losing and the largest
+        # losing value, for the player moving
+        self.win = np.full(size, INVALID + 1, dtype=np.int64)
+        self.not_lost = np.zeros(size, dtype=np.int64)
+        self.lost = np.zeros(size, dtype=np.int64)
+
+
+def _aggregate(values: np.ndarray, sources: np.ndarray, successors: _Successors):
+    """
+    Fold the values of the successors of positions, for the player to move in the successors, into the aggregates of the
+    player moving
+    """
+    # the player moving wins if the opponent loses, in one more ply
+    losing = (values % 2 == 1) & (values != INVALID)
+    np.minimum.at(successors.win, sources[losing], values[losing])
+    np.add.at(successors.not_lost, sources[(values % 2 == 1) | (values == DRAW_VALUE)], 1)
+    winning = (values % 2 == 0) & (values != DRAW_VALUE)
+    np.maximum.at(successors.lost, sources[winning], values[winning])
+
+
+def _generate_successors(env: TaflVecEnv, index: MaterialIndex, tables: Dict[Tuple[int, int], np.ndarray],
+                         values: np.ndarray, batch_size: int) -> _Successors:
+    """
+    Play every legal move of every position of a table, in batches of the environment size
+    """
+    successors = _Successors(index.size)
+    key = (index.n_attackers, index.n_defenders)
+    indices = {key: index}
+    for start in range(0, index.size, batch_size):
+        stop = min(start + batch_size, index.size)
+        boards, players, valid = index.positions(start, stop)
+        values[start:stop][~valid] = INVALID
+        positions = np.flatnonzero(valid)
+        env.set_positions(np.arange(len(positions)), boards[positions], players[positions])
+        masks = env.action_masks[:len(positions)].copy()
+        sources, actions = np.nonzero(masks)
+        successors.counts[start + positions] = np.bincount(sources, minlength=len(positions))
+        for s in range(0, len(sources), batch_size):
+            src, act = sources[s:s + batch_size], actions[s:s + batch_size]
+            games = np.arange(len(src))
+            env.set_positions(games, boards[positions[src]], players[positions[src]], masks[src])
+            src = positions[src]
+            _, dones, _, _, _ = env.step_games(games, act)
+            src += start
+            # the moves ending the game are wins of the player moving, the opponent losing in 0 plies
+            _aggregate(np.ones(int(dones.sum()), dtype=np.int64), src[dones], successors)
+            running = np.flatnonzero(~dones)
+            after = env.boards[running].reshape(len(running), index.n_squares)
+            n_attackers = (after == ATTACKER).sum(axis=1)
+            n_defenders = (after == DEFENDER).sum(axis=1)
+            opponents = env.players[running]
+            same = (n_attackers == index.n_attackers) & (n_defenders == index.n_defenders)
+            successors.edges.append((src[running[same]].astype(np.int32),
+                                     index.index(after[same], opponents[same]).astype(np.int32)))
+            for material in set(zip(n_attackers[~same].tolist(), n_defenders[~same].tolist())):
+                if material not in indices:
+                    indices[material] = MaterialIndex(index.n_rows, index.n_cols, *material)
+                captured = ~same & (n_attackers == material[0]) & (n_defenders == material[1])
+                after_values = tables[material][indices[material].index(after[captured], opponents[captured])]
+                _aggregate(after_values.astype(np.int64), src[running[captured]], successors)
+    return successors
+
+
+def _solve(successors: _Successors, values: np.ndarray) -> int:
+    """
+    Solve a table by retrograde iterations: the positions won in `d` plies are found at iteration `d`, from the positions
+    lost in `d - 1` plies, and the positions lost in `d` plies once all their moves are known to lose
+
+    :return: The number of iterations
+    """
+    sources = np.concatenate([s for s, _ in successors.edges] + [np.zeros(0, dtype=np.int32)])
+    targets = np.concatenate([t for _, t in successors.edges] + [np.zeros(0, dtype=np.int32)])
+    successors.edges.clear()
+    # positions without moves are lost
+    unsolved = (values != INVALID) & (successors.counts > 0)
+    values[(values != INVALID) & (successors.counts == 0)] = 1
+    distance = 1
+    last_external = max(int(successors.win[successors.win <= INVALID].max(initial=0)),
+                        int(successors.lost.max(initial=0)))
+    while distance <= MAX_DISTANCE:
+        # drop the edges of the solved positions
+        keep = unsolved[sources]
+        sources, targets = sources[keep], targets[keep]
+        target_values = values[targets]
+        win, not_lost, lost = successors.win.copy(), successors.not_lost.copy(), successors.lost.copy()
+        losing = (target_values % 2 == 1)
+        np.minimum.at(win, sources[losing], target_values[losing])
+        np.add.at(not_lost, sources[losing | (target_values == DRAW_VALUE)], 1)
+        winning = (target_values % 2 == 0) & (target_values != DRAW_VALUE)
+        np.maximum.at(lost, sources[winning], target_values[winning])
+        del target_values
+
+        won = unsolved & (win == distance)
+        # every move loses, through a successor solved before or the external ones
+        all_lost = unsolved & ~won & (not_lost == 0) & (lost == distance)
+        values[won] = distance + 1
+        values[all_lost] = distance + 1
+        unsolved &= ~(won | all_lost)
+        if not unsolved.any() or (not won.any() and not all_lost.any() and distance > last_external):
+            break
+        distance += 1
+    assert distance <= MAX_DISTANCE, f"[ERR: generate_tablebase] Distances beyond {MAX_DISTANCE} plies"
+    return distance
+
+
+def generate_tablebase(path: str, variant: str = 'custom', max_pieces: int = 3, batch_size: int = 65536) -> dict:
+    """
+    Generate the endgame tablebase of a variant: the exact value and distance to the end of the game with perfect play of
+    every position with up to `max_pieces` pieces, for both players to move. The move limit, the no capture counter and
+    the repetition of the last moves are not part of the positions: a position is a draw when neither player can force
+    a win, as the repetition ends the game in a draw.
+
+    The tables are solved from the smallest material, every capture leading to an already solved table. The successors
+    of the positions are played in batches through `TaflVecEnv`, so the tables follow the rules of the environment.
+
+    :param path: The directory of the tablebase, created if needed
+    :param variant: The variant name, or the path of a variant file
+    :param max_pieces: The maximum number of pieces on the board, the king included
+    :param batch_size: The number of positions and moves played at once
+    :return: The header of the tablebase
+    """
+    _check_rules(variant)
+    os.makedirs(path, exist_ok=True)
+    env = TaflVecEnv(batch_size, variant)
+    header = {'version': TABLEBASE_VERSION, 'variant': variant, 'max_pieces': max_pieces, 'tables': {}}
+    tables = {}
+    for n_attackers, n_defenders in table_materials(max_pieces):
+        name = table_name(n_attackers, n_defenders)
+        start = time.perf_counter()
+        index = MaterialIndex(env.n_rows, env.n_cols, n_attackers, n_defenders)
+        values = np.full(index.size, DRAW_VALUE, dtype=VALUE_DTYPE)
+        successors = _generate_successors(env, index, tables, values, batch_size)
+        iterations = _solve(successors, values)
+        np.save(os.path.join(path, name + TABLE_SUFFIX), values)
+        tables[(n_attackers, n_defenders)] = values
+        valid = values != INVALID
+        stats = {
+            'attackers': n_attackers,
+            'defenders': n_defenders,
+            'positions': int(valid.sum()),
+            'wins': int((valid & (values % 2 == 0) & (values != DRAW_VALUE)).sum()),
+            'losses': int((valid & (values % 2 == 1)).sum()),
+            'draws': int((values == DRAW_VALUE).sum()),
+            'max_distance': int(values[valid].max(initial=1)) - 1,
+        }
+        header['tables'][name] = stats
+        logger.info(f'{name}: {stats["positions"]} positions, {stats["wins"]} wins, {stats["losses"]} losses, '
+                    f'{stats["draws"]} draws, solved in {iterations} iterations and {time.perf_counter() - start:.1f}s')
+    with open(os.path.join(path, HEADER_FILE), 'w') as f:
+        json.dump(header, f, indent=2)
+    return header
@@ -0,0 +1,104 @@
+from itertools import combinations
+from math import comb
+from typing import Tuple
+
+import numpy as np
+
+from gym_tafl.envs.configs import *
+
+
+def table_name(n_attackers: int, n_defenders: int) -> str:
+    """
+    Get the name of the table of a material, e.g. `K2D1A` for the king, two defenders and an attacker
+    """
+    return f'K{n_defenders}D{n_attackers}A'
+
+
+class MaterialIndex:
+    """
+    Perfect index of the positions with a given material: the king square, the combination of the attackers squares,
+    the combination of the defenders squares and the player to move. The combinations are ranked in colexicographic
+    order, so the index is computed from the sorted squares with a table of binomial coefficients.
+
+    Some indices do not map to a position, when pieces overlap or a piece other than the king is on the throne; the
+    generator marks them as invalid.
+    """
+
+    def __init__(self, n_rows: int, n_cols: int, n_attackers: int, n_defenders: int):
+        """
+        :param n_rows: The number of rows of the board
+        :param n_cols: The number of cols of the board
+        :param n_attackers: The number of attackers
+        :param n_defenders: The number of defenders, the king excluded
+        """
+        self.n_rows, self.n_cols = n_rows, n_cols
+        self.n_attackers, self.n_defenders = n_attackers, n_defenders
+        self.n_squares = n_rows * n_cols
+        self.throne_sq = (n_rows // 2) * n_cols + n_cols // 2
+        self.n_attacker_sets = comb(self.n_squares, n_attackers)
+        self.n_defender_sets = comb(self.n_squares, n_defenders)
+        self.size = self.n_squares * self.n_attacker_sets * self.n_defender_sets * 2
+        k = max(n_attackers, n_defenders)
+        self.binomials = np.array([[comb(n, i) for i in range(k + 1)] for n in range(self.n_squares)], dtype=np.int64)
+        self.attacker_sets = self._sets(n_attackers)
+        self.defender_sets = self._sets(n_defenders)
+
+    def _sets(self, k: int) -> np.ndarray:
+        """
+        Get the `(comb(n_squares, k), k)` sorted square combinations, by rank
+        """
+        sets = np.array(list(combinations(range(self.n_squares), k)), dtype=np.int64)
+        sets = sets.reshape(comb(self.n_squares, k), k)
+        return sets[np.argsort(self._ranks(sets))]
+
+    def _ranks(self, squares: np.ndarray) -> np.ndarray:
+        return self.binomials[squares, np.arange(1, squares.shape[1] + 1)].sum(axis=1)
+
+    def index(self, boards: np.ndarray, players: np.ndarray) -> np.ndarray:
+        """
+        Index positions with the material of the table
+
+        :param boards: The `(m, rows, cols)` or `(m, rows * cols)` boards
+        :param players: The `(m,)` players to move
+        :return: The `(m,)` indices
+        """
+        flat = boards.reshape(len(boards), self.n_squares)
+        # the squares of each piece type in increasing order, as `nonzero` scans the boards row by row
+        king = np.argmax(flat == KING, axis=1)
+        attackers = np.nonzero(flat == ATTACKER)[1].reshape(len(flat), self.n_attackers)
+        defenders = np.nonzero(flat == DEFENDER)[1].reshape(len(flat), self.n_defenders)
+        index = (king * self.n_attacker_sets + self._ranks(attackers)) * self.n_defender_sets + self._ranks(defenders)
+        return index * 2 + (players == ATK)
+
+    def positions(self, start: int, stop: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Get the positions of a range of indices
+
+        :param start: The first index
+        :param stop: The index after the last one
+        :return: The `(m, rows * cols)` int8 boards, the `(m,)` players to move and the `(m,)` mask of the indices
+            mapping to a position
+        """
+        index = np.arange(start, stop, dtype=np.int64)
+        m = len(index)
+        players = np.where(index % 2 == 1, ATK, DEF).astype(np.int8)
+        rest = index // 2
+        defenders = self.defender_sets[rest % self.n_defender_sets]
+        rest //= self.n_defender_sets
+        attackers = self.attacker_sets[rest % self.n_attacker_sets]
+        king = rest // self.n_attacker_sets
+
+        rows = np.arange(m)[:, None]
+        occupancy = np.zeros((m, self.n_squares), dtype=np.int64)
+        np.add.at(occupancy, (rows, attackers), 1)
+        np.add.at(occupancy, (rows, defenders), 1)
+        valid = ~(occupancy[:, self.throne_sq] > 0)
+        occupancy[np.arange(m), king] += 1
+        valid &= (occupancy <= 1).all(axis=1)
+
+        boards = np.full((m, self.n_squares), EMPTY, dtype=np.int8)
+        boards[:, self.throne_sq] = THRONE
+        boards[rows, attackers] = ATTACKER
+        boards[rows, defenders] = DEFENDER
+        boards[np.arange(m), king] = KING
+        return boards, players, valid
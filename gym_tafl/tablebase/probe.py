@@ -0,0 +1,136 @@
+import json
+import os
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from gym_tafl.envs._engines import make_game_engine
+from gym_tafl.envs._rules import load_rules
+from gym_tafl.envs.configs import *
+from gym_tafl.tablebase.generator import *
+from gym_tafl.tablebase.indexing import MaterialIndex, table_name
+
+
+class TablebaseEntry(NamedTuple):
+    """
+    Exact result of a position with perfect play, ignoring the move limit and the no capture counter
+    """
+    winner: int
+    distance: int
+
+
+class Tablebase:
+    """
+    Endgame tablebase generated by `generate_tablebase`. The tables are memory mapped, so opening a tablebase is
+    immediate and only the probed pages are read.
+    """
+
+    def __init__(self, path: str, mmap: bool = True):
+        """
+        :param path: The directory of the tablebase
+        :param mmap: If True the tables are memory mapped, else they are read in memory
+        """
+        with open(os.path.join(path, HEADER_FILE)) as f:
+            header = json.load(f)
+        assert header['version'] == TABLEBASE_VERSION, \
+            f"[ERR: Tablebase] Tablebase version {header['version']} differs from version {TABLEBASE_VERSION}"
+        self.path = path
+        self.header = header
+        self.variant: str = header['variant']
+        self.max_pieces: int = header['max_pieces']
+        rules = load_rules(self.variant)
+        self.n_rows, self.n_cols = rules.n_rows, rules.n_cols
+        self._tables = {}
+        self._indices = {}
+        for n_attackers, n_defenders in table_materials(self.max_pieces):
+            name = table_name(n_attackers, n_defenders)
+            self._tables[(n_attackers, n_defenders)] = np.load(os.path.join(path, name + TABLE_SUFFIX),
+                                                               mmap_mode='r' if mmap else None)
+            self._indices[(n_attackers, n_defenders)] = MaterialIndex(self.n_rows, self.n_cols,
+                                                                      n_attackers, n_defenders)
+        self._engine = None
+
+    def covers(self, n_attackers: int, n_defenders: int) -> bool:
+        """
+        Check if the positions with a material are in the tablebase
+
+        :param n_attackers: The number of attackers
+        :param n_defenders: The number of defenders, the king excluded
+        :return: True if the material is in the tablebase
+        """
+        return (n_attackers, n_defenders) in self._tables
+
+    def probe_batch(self, boards: np.ndarray, players: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Probe positions
+
+        :param boards: The `(n, rows, cols)` boards
+        :param players: The `(n,)` players to move
+        :return: The `(n,)` mask of the positions in the tablebase, and their winners (ATK, DEF or DRAW) and distances
+            in plies to the end of the game, 0 for draws and for the positions not in the tablebase
+        """
+        flat = np.asarray(boards).reshape(len(boards), self.n_rows * self.n_cols)
+        players = np.asarray(players)
+        values = np.full(len(flat), INVALID, dtype=np.int64)
+        n_attackers, n_defenders = (flat == ATTACKER).sum(axis=1), (flat == DEFENDER).sum(axis=1)
+        king = (flat == KING).any(axis=1)
+        for material in set(zip(n_attackers.tolist(), n_defenders.tolist())):
+            if material not in self._tables:
+                continue
+            selected = np.flatnonzero(king & (n_attackers == material[0]) & (n_defenders == material[1]))
+            index = self._indices[material].index(flat[selected].astype(np.int8), players[selected])
+            values[selected] = self._tables[material][index]
+        found = values != INVALID
+        distances = np.where(found & (values != DRAW_VALUE), values - 1, 0)
+        opponents = np.where(players == DEF, ATK, DEF)
+        winners = np.where(values == DRAW_VALUE, DRAW, np.where(distances % 2 == 1, players, opponents))
+        return found, winners, distances
+
+    def probe(self, board: np.ndarray, player: int) -> Optional[TablebaseEntry]:
+        """
+        Probe a position
+
+        :param board: The board
+        :param player: The player to move
+        :return: The winner (ATK, DEF or DRAW) and the distance in plies to the end of the game with perfect play, None if
+            the position is not in the tablebase
+        """
+        found, winners, distances = self.probe_batch(board[None], np.array([player]))
+        if not found[0]:
+            return None
+        return TablebaseEntry(int(winners[0]), int(distances[0]))
+
+    def best_action(self, board: np.ndarray, player: int) -> Optional[int]:
+        """
+        Find an action reaching the result of the position with perfect play: the fastest win, a draw, or the slowest
+        loss
+
+        :param board: The board
+        :param player: The player to move
+        :return: The action, None if the position is not in the tablebase or the player has no legal moves
+        """
+        if self.probe(board, player) is None:
+            return None
+        if self._engine is None:
+            self._engine = make_game_engine(self.variant)
+        engine = self._engine
+        board = np.array(board)
+        engine.sync(board, player)
+        opponent = ATK if player == DEF else DEF
+        best_action, best_score = None, None
+        for action in engine.legal_moves(board, player):
+            undo, game_over = engine.make_move(board, engine.action_moves[action])
+            if game_over or not engine.legal_moves(board, opponent):
+                score = (2, -1)
+            else:
+                entry = self.probe(board, opponent)
+                if entry.winner == DRAW:
+                    score = (1, 0)
+                elif entry.winner == player:
+                    score = (2, -entry.distance - 1)
+                else:
+                    score = (0, entry.distance + 1)
+            engine.unmake_move(board, undo)
+            if best_score is None or score > best_score:
+                best_action, best_score = action, score
+        return best_action
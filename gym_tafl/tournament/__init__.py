@@ -0,0 +1 @@
+from gym_tafl.tournament.runner import Policy, RandomPolicy, Tournament, TournamentResult, round_robin
@@ -0,0 +1,40 @@
+import argparse
+import sys
+from typing import List
+
+import numpy as np
+
+from gym_tafl.tournament.runner import RandomPolicy, Tournament
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m gym_tafl.tournament',
+                                     description='Play a round robin tournament between random policies, measuring '
+                                                 'the throughput of the tournament runner')
+    parser.add_argument('--variant', default='tablut', help='variant name or variant file')
+    parser.add_argument('--attackers', type=int, default=4, help='number of attackers')
+    parser.add_argument('--defenders', type=int, default=4, help='number of defenders')
+    parser.add_argument('--games', type=int, default=20, help='games of each pairing')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, 0 to play in this process')
+    parser.add_argument('--games-per-worker', type=int, default=64, help='games played at once by each worker')
+    parser.add_argument('--no-early-stop', action='store_true', help='play all the games of the settled pairings')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first policy')
+    args = parser.parse_args(argv)
+
+    tournament = Tournament([RandomPolicy(args.seed + a) for a in range(args.attackers)],
+                            [RandomPolicy(args.seed + args.attackers + d) for d in range(args.defenders)],
+                            variant=args.variant, num_workers=args.workers, games_per_worker=args.games_per_worker,
+                            z=None if args.no_early_stop else 2.576)
+    result = tournament.run(n_games=args.games)
+    with np.printoptions(precision=2, suppress=True):
+        print('attackers scores (rows) against defenders (columns):')
+        print(result.scores)
+    stats = result.stats
+    print(f"{stats['games']} games ({stats['skipped_games']} skipped), {stats['plies']} plies in "
+          f"{stats['elapsed']:.2f}s: {stats['games_per_second']:.1f} games/s, {stats['plies_per_second']:.0f} plies/s, "
+          f"mean policy batch {stats['mean_policy_batch']:.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,439 @@
+import ctypes
+import math
+import multiprocessing as mp
+import os
+import queue
+import time
+import traceback
+from collections import deque
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from gym_tafl.envs.configs import *
+from gym_tafl.envs.tafl_vec_env import TaflVecEnv
+
+# batched policy: (boards (B, rows, cols), players (B,), legal action masks (B, n_actions)) -> actions (B,)
+# the stochastic policies define `seed_worker(worker)`, called with the worker index on the copy of each worker process
+Policy = Callable[[np.ndarray, np.ndarray, np.ndarray], np.ndarray]
+
+
+class RandomPolicy:
+    """
+    Policy playing uniformly random legal actions, picklable so it can be sent to the worker processes
+    """
+
+    def __init__(self, seed: int = None):
+        """
+        :param seed: The seed of the random generator
+        """
+        self.seed = seed
+        self.np_random = np.random.default_rng(seed)
+
+    def seed_worker(self, worker: int):
+        """
+        Derive an independent random generator for the copy of the policy of a worker process, so that the workers do
+        not play the same games
+
+        :param worker: The worker index
+        """
+        self.np_random = np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=(worker,)))
+
+    def __call__(self, boards: np.ndarray, players: np.ndarray, masks: np.ndarray) -> np.ndarray:
+        return np.argmax(self.np_random.random(masks.shape) * masks, axis=1)
+
+
+def round_robin(n_attackers: int, n_defenders: int, n_games: int) -> List[Tuple[int, int, int]]:
+    """
+    Make the schedule where every attacker plays every defender
+
+    :param n_attackers: The number of attackers
+    :param n_defenders: The number of defenders
+    :param n_games: The number of games of each pairing
+    :return: The (attacker, defender, games) pairings
+    """
+    return [(a, d, n_games) for a in range(n_attackers) for d in range(n_defenders)]
+
+
+class TournamentResult:
+    """
+    Results of a tournament, as `(n_attackers, n_defenders)` matrices from the attackers point of view
+    """
+
+    def __init__(self, wins: np.ndarray, draws: np.ndarray, losses: np.ndarray, plies: np.ndarray,
+                 settled: np.ndarray, stats: dict):
+        self.wins = wins
+        self.draws = draws
+        self.losses = losses
+        self.plies = plies
+        self.settled = settled
+        self.stats = stats
+
+    @property
+    def games(self) -> np.ndarray:
+        """
+        The games played by each pairing
+        """
+        return self.wins + self.draws + self.losses
+
+    @property
+    def scores(self) -> np.ndarray:
+        """
+        The attackers scores, a win counting 1 and a draw 0.5, NaN for the pairings with no games
+        """
+        games = self.games
+        return np.divide(self.wins + 0.5 * self.draws, games, out=np.full(games.shape, np.nan), where=games > 0)
+
+    @property
+    def mean_plies(self) -> np.ndarray:
+        """
+        The mean length of the games of each pairing, NaN for the pairings with no games
+        """
+        games = self.games
+        return np.divide(self.plies, games, out=np.full(games.shape, np.nan), where=games > 0)
+
+    def __repr__(self) -> str:
+        return (f"TournamentResult(games={int(self.games.sum())}, settled={int(self.settled.sum())}, "
+                f"elapsed={self.stats['elapsed']:.3f}s, games/s={self.stats['games_per_second']:.1f})")
+
+
+class _Tally:
+    """
+    Results of the scheduled pairings, deciding when a pairing is statistically settled
+    """
+
+    def __init__(self, pairings: np.ndarray, n_games: np.ndarray, settled: np.ndarray, min_games: int,
+                 z: Optional[float], margin: float):
+        self.pairings = pairings
+        self.settled = settled
+        self.min_games = min_games
+        self.z = z
+        self.margin = margin
+        n = len(pairings)
+        self.wins = np.zeros(n, dtype=np.int64)
+        self.draws = np.zeros(n, dtype=np.int64)
+        self.losses = np.zeros(n, dtype=np.int64)
+        self.plies = np.zeros(n, dtype=np.int64)
+        self.skipped = np.zeros(n, dtype=np.int64)
+        self.pending = int(n_games.sum())
+
+    def record(self, games: List[Tuple[int, int, int]], skipped: List[Tuple[int, int]]):
+        """
+        Record finished and skipped games
+
+        :param games: The (pairing, winner, plies) finished games
+        :param skipped: The (pairing, games) games not played or abandoned because their pairing was settled
+        """
+        for p, winner, plies in games:
+            if winner == ATK:
+                self.wins[p] += 1
+            elif winner == DEF:
+                self.losses[p] += 1
+            else:
+                self.draws[p] += 1
+            self.plies[p] += plies
+        for p, n in skipped:
+            self.skipped[p] += n
+        self.pending -= len(games) + sum(n for _, n in skipped)
+        if self.z is not None:
+            for p in {p for p, _, _ in games}:
+                if not self.settled[p] and self._is_settled(p):
+                    self.settled[p] = True
+
+    def _is_settled(self, p: int) -> bool:
+        """
+        Check if the attacker score of a pairing is known: either its confidence interval excludes 0.5, so the better
+        side is known, or it is narrower than the margin
+        """
+        n = self.wins[p] + self.draws[p] + self.losses[p]
+        if n < self.min_games:
+            return False
+        mean = (self.wins[p] + 0.5 * self.draws[p]) / n
+        variance = max((self.wins[p] + 0.25 * self.draws[p]) / n - mean ** 2, 0.)
+        half_width = self.z * math.sqrt(variance / n)
+        return half_width < self.margin or abs(mean - 0.5) > half_width
+
+
+def _play_games(variant: str,
+                attackers: Sequence[Policy],
+                defenders: Sequence[Policy],
+                pairings: np.ndarray,
+                num_games: int,
+                next_task: Callable[[bool], Optional[tuple]],
+                report: Callable[[list, list], None],
+                settled: np.ndarray) -> dict:
+    """
+    Play the games of the tasks of a queue, `num_games` at a time in a `TaflVecEnv`, querying each policy once per ply
+    with all the games it plays in
+
+    :param next_task: Get the next (pairing, games) task, blocking or not; None if there is no task available, `()` if
+        the queue is over
+    :param report: Report the finished and skipped games, see `_Tally.record`
+    :param settled: The settled flags of the pairings, the games of the settled pairings are skipped or abandoned
+    :return: The timing statistics
+    """
+    env = TaflVecEnv(num_games, variant)
+    env.reset()
+    slot_pairings = np.full(num_games, -1, dtype=np.int64)
+    slot_plies = np.zeros(num_games, dtype=np.int64)
+    backlog = deque()
+    over = False
+    stats = {'policy_time': 0., 'policy_calls': 0, 'policy_positions': 0, 'env_time': 0., 'steps': 0, 'games': 0}
+    while True:
+        games, skipped = [], []
+        # abandon the games of the pairings settled meanwhile, and fill the free slots
+        abandoned = np.flatnonzero((slot_pairings >= 0) & settled[np.maximum(slot_pairings, 0)])
+        if len(abandoned) > 0:
+            skipped.extend((int(p), 1) for p in slot_pairings[abandoned])
+            slot_pairings[abandoned] = -1
+            env.reset_games(abandoned)
+        free = np.flatnonzero(slot_pairings < 0).tolist()
+        while free:
+            if not backlog:
+                if over:
+                    break
+                task = next_task(len(free) == num_games)
+                if task is None:
+                    break
+                if task == ():
+                    over = True
+                    continue
+                backlog.append(list(task))
+            p, n = backlog[0]
+            if settled[p]:
+                skipped.append((p, n))
+                backlog.popleft()
+                continue
+            k = min(n, len(free))
+            slots, free = free[:k], free[k:]
+            slot_pairings[slots] = p
+            slot_plies[slots] = 0
+            if k == n:
+                backlog.popleft()
+            else:
+                backlog[0][1] -= k
+        if skipped:
+            report([], skipped)
+        active = np.flatnonzero(slot_pairings >= 0)
+        if len(active) == 0:
+            if over and not backlog:
+                return stats
+            continue
+
+        # one policy call per policy and side
+        actions = np.empty(len(active), dtype=np.int64)
+        players = env.players[active]
+        for side, policies, column in ((ATK, attackers, 0), (DEF, defenders, 1)):
+            rows = np.flatnonzero(players == side)
+            owners = pairings[slot_pairings[active[rows]], column]
+            for owner in np.unique(owners).tolist():
+                selected = rows[owners == owner]
+                slots = active[selected]
+                start = time.perf_counter()
+                actions[selected] = policies[owner](env.boards[slots], env.players[slots], env.action_masks[slots])
+                stats['policy_time'] += time.perf_counter() - start
+                stats['policy_calls'] += 1
+                stats['policy_positions'] += len(slots)
+
+        start = time.perf_counter()
+        _, dones, winners, _, _ = env.step_games(active, actions)
+        stats['env_time'] += time.perf_counter() - start
+        stats['steps'] += len(active)
+        slot_plies[active] += 1
+        for i in np.flatnonzero(dones).tolist():
+            slot = active[i]
+            games.append((int(slot_pairings[slot]), int(winners[i]), int(slot_plies[slot])))
+            slot_pairings[slot] = -1
+        stats['games'] += len(games)
+        if games:
+            report(games, [])
+
+
+def _worker(worker: int, tasks, results, settled_buffer, n_pairings: int, variant: str, attackers: Sequence[Policy],
+            defenders: Sequence[Policy], pairings: np.ndarray, num_games: int):
+    """
+    Play games in a worker process, taking the tasks from the shared queue when it has free game slots
+    """
+    for policy in {id(policy): policy for policy in (*attackers, *defenders)}.values():
+        if hasattr(policy, 'seed_worker'):
+            policy.seed_worker(worker)
+    settled = np.frombuffer(settled_buffer, dtype=np.bool_, count=n_pairings)
+
+    def next_task(block: bool) -> Optional[tuple]:
+        try:
+            task = tasks.get(block=block)
+        except queue.Empty:
+            return None
+        return () if task is None else task
+
+    try:
+        stats = _play_games(variant, attackers, defenders, pairings, num_games, next_task,
+                            lambda games, skipped: results.put(('results', games, skipped)), settled)
+        results.put(('stats', stats))
+    except KeyboardInterrupt:
+        pass
+    except Exception:
+        results.put(('error', traceback.format_exc()))
+
+
+class Tournament:
+    """
+    Tournament between a population of attackers and a population of defenders, following a schedule of pairings.
+
+    The games are played by worker processes, each stepping up to `games_per_worker` games at once in a `TaflVecEnv`
+    and querying each policy once per ply with the boards of all the games it plays in. The pairings are split in
+    chunks of games on a shared queue, interleaved between the pairings: a worker takes a new chunk as soon as it has
+    free game slots, so the fast workers take over the work the slow ones have not started.
+
+    The results are gathered by the main process while the games are played. With `z` set, a pairing is settled once it
+    has `min_games` games and the `z` confidence interval of the attacker score either excludes 0.5 or is narrower than
+    `margin`: its remaining games are skipped, and its running games abandoned.
+    """
+
+    def __init__(self,
+                 attackers: Sequence[Policy],
+                 defenders: Sequence[Policy],
+                 variant: str = 'tablut',
+                 num_workers: int = None,
+                 games_per_worker: int = 64,
+                 chunk_size: int = 4,
+                 min_games: int = 10,
+                 z: Optional[float] = 2.576,
+                 margin: float = 0.05,
+                 context: str = None):
+        """
+        :param attackers: The attackers policies, see `Policy`
+        :param defenders: The defenders policies
+        :param variant: The variant played
+        :param num_workers: The number of worker processes, by default one per core; 0 plays the games in this process
+        :param games_per_worker: The number of games played at once by each worker
+        :param chunk_size: The number of games of a pairing taken at once by a worker
+        :param min_games: The minimum number of games before a pairing can be settled
+        :param z: The z-score of the confidence intervals of the scores, if None the pairings are never settled early
+        :param margin: The half width of a confidence interval settling a pairing
+        :param context: The multiprocessing start method, the platform default if None
+        """
+        assert games_per_worker >= 1 and chunk_size >= 1, \
+            f"[ERR: Tournament] Invalid games per worker {games_per_worker} or chunk size {chunk_size}"
+        self.attackers = list(attackers)
+        self.defenders = list(defenders)
+        self.variant = variant
+        self.num_workers = (os.cpu_count() or 1) if num_workers is None else num_workers
+        self.games_per_worker = games_per_worker
+        self.chunk_size = chunk_size
+        self.min_games = min_games
+        self.z = z
+        self.margin = margin
+        self.context = context
+
+    def _tasks(self, n_games: np.ndarray) -> List[Tuple[int, int]]:
+        """
+        Split the games of the pairings in chunks, interleaving the pairings
+        """
+        tasks = []
+        for start in range(0, int(n_games.max(initial=0)), self.chunk_size):
+            for p, n in enumerate(n_games.tolist()):
+                if start < n:
+                    tasks.append((p, min(self.chunk_size, n - start)))
+        return tasks
+
+    def run(self, schedule: Sequence[Tuple[int, ...]] = None, n_games: int = 20) -> TournamentResult:
+        """
+        Play the tournament
+
+        :param schedule: The (attacker, defender) or (attacker, defender, games) pairings, the games of a repeated
+            pairing are added up; if None every attacker plays every defender
+        :param n_games: The number of games of the pairings without one
+        :return: The results and the timing statistics
+        """
+        if schedule is None:
+            schedule = round_robin(len(self.attackers), len(self.defenders), n_games)
+        games_of: Dict[Tuple[int, int], int] = {}
+        for entry in schedule:
+            a, d = entry[:2]
+            assert 0 <= a < len(self.attackers) and 0 <= d < len(self.defenders), \
+                f"[ERR: Tournament] Invalid pairing {entry}"
+            games_of[(a, d)] = games_of.get((a, d), 0) + (entry[2] if len(entry) > 2 else n_games)
+        pairings = np.array(list(games_of.keys()), dtype=np.int64).reshape(len(games_of), 2)
+        counts = np.array(list(games_of.values()), dtype=np.int64)
+        tasks = self._tasks(counts)
+
+        start = time.perf_counter()
+        if self.num_workers == 0:
+            settled = np.zeros(len(pairings), dtype=bool)
+            tally = _Tally(pairings, counts, settled, self.min_games, self.z, self.margin)
+            pending = deque(tasks)
+            worker_stats = [_play_games(self.variant, self.attackers, self.defenders, pairings,
+                                        self.games_per_worker, lambda block: pending.popleft() if pending else (),
+                                        tally.record, settled)]
+        else:
+            tally, worker_stats = self._run_workers(pairings, counts, tasks)
+        elapsed = time.perf_counter() - start
+        assert tally.pending == 0, f"[ERR: Tournament] {tally.pending} games were not played"
+        return self._result(tally, worker_stats, elapsed)
+
+    def _run_workers(self, pairings: np.ndarray, counts: np.ndarray, tasks: List[Tuple[int, int]]):
+        ctx = mp.get_context(self.context)
+        num_workers = max(min(self.num_workers, len(tasks)), 1)
+        settled_buffer = ctx.RawArray(ctypes.c_bool, max(len(pairings), 1))
+        settled = np.frombuffer(settled_buffer, dtype=np.bool_, count=len(pairings))
+        tally = _Tally(pairings, counts, settled, self.min_games, self.z, self.margin)
+        task_queue, results = ctx.Queue(), ctx.Queue()
+        for task in tasks:
+            task_queue.put(task)
+        for _ in range(num_workers):
+            task_queue.put(None)
+        processes = [ctx.Process(target=_worker,
+                                 args=(worker, task_queue, results, settled_buffer, len(pairings), self.variant,
+                                       self.attackers, self.defenders, pairings, self.games_per_worker),
+                                 daemon=True)
+                     for worker in range(num_workers)]
+        for process in processes:
+            process.start()
+        worker_stats = []
+        try:
+            while len(worker_stats) < num_workers:
+                try:
+                    message = results.get(timeout=1.)
+                except queue.Empty:
+                    if any(not p.is_alive() and p.exitcode != 0 for p in processes):
+                        raise RuntimeError("[ERR: Tournament] A worker process died")
+                    continue
+                if message[0] == 'results':
+                    tally.record(message[1], message[2])
+                elif message[0] == 'stats':
+                    worker_stats.append(message[1])
+                else:
+                    raise RuntimeError(f"[ERR: Tournament] Worker failed:\n{message[1]}")
+        finally:
+            for process in processes:
+                if len(worker_stats) < num_workers:
+                    process.terminate()
+                process.join()
+        return tally, worker_stats
+
+    def _result(self, tally: _Tally, worker_stats: List[dict], elapsed: float) -> TournamentResult:
+        shape = (len(self.attackers), len(self.defenders))
+        matrices = [np.zeros(shape, dtype=np.int64) for _ in range(4)]
+        for matrix, values in zip(matrices, (tally.wins, tally.draws, tally.losses, tally.plies)):
+            np.add.at(matrix, (tally.pairings[:, 0], tally.pairings[:, 1]), values)
+        settled = np.zeros(shape, dtype=bool)
+        settled[tally.pairings[:, 0], tally.pairings[:, 1]] = tally.settled
+        games = int(sum(s['games'] for s in worker_stats))
+        steps = int(sum(s['steps'] for s in worker_stats))
+        policy_calls = sum(s['policy_calls'] for s in worker_stats)
+        stats = {
+            'elapsed': elapsed,
+            'workers': len(worker_stats),
+            'games': games,
+            'skipped_games': int(tally.skipped.sum()),
+            'plies': steps,
+            'games_per_second': games / elapsed if elapsed > 0 else 0.,
+            'plies_per_second': steps / elapsed if elapsed > 0 else 0.,
+            'policy_time': sum(s['policy_time'] for s in worker_stats),
+            'env_time': sum(s['env_time'] for s in worker_stats),
+            'policy_calls': policy_calls,
+            'mean_policy_batch': sum(s['policy_positions'] for s in worker_stats) / policy_calls if policy_calls else 0.,
+            'worker_stats': worker_stats
+        }
+        return TournamentResult(*matrices, settled, stats)